@@ -32,19 +32,25 @@ async def run_demo():
     print("\nStarting conversation demo...")
     print("=" * 50)
     
-    for i, prompt in enumerate(prompts, 1):
-        print(f"\nPrompt {i}: {prompt}")
-        
-        # Get LLM response
-        start_time = time.time()
-        response = await llm_client.generate(prompt)
-        llm_time = time.time() - start_time
+    # Generate all responses concurrently, in prompt order
+    batch_start = time.time()
+    async for index, response in llm_client.generate_many(prompts, ordered=True):
+        i = index + 1
+        # Responses arrive together, so time since the batch started is not this response's time
+        elapsed = time.time() - batch_start
+        print(f"\nPrompt {i}: {prompts[index]}")
         
         if response.error:
             print(f"Error: {response.error}")
             continue
-            
-        print(f"Response ({llm_time:.2f}s): {response.text}")
+        
+        if response.cached:
+            timing = "cached"
+        elif "total_duration" in response.metrics:
+            timing = f"generated in {response.metrics['total_duration']:.2f}s"
+        else:
+            timing = "generation time unknown"
+        print(f"Response ({timing}, {elapsed:.2f}s elapsed): {response.text}")
         
         # Generate speech
         start_time = time.time()
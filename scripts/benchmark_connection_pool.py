@@ -0,0 +1,88 @@
+"""Benchmark connection reuse of the pooled LLM client against a fresh client per request."""
+
+import asyncio
+import statistics
+import time
+from typing import Any, Dict, List
+import httpx
+from src.config import Config
+from src.llm import LLMClient
+
+class ConnectionCounter:
+    """Counts new TCP connections opened by httpx via the trace extension."""
+
+    def __init__(self) -> None:
+        self.connections = 0
+
+    async def trace(self, event_name: str, info: Dict[str, Any]) -> None:
+        """Trace callback invoked by httpcore for every connection event."""
+        if event_name == "connection.connect_tcp.complete":
+            self.connections += 1
+
+async def run_per_call_clients(url: str, requests: int) -> Dict[str, Any]:
+    """Issue requests with a new AsyncClient each time (the previous behaviour).
+
+    Args:
+        url: Endpoint to request
+        requests: Number of requests to send
+
+    Returns:
+        Latency and connection statistics
+    """
+    counter = ConnectionCounter()
+    latencies: List[float] = []
+    for _ in range(requests):
+        start_time = time.perf_counter()
+        async with httpx.AsyncClient(timeout=30.0) as client:
+            await client.get(url, extensions={"trace": counter.trace})
+        latencies.append(time.perf_counter() - start_time)
+    return {"latencies": latencies, "connections": counter.connections}
+
+async def run_pooled_client(client: LLMClient, url: str, requests: int) -> Dict[str, Any]:
+    """Issue requests through the LLM client's shared connection pool.
+
+    Args:
+        client: LLM client owning the pool
+        url: Endpoint to request
+        requests: Number of requests to send
+
+    Returns:
+        Latency and connection statistics
+    """
+    counter = ConnectionCounter()
+    latencies: List[float] = []
+    for _ in range(requests):
+        start_time = time.perf_counter()
+        await client.http_client.get(url, extensions={"trace": counter.trace})
+        latencies.append(time.perf_counter() - start_time)
+    return {"latencies": latencies, "connections": counter.connections}
+
+def print_summary(name: str, result: Dict[str, Any]) -> None:
+    """Print latency and connection statistics for one run."""
+    latencies_ms = [latency * 1000 for latency in result["latencies"]]
+    print(f"{name}:")
+    print(f"  TCP connections opened: {result['connections']}")
+    print(f"  Mean latency: {statistics.mean(latencies_ms):.2f} ms")
+    print(f"  Median latency: {statistics.median(latencies_ms):.2f} ms")
+    print(f"  Max latency: {max(latencies_ms):.2f} ms")
+
+async def main(requests: int = 50) -> None:
+    """Run the connection pool benchmark against the configured Ollama server."""
+    config = Config.load()
+    client = LLMClient(config.llm)
+    # /api/tags is cheap, so the timings are dominated by connection overhead
+    url = f"{client.base_url}/api/tags"
+
+    try:
+        print(f"Sending {requests} sequential requests to {url}")
+        print("-" * 50)
+        print_summary("New client per request", await run_per_call_clients(url, requests))
+        print_summary("Pooled LLMClient", await run_pooled_client(client, url, requests))
+        print("-" * 50)
+    except httpx.ConnectError:
+        print(f"Could not connect to {client.base_url}, is Ollama running?")
+    finally:
+        await client.aclose()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -28,9 +28,8 @@ async def run_benchmark_tests(
     """
     results = []
     
-    for prompt in prompts:
-        response = await client.generate(prompt)
-        
+    async for index, response in client.generate_many(prompts, ordered=True):
+        prompt = prompts[index]
         if response.error:
             print(f"Error with prompt '{prompt[:50]}...': {response.error}")
             continue
@@ -41,6 +40,8 @@ async def run_benchmark_tests(
             "response_length": len(response.text),
             "memory_increase_mb": response.metrics["memory_increase_mb"],
             "cpu_percent": response.metrics["end_metrics"]["cpu_percent"],
+            "tokens_per_second": response.metrics.get("tokens_per_second"),
+            "model_time_to_first_token": response.metrics.get("model_time_to_first_token"),
             "model": response.metrics["model"]
         }
         results.append(result)
@@ -0,0 +1,129 @@
+"""Benchmark decoding of a recorded Ollama stream with the incremental NDJSON decoder."""
+
+import argparse
+import codecs
+import json
+import random
+import statistics
+import time
+from pathlib import Path
+from typing import Callable, List, Optional
+from src import ndjson
+from src.ndjson import NDJSONDecoder
+
+def record_stream(tokens: int = 10_000, seed: int = 0) -> bytes:
+    """Build an Ollama /api/generate response body with the given number of tokens.
+
+    Args:
+        tokens: Number of token chunks in the stream
+        seed: Seed so every run decodes the same stream
+
+    Returns:
+        The NDJSON response body
+    """
+    rng = random.Random(seed)
+    words = ["the", "model", "streams", "tokens", "quickly", "and", "café", "response", "of", "a"]
+    lines = []
+    for _ in range(tokens):
+        lines.append(json.dumps({
+            "model": "phi",
+            "created_at": "2024-01-01T00:00:00.000000Z",
+            "response": " " + rng.choice(words),
+            "done": False
+        }, ensure_ascii=False))
+    lines.append(json.dumps({
+        "model": "phi",
+        "created_at": "2024-01-01T00:00:00.000000Z",
+        "response": "",
+        "done": True,
+        "context": list(range(tokens)),
+        "eval_count": tokens
+    }))
+    return ("\n".join(lines) + "\n").encode()
+
+def split_chunks(body: bytes, seed: int = 0) -> List[bytes]:
+    """Split a body into network-sized chunks that do not line up with lines."""
+    rng = random.Random(seed)
+    chunks = []
+    start = 0
+    while start < len(body):
+        size = rng.randint(512, 4096)
+        chunks.append(body[start:start + size])
+        start += size
+    return chunks
+
+def decode_lines(chunks: List[bytes]) -> str:
+    """The previous approach: decode to text, split lines, json.loads and += each token."""
+    text = ""
+    buffer = ""
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    for chunk in chunks:
+        buffer += utf8.decode(chunk)
+        *lines, buffer = buffer.split("\n")
+        for line in lines:
+            if not line:
+                continue
+            data = json.loads(line)
+            if data.get("response"):
+                text += data["response"]
+    return text
+
+def decode_incremental(chunks: List[bytes]) -> str:
+    """The new approach: decode bytes incrementally and join the tokens once."""
+    decoder = NDJSONDecoder()
+    parts = []
+    for chunk in chunks:
+        for data in decoder.feed(chunk):
+            if data.get("response"):
+                parts.append(data["response"])
+    return "".join(parts)
+
+def time_decoder(decode: Callable[[List[bytes]], str], chunks: List[bytes], repeat: int) -> List[float]:
+    """Time repeated decodes of the same chunks."""
+    timings = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        decode(chunks)
+        timings.append(time.perf_counter() - start_time)
+    return timings
+
+def print_summary(name: str, timings: List[float], tokens: int) -> None:
+    """Print decode time and throughput for one decoder."""
+    median = statistics.median(timings)
+    print(f"{name}:")
+    print(f"  Median decode time: {median * 1000:.2f} ms")
+    print(f"  Throughput: {tokens / median:,.0f} tokens/s")
+
+def main(tokens: int = 10_000, repeat: int = 20, stream_file: Optional[str] = None) -> None:
+    """Compare the line-based and incremental decoders on the same stream."""
+    if stream_file:
+        body = Path(stream_file).read_bytes()
+        tokens = body.count(b"\n")
+    else:
+        body = record_stream(tokens)
+    chunks = split_chunks(body)
+
+    print(f"Decoding {tokens} tokens ({len(body) / 1024:.0f} KiB in {len(chunks)} chunks), {repeat} runs each")
+    print("-" * 50)
+    assert decode_lines(chunks) == decode_incremental(chunks)
+    print_summary("Line splitting + json.loads + str +=", time_decoder(decode_lines, chunks, repeat), tokens)
+    print_summary(
+        f"NDJSONDecoder ({'orjson' if ndjson.ORJSON_AVAILABLE else 'json'})",
+        time_decoder(decode_incremental, chunks, repeat),
+        tokens
+    )
+    if ndjson.ORJSON_AVAILABLE:
+        ndjson.ORJSON_AVAILABLE = False
+        try:
+            print_summary("NDJSONDecoder (json)", time_decoder(decode_incremental, chunks, repeat), tokens)
+        finally:
+            ndjson.ORJSON_AVAILABLE = True
+    print("-" * 50)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tokens", type=int, default=10_000, help="Tokens in the generated stream")
+    parser.add_argument("--repeat", type=int, default=20, help="Decodes per decoder")
+    parser.add_argument("--stream-file", help="Captured /api/generate response body to decode instead")
+    args = parser.parse_args()
+    main(args.tokens, args.repeat, args.stream_file)
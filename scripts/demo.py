@@ -9,7 +9,7 @@ import json
 import matplotlib.pyplot as plt
 import pandas as pd
 from src.config import Config
-from src.llm import LLMClient
+from src.llm import LLMClient, StreamError
 from src.benchmarks import PerformanceMetrics
 
 # Configure logging
@@ -57,7 +57,7 @@ async def demo_streaming_response(client: LLMClient) -> None:
     logger.info("Assistant: ", end="")
     
     async for chunk in client.generate_stream(prompt):
-        if chunk.startswith("Error:"):
+        if isinstance(chunk, StreamError):
             logger.error(chunk)
             break
         print(chunk, end="", flush=True)
@@ -74,8 +74,12 @@ async def demo_model_switching(client: LLMClient) -> None:
     prompt = "What is the meaning of life?"
     models = ["mistral", "phi"]
     
+    # Load both models up front so neither switch waits on a cold load
+    await client.preload(models)
+    logger.info(f"Hot models: {client.residency.hot_models()}")
+    
     for model in models:
-        client.set_model(model)
+        await client.switch_model(model)
         logger.info(f"\nUsing model: {model}")
         logger.info(f"User: {prompt}")
         
@@ -181,6 +185,9 @@ async def main() -> None:
     client = LLMClient(config.llm)
     
     try:
+        # Preload the configured models, as the API does on startup
+        await client.start()
+        
         # Basic conversation
         await demo_basic_conversation(client)
         
@@ -199,6 +206,8 @@ async def main() -> None:
     except Exception as e:
         logger.error(f"Error running demo: {e}")
         raise
+    finally:
+        await client.aclose()
 
 if __name__ == "__main__":
     asyncio.run(main()) 
\ No newline at end of file
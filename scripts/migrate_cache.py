@@ -0,0 +1,23 @@
+"""Import the JSON file cache into the SQLite cache backend."""
+
+import argparse
+from src.cache_backends import FileCacheBackend, SQLiteCacheBackend, migrate_cache
+
+def main() -> None:
+    """Copy every output/cache/*.json entry into a SQLite database."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--cache-dir", default="output/cache", help="Directory of JSON cache files")
+    parser.add_argument("--db-path", default="output/cache.db", help="SQLite database to import into")
+    args = parser.parse_args()
+    
+    source = FileCacheBackend(args.cache_dir)
+    target = SQLiteCacheBackend(args.db_path)
+    try:
+        migrated = migrate_cache(source, target)
+    finally:
+        target.close()
+    
+    print(f"Migrated {migrated} cache entries from {args.cache_dir} to {args.db_path}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""Admission control so traffic spikes queue briefly or fail fast instead of piling up on the LLM."""
+
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
+import logging
+import time
+from typing import Any, AsyncIterator, Deque, Dict, Optional, Tuple
+from src.benchmarks import PerformanceMetrics
+from src.config import AdmissionConfig
+
+class AdmissionRejected(Exception):
+    """Raised when a request is not admitted.
+
+    ``status_code`` is 429 when the wait queue is full and 503 when the
+    request could not start before its deadline.
+    """
+
+    def __init__(self, message: str, status_code: int, retry_after: float):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+class _ModelQueue:
+    """Concurrency slots and waiting requests for one model."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.active = 0
+        # Waiters in arrival order with their absolute deadlines
+        self.waiters: Deque[Tuple[asyncio.Future, float]] = deque()
+        self.service_time: Optional[float] = None  # Smoothed seconds a request holds a slot
+
+class AdmissionController:
+    """Limits concurrent LLM requests per model with a bounded, deadline-aware queue.
+
+    A request starts immediately while its model has a free slot. Otherwise it
+    waits in a FIFO queue. Requests are rejected straight away when the queue
+    is full (429) or when the expected wait already exceeds their deadline
+    (503), and they are dropped from the queue once their deadline passes
+    (503), so nothing is started that the caller has already given up on.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 4,
+        max_queue: int = 32,
+        queue_timeout: float = 10.0,
+        model_concurrency: Optional[Dict[str, int]] = None,
+        service_time_smoothing: float = 0.2
+    ):
+        """Initialize the controller.
+
+        Args:
+            max_concurrency: Concurrent requests per model unless overridden
+            max_queue: Requests allowed to wait per model
+            queue_timeout: Default seconds a request may wait for a slot
+            model_concurrency: Per-model overrides of max_concurrency
+            service_time_smoothing: Weight of the newest sample in the service time average
+        """
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.model_concurrency = model_concurrency or {}
+        self.service_time_smoothing = service_time_smoothing
+        self.logger = logging.getLogger(__name__)
+        self._queues: Dict[str, _ModelQueue] = {}
+
+    @classmethod
+    def from_config(cls, config: AdmissionConfig) -> "AdmissionController":
+        """Create a controller from the admission configuration."""
+        return cls(
+            max_concurrency=config.max_concurrency,
+            max_queue=config.max_queue,
+            queue_timeout=config.queue_timeout,
+            model_concurrency=config.model_concurrency
+        )
+
+    def _queue(self, model: str) -> _ModelQueue:
+        """Get or create the queue for a model."""
+        queue = self._queues.get(model)
+        if queue is None:
+            queue = _ModelQueue(self.model_concurrency.get(model, self.max_concurrency))
+            self._queues[model] = queue
+        return queue
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Active and queued requests per model."""
+        return {
+            model: {"active": queue.active, "queued": len(queue.waiters), "limit": queue.limit}
+            for model, queue in self._queues.items()
+        }
+
+    @asynccontextmanager
+    async def admit(self, model: str, timeout: Optional[float] = None) -> AsyncIterator[None]:
+        """Hold a concurrency slot for a model, waiting for one if necessary.
+
+        Args:
+            model: Model the request is for
+            timeout: Seconds the request may wait for a slot, defaults to queue_timeout
+
+        Raises:
+            AdmissionRejected: If the queue is full or the deadline passes before a slot frees up
+        """
+        queue = self._queue(model)
+        start_time = time.monotonic()
+        await self._acquire(queue, model, start_time + (self.queue_timeout if timeout is None else timeout))
+        wait_time = time.monotonic() - start_time
+        PerformanceMetrics().record_metric("admission_wait_time", wait_time, {"model": model})
+
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self._release(queue, time.monotonic() - started)
+
+    async def _acquire(self, queue: _ModelQueue, model: str, deadline: float) -> None:
+        """Take a slot or wait in the queue until one is handed over."""
+        if queue.active < queue.limit and not queue.waiters:
+            queue.active += 1
+            return
+
+        if len(queue.waiters) >= self.max_queue:
+            self._reject(model, "queue_full")
+            raise AdmissionRejected(
+                f"Too many requests queued for {model}",
+                429,
+                self._expected_wait(queue, len(queue.waiters))
+            )
+        expected_wait = self._expected_wait(queue, len(queue.waiters) + 1)
+        if time.monotonic() + expected_wait > deadline:
+            self._reject(model, "deadline")
+            raise AdmissionRejected(f"{model} cannot start a request before the deadline", 503, expected_wait)
+
+        waiter = asyncio.get_running_loop().create_future()
+        queue.waiters.append((waiter, deadline))
+        PerformanceMetrics().record_metric("admission_queue_depth", len(queue.waiters), {"model": model})
+        try:
+            await asyncio.wait({waiter}, timeout=max(0.0, deadline - time.monotonic()))
+        except asyncio.CancelledError:
+            self._abandon(queue, waiter)
+            raise
+        if waiter.done() and not waiter.cancelled():
+            # The releasing request has handed its slot over to this waiter
+            return
+        self._abandon(queue, waiter)
+        self._reject(model, "deadline")
+        raise AdmissionRejected(f"Timed out waiting for {model}", 503, self._expected_wait(queue, 1))
+
+    def _abandon(self, queue: _ModelQueue, waiter: asyncio.Future) -> None:
+        """Remove a waiter that gave up, passing on a slot it was handed meanwhile."""
+        if waiter.done() and not waiter.cancelled():
+            self._release(queue, None)
+            return
+        waiter.cancel()
+        for index, (queued, _) in enumerate(queue.waiters):
+            if queued is waiter:
+                del queue.waiters[index]
+                break
+
+    def _release(self, queue: _ModelQueue, service_time: Optional[float]) -> None:
+        """Free a slot, handing it to the oldest waiter whose deadline has not passed."""
+        if service_time is not None:
+            if queue.service_time is None:
+                queue.service_time = service_time
+            else:
+                queue.service_time += self.service_time_smoothing * (service_time - queue.service_time)
+
+        now = time.monotonic()
+        while queue.waiters:
+            waiter, deadline = queue.waiters.popleft()
+            if waiter.done():
+                continue
+            if deadline <= now:
+                # Starting it now would only waste work the caller no longer wants
+                waiter.cancel()
+                continue
+            waiter.set_result(None)
+            return
+        queue.active -= 1
+
+    def _expected_wait(self, queue: _ModelQueue, position: int) -> float:
+        """Estimate how long the request at a queue position waits for a slot."""
+        if queue.service_time is None:
+            return 0.0
+        return position * queue.service_time / queue.limit
+
+    def _reject(self, model: str, reason: str) -> None:
+        """Record a rejected request."""
+        self.logger.warning(f"Rejected {model} request: {reason}")
+        PerformanceMetrics().record_metric("admission_rejected", 1, {"model": model, "reason": reason})
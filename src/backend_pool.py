@@ -0,0 +1,236 @@
+"""Routing of LLM requests across several Ollama hosts."""
+
+import asyncio
+from contextlib import asynccontextmanager
+import logging
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+import httpx
+from src.benchmarks import PerformanceMetrics
+from src.config import LLMConfig
+
+class Backend:
+    """One Ollama host and its live routing state."""
+
+    def __init__(self, url: str):
+        self.url = url.rstrip("/")
+        self.in_flight = 0
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.healthy = True  # Result of the latest active health check
+        self.ejected_until = 0.0  # Monotonic time until which passive ejection applies
+        self.latency: Optional[float] = None  # Exponentially weighted seconds until response headers
+
+    def available(self, now: float) -> bool:
+        """Whether the backend should receive new requests."""
+        return self.healthy and now >= self.ejected_until
+
+    def stats(self, now: float) -> Dict[str, Any]:
+        """Current gauges for the backend."""
+        return {
+            "url": self.url,
+            "in_flight": self.in_flight,
+            "latency": self.latency,
+            "requests": self.requests,
+            "failures": self.failures,
+            "healthy": self.healthy,
+            "ejected": now < self.ejected_until,
+        }
+
+class BackendPool:
+    """Chooses an Ollama backend for each request.
+
+    Requests go to the available backend with the fewest outstanding
+    requests, ties broken by the lower average time to response headers.
+    That latency excludes the streamed body, so a backend that served long
+    answers is not mistaken for a slow one. A backend is ejected
+    for ``eject_duration`` seconds after ``eject_after_failures`` consecutive
+    failed requests, and is skipped while its active health check fails. With
+    model affinity, requests for a model keep going to the backend that served
+    it last so the model stays loaded there. When no backend is available the
+    pool fails open and routes across all of them.
+    """
+
+    def __init__(
+        self,
+        urls: List[str],
+        eject_after_failures: int = 3,
+        eject_duration: float = 30.0,
+        model_affinity: bool = False,
+        health_check_interval: float = 10.0,
+        latency_smoothing: float = 0.2
+    ):
+        """Initialize the pool.
+
+        Args:
+            urls: Base URLs of the Ollama hosts
+            eject_after_failures: Consecutive failures before a backend is ejected
+            eject_duration: Seconds an ejected backend is skipped
+            model_affinity: Keep routing a model to the backend that served it last
+            health_check_interval: Seconds between active health checks
+            latency_smoothing: Weight of the newest sample in the latency average
+        """
+        if not urls:
+            raise ValueError("At least one backend URL is required")
+        self.backends = [Backend(url) for url in urls]
+        self.eject_after_failures = eject_after_failures
+        self.eject_duration = eject_duration
+        self.model_affinity = model_affinity
+        self.health_check_interval = health_check_interval
+        self.latency_smoothing = latency_smoothing
+        self.logger = logging.getLogger(__name__)
+        self._affinity: Dict[str, Backend] = {}
+        self._next = 0  # Rotates the starting point so ties are spread evenly
+        self._task: Optional[asyncio.Task] = None
+
+    @classmethod
+    def from_config(cls, config: LLMConfig) -> "BackendPool":
+        """Create a pool from the LLM configuration."""
+        return cls(
+            config.base_urls or [config.base_url],
+            eject_after_failures=config.eject_after_failures,
+            eject_duration=config.eject_duration,
+            model_affinity=config.model_affinity,
+            health_check_interval=config.health_check_interval
+        )
+
+    def choose(self, model: Optional[str] = None, exclude: Optional[Backend] = None) -> Backend:
+        """Pick the backend for a new request.
+
+        Args:
+            model: Model the request is for, used for affinity
+            exclude: Backend to avoid if any other can take the request, such
+                as the one already serving the request being hedged
+
+        Returns:
+            The selected backend
+        """
+        now = time.monotonic()
+        if self.model_affinity and model is not None and exclude is None:
+            pinned = self._affinity.get(model)
+            if pinned is not None and pinned.available(now):
+                return pinned
+
+        candidates = [backend for backend in self.backends if backend.available(now)] or self.backends
+        if exclude is not None:
+            candidates = [backend for backend in candidates if backend is not exclude] or candidates
+        start = self._next % len(candidates)
+        self._next += 1
+        rotated = candidates[start:] + candidates[:start]
+        backend = min(
+            rotated,
+            key=lambda b: (b.in_flight, b.latency if b.latency is not None else 0.0)
+        )
+        if self.model_affinity and model is not None and exclude is None:
+            self._affinity[model] = backend
+        return backend
+
+    @asynccontextmanager
+    async def lease(self, model: Optional[str] = None, exclude: Optional[Backend] = None) -> AsyncIterator[Backend]:
+        """Hold a backend for the duration of one request.
+
+        Transport errors raised inside the block count as failures of the
+        backend. Other failures, such as server errors, are reported with
+        ``record_failure``. Callers report the time until the response
+        headers arrived with ``record_latency``.
+
+        Args:
+            model: Model the request is for
+            exclude: Backend to avoid if possible
+
+        Yields:
+            The backend to send the request to
+        """
+        backend = self.choose(model, exclude)
+        backend.in_flight += 1
+        backend.requests += 1
+        PerformanceMetrics().record_metric(
+            "llm_backend_in_flight",
+            backend.in_flight,
+            {"backend": backend.url}
+        )
+        failures = backend.failures
+        try:
+            yield backend
+        except httpx.TransportError:
+            self.record_failure(backend)
+            raise
+        finally:
+            backend.in_flight -= 1
+
+        if backend.failures == failures:
+            self.record_success(backend)
+
+    def record_success(self, backend: Backend) -> None:
+        """Update a backend after a successful request."""
+        backend.consecutive_failures = 0
+
+    def record_latency(self, backend: Backend, latency: float, model: Optional[str] = None) -> None:
+        """Update a backend's latency with the time until a response's headers arrived."""
+        PerformanceMetrics().record_metric(
+            "llm_backend_latency",
+            latency,
+            {"backend": backend.url, "model": model}
+        )
+        if backend.latency is None:
+            backend.latency = latency
+        else:
+            backend.latency += self.latency_smoothing * (latency - backend.latency)
+
+    def record_failure(self, backend: Backend) -> None:
+        """Update a backend after a failed request, ejecting it after repeated failures."""
+        backend.failures += 1
+        backend.consecutive_failures += 1
+        if backend.consecutive_failures >= self.eject_after_failures:
+            backend.ejected_until = time.monotonic() + self.eject_duration
+            backend.consecutive_failures = 0
+            self.logger.warning(f"Ejecting LLM backend {backend.url} for {self.eject_duration:.0f}s after repeated failures")
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """Latency and in-flight gauges for every backend."""
+        now = time.monotonic()
+        return [backend.stats(now) for backend in self.backends]
+
+    async def check_health(self, check: Callable[[Backend], Awaitable[bool]]) -> None:
+        """Run an active health check against every backend.
+
+        Args:
+            check: Returns whether a backend is healthy
+        """
+        async def run(backend: Backend) -> None:
+            try:
+                healthy = await check(backend)
+            except Exception:
+                healthy = False
+            if healthy and not backend.healthy:
+                self.logger.info(f"LLM backend {backend.url} is healthy again")
+            elif not healthy and backend.healthy:
+                self.logger.warning(f"LLM backend {backend.url} failed its health check")
+            backend.healthy = healthy
+            if healthy:
+                # A passing check ends a passive ejection early
+                backend.ejected_until = 0.0
+
+        await asyncio.gather(*(run(backend) for backend in self.backends))
+
+    def start(self, check: Callable[[Backend], Awaitable[bool]]) -> None:
+        """Start periodic health checks on the running event loop."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(check))
+
+    async def stop(self) -> None:
+        """Stop the periodic health checks."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self, check: Callable[[Backend], Awaitable[bool]]) -> None:
+        """Check health every interval until cancelled."""
+        while True:
+            await self.check_health(check)
+            await asyncio.sleep(self.health_check_interval)
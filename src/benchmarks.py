@@ -1,17 +1,229 @@
 """Performance benchmarking utilities for Convo-AI."""
 
-from typing import Any, Callable, Dict, Optional, TypeVar
+from typing import Any, Callable, Dict, Iterator, List, Optional, TypeVar, Union
 import time
 import psutil
 import functools
+import inspect
 import json
+import os
+import atexit
+import threading
+from contextlib import aclosing, contextmanager
 from pathlib import Path
 import logging
 from datetime import datetime
 
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
 # Type variable for generic function decoration
 F = TypeVar('F', bound=Callable[..., Any])
 
+def load_metrics(metrics_file: Union[str, Path]) -> Dict[str, list]:
+    """Load recorded metrics grouped by category.
+    
+    Reads both the append-only JSONL format written by MetricsSink and the
+    legacy format, a single JSON object mapping categories to lists of records.
+    Unparseable lines are skipped.
+    
+    Args:
+        metrics_file: Path to the metrics file
+        
+    Returns:
+        Dictionary mapping each category to its list of records
+    """
+    path = Path(metrics_file)
+    if not path.exists():
+        return {}
+    
+    if _is_legacy_metrics_file(path):
+        try:
+            with open(path, 'r') as f:
+                return json.load(f)
+        except json.JSONDecodeError:
+            logging.getLogger(__name__).warning("Could not load metrics file %s", path)
+            return {}
+    
+    metrics: Dict[str, list] = {}
+    with open(path, 'r') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+                category = record.pop('category')
+            except (json.JSONDecodeError, KeyError, AttributeError, TypeError):
+                continue
+            metrics.setdefault(category, []).append(record)
+    return metrics
+
+def _is_legacy_metrics_file(path: Path) -> bool:
+    """Check whether a metrics file uses the legacy single-object JSON format."""
+    with open(path, 'r') as f:
+        first_line = f.readline().strip()
+    # The legacy writer used json.dump(indent=2), so the object opens on its own line
+    return first_line in ("{", "{}")
+
+class MetricsSink:
+    """Buffered, append-only JSONL writer shared by every PerformanceMetrics for a file.
+    
+    Records are held in memory and appended in batches by a background thread
+    once ``max_buffer`` records are pending or ``flush_interval`` seconds have
+    passed, so recording a metric never touches the disk on the request path.
+    Appends and compaction hold an exclusive lock on a sidecar ``.lock`` file,
+    which keeps concurrent worker processes from interleaving partial writes.
+    """
+    
+    _instances: Dict[Path, "MetricsSink"] = {}
+    _instances_lock = threading.Lock()
+    
+    def __init__(self, metrics_file: Union[str, Path], max_buffer: int = 100, flush_interval: float = 1.0):
+        """Initialize the sink.
+        
+        Args:
+            metrics_file: Path of the JSONL file to append to
+            max_buffer: Number of pending records that triggers a flush
+            flush_interval: Maximum seconds a record stays in memory
+        """
+        self.metrics_file = Path(metrics_file)
+        self.metrics_file.parent.mkdir(parents=True, exist_ok=True)
+        self.lock_file = self.metrics_file.with_name(self.metrics_file.name + ".lock")
+        self.max_buffer = max_buffer
+        self.flush_interval = flush_interval
+        self.logger = logging.getLogger(__name__)
+        self._buffer: List[Dict[str, Any]] = []
+        self._buffer_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = False
+        self._thread: Optional[threading.Thread] = None
+        self._pid = os.getpid()
+        
+        self.metrics_file.touch(exist_ok=True)
+        if _is_legacy_metrics_file(self.metrics_file):
+            # Rewrite as JSONL so appended records stay parseable
+            self.compact()
+        atexit.register(self.close)
+    
+    @classmethod
+    def for_file(cls, metrics_file: Union[str, Path]) -> "MetricsSink":
+        """Get the process-wide sink for a metrics file, creating it if needed.
+        
+        Args:
+            metrics_file: Path of the metrics file
+            
+        Returns:
+            The shared sink for that file
+        """
+        key = Path(metrics_file).resolve()
+        with cls._instances_lock:
+            sink = cls._instances.get(key)
+            if sink is None:
+                sink = cls(metrics_file)
+                cls._instances[key] = sink
+            return sink
+    
+    def record(self, record: Dict[str, Any]) -> None:
+        """Buffer a record for the next flush.
+        
+        Args:
+            record: JSON-serialisable record including its category
+        """
+        self._ensure_thread()
+        with self._buffer_lock:
+            self._buffer.append(record)
+            pending = len(self._buffer)
+        if pending >= self.max_buffer:
+            self._wake.set()
+    
+    def flush(self) -> None:
+        """Append all buffered records to the metrics file."""
+        with self._buffer_lock:
+            records, self._buffer = self._buffer, []
+        if not records:
+            return
+        
+        data = "".join(json.dumps(record) + "\n" for record in records)
+        try:
+            with self._file_lock():
+                with open(self.metrics_file, 'a') as f:
+                    f.write(data)
+        except OSError as e:
+            self.logger.error(f"Error writing metrics file {self.metrics_file}: {e}")
+    
+    def compact(self, max_records_per_category: Optional[int] = None) -> None:
+        """Rewrite the metrics file as JSONL, optionally trimming old records.
+        
+        Also converts a legacy JSON metrics file in place. A legacy file that
+        is not valid JSON is moved aside to ``<name>.corrupt`` instead, so
+        its contents are kept for inspection rather than overwritten.
+        
+        Args:
+            max_records_per_category: Keep only the newest records of each category
+        """
+        self.flush()
+        with self._file_lock():
+            if _is_legacy_metrics_file(self.metrics_file):
+                try:
+                    with open(self.metrics_file, 'r') as f:
+                        metrics = json.load(f)
+                except json.JSONDecodeError as e:
+                    corrupt_file = self.metrics_file.with_name(self.metrics_file.name + ".corrupt")
+                    os.replace(self.metrics_file, corrupt_file)
+                    self.metrics_file.touch()
+                    self.logger.warning("Moved unreadable metrics file %s to %s: %s", self.metrics_file, corrupt_file, e)
+                    return
+            else:
+                metrics = load_metrics(self.metrics_file)
+            tmp_file = self.metrics_file.with_name(f"{self.metrics_file.name}.{os.getpid()}.tmp")
+            with open(tmp_file, 'w') as f:
+                for category, records in metrics.items():
+                    if max_records_per_category is not None:
+                        records = records[-max_records_per_category:] if max_records_per_category > 0 else []
+                    for record in records:
+                        f.write(json.dumps({'category': category, **record}) + "\n")
+            os.replace(tmp_file, self.metrics_file)
+    
+    def close(self) -> None:
+        """Stop the background thread and flush pending records."""
+        self._stopped = True
+        self._wake.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=self.flush_interval + 1)
+        self.flush()
+    
+    def _ensure_thread(self) -> None:
+        """Start the background flush thread, restarting it after a fork."""
+        if self._pid != os.getpid():
+            # Buffered records and the flush thread belong to the parent process
+            self._pid = os.getpid()
+            self._buffer = []
+            self._thread = None
+        if self._thread is None and not self._stopped:
+            with self._buffer_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="metrics-sink", daemon=True)
+                    self._thread.start()
+    
+    def _run(self) -> None:
+        """Flush on the size trigger or every flush interval until closed."""
+        while not self._stopped:
+            self._wake.wait(timeout=self.flush_interval)
+            self._wake.clear()
+            self.flush()
+    
+    @contextmanager
+    def _file_lock(self) -> Iterator[None]:
+        """Hold an exclusive inter-process lock on the metrics file."""
+        with open(self.lock_file, 'a') as lock:
+            if fcntl is not None:
+                fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock.fileno(), fcntl.LOCK_UN)
+
 class PerformanceMetrics:
     """Tracks and stores performance metrics for the application."""
     
@@ -19,28 +231,18 @@ class PerformanceMetrics:
         """Initialize the performance metrics tracker.
         
         Args:
-            metrics_file: Path to store the metrics data
+            metrics_file: Path to store the metrics data. A file still in the
+                legacy JSON format is converted to JSONL in place.
         """
         self.metrics_file = Path(metrics_file)
-        self.metrics_file.parent.mkdir(exist_ok=True)
         self.logger = logging.getLogger(__name__)
-        self.metrics: Dict[str, list] = self._load_metrics()
-        self._save_metrics()  # Ensure file exists after initialization
-
-    def _load_metrics(self) -> Dict[str, list]:
-        """Load existing metrics from file."""
-        if self.metrics_file.exists():
-            try:
-                with open(self.metrics_file, 'r') as f:
-                    return json.load(f)
-            except json.JSONDecodeError:
-                self.logger.warning("Could not load metrics file, starting fresh")
-        return {}
-
-    def _save_metrics(self) -> None:
-        """Save metrics to file."""
-        with open(self.metrics_file, 'w') as f:
-            json.dump(self.metrics, f, indent=2)
+        self.sink = MetricsSink.for_file(self.metrics_file)
+    
+    @property
+    def metrics(self) -> Dict[str, list]:
+        """All recorded metrics grouped by category, including buffered ones."""
+        self.sink.flush()
+        return load_metrics(self.metrics_file)
 
     def record_metric(self, category: str, value: float, metadata: Optional[Dict] = None) -> None:
         """Record a new metric value.
@@ -50,56 +252,159 @@ class PerformanceMetrics:
             value: The metric value
             metadata: Additional contextual information
         """
-        if category not in self.metrics:
-            self.metrics[category] = []
-            
-        metric_data = {
+        self.sink.record({
+            'category': category,
             'timestamp': datetime.now().isoformat(),
             'value': value,
             **(metadata or {})
-        }
+        })
+
+class StreamTimer:
+    """Measures time to first token and inter-token latency of a streamed response."""
+    
+    def __init__(self) -> None:
+        """Start timing from the moment the request is issued."""
+        self.start_time = time.perf_counter()
+        self.first_token_time: Optional[float] = None
+        self.last_token_time: Optional[float] = None
+        self.token_count = 0
+        self._gap_total = 0.0
+        self._gap_max = 0.0
+    
+    def mark_token(self) -> None:
+        """Record the arrival of a token."""
+        now = time.perf_counter()
+        if self.first_token_time is None:
+            self.first_token_time = now
+        else:
+            gap = now - self.last_token_time
+            self._gap_total += gap
+            self._gap_max = max(self._gap_max, gap)
+        self.last_token_time = now
+        self.token_count += 1
+    
+    @property
+    def time_to_first_token(self) -> Optional[float]:
+        """Seconds between the request and the first token, if one arrived."""
+        if self.first_token_time is None:
+            return None
+        return self.first_token_time - self.start_time
+    
+    @property
+    def inter_token_latency(self) -> Optional[float]:
+        """Mean seconds between consecutive tokens, if more than one arrived."""
+        if self.token_count < 2:
+            return None
+        return self._gap_total / (self.token_count - 1)
+    
+    def summary(self) -> Dict[str, Any]:
+        """Get the timings as a metrics dictionary.
         
-        self.metrics[category].append(metric_data)
-        self._save_metrics()
+        Returns:
+            Dictionary with time to first token, inter-token latency and token count
+        """
+        return {
+            'time_to_first_token': self.time_to_first_token,
+            'inter_token_latency_mean': self.inter_token_latency,
+            'inter_token_latency_max': self._gap_max if self.token_count > 1 else None,
+            'token_count': self.token_count
+        }
+
+def _memory_mb() -> float:
+    """Get the resident memory of the current process in MB."""
+    return psutil.Process().memory_info().rss / 1024 / 1024
 
-def benchmark(category: str) -> Callable[[F], F]:
+def _record_benchmark(
+    category: str,
+    func: Callable[..., Any],
+    execution_time: float,
+    mem_before: float,
+    metadata: Optional[Dict[str, Any]] = None
+) -> None:
+    """Record the timing and memory metrics for one benchmarked call."""
+    metrics = PerformanceMetrics()
+    mem_diff = _memory_mb() - mem_before
+    
+    metrics.record_metric(
+        f"{category}_time",
+        execution_time,
+        {'function': func.__name__, **(metadata or {})}
+    )
+    
+    metrics.record_metric(
+        f"{category}_memory",
+        mem_diff,
+        {'function': func.__name__}
+    )
+
+def benchmark(category: Union[str, F]) -> Any:
     """Decorator to benchmark function execution.
     
+    Works with plain functions, coroutine functions and async generator functions.
+    Coroutines are timed until they complete rather than until they are created.
+    Async generators are timed per item: time to first item, total time and item
+    count. Can be used as ``@benchmark("category")`` or bare as ``@benchmark``,
+    in which case the function name is used as the category.
+    
     Args:
-        category: The type of metric to record
+        category: The type of metric to record, or the function when used bare
         
     Returns:
         Decorated function that includes performance tracking
     """
+    if callable(category):
+        return benchmark(category.__name__)(category)
+    
     def decorator(func: F) -> F:
+        if inspect.isasyncgenfunction(func):
+            @functools.wraps(func)
+            async def async_gen_wrapper(*args: Any, **kwargs: Any) -> Any:
+                mem_before = _memory_mb()
+                start_time = time.perf_counter()
+                first_item_time: Optional[float] = None
+                item_count = 0
+                try:
+                    # Close the wrapped generator as soon as the caller stops, not when it is collected
+                    async with aclosing(func(*args, **kwargs)) as items:
+                        async for item in items:
+                            if first_item_time is None:
+                                first_item_time = time.perf_counter() - start_time
+                            item_count += 1
+                            yield item
+                finally:
+                    execution_time = time.perf_counter() - start_time
+                    _record_benchmark(category, func, execution_time, mem_before, {'items': item_count})
+                    if first_item_time is not None:
+                        PerformanceMetrics().record_metric(
+                            f"{category}_first_item_time",
+                            first_item_time,
+                            {'function': func.__name__}
+                        )
+            return async_gen_wrapper  # type: ignore
+        
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args: Any, **kwargs: Any) -> Any:
+                mem_before = _memory_mb()
+                start_time = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    execution_time = time.perf_counter() - start_time
+                    _record_benchmark(category, func, execution_time, mem_before)
+            return async_wrapper  # type: ignore
+        
         @functools.wraps(func)
         def wrapper(*args: Any, **kwargs: Any) -> Any:
-            metrics = PerformanceMetrics()
-            
             # Record memory before
-            mem_before = psutil.Process().memory_info().rss / 1024 / 1024  # MB
+            mem_before = _memory_mb()
             
             # Time the function
             start_time = time.perf_counter()
             result = func(*args, **kwargs)
             execution_time = time.perf_counter() - start_time
             
-            # Record memory after
-            mem_after = psutil.Process().memory_info().rss / 1024 / 1024  # MB
-            mem_diff = mem_after - mem_before
-            
-            # Record metrics
-            metrics.record_metric(
-                f"{category}_time",
-                execution_time,
-                {'function': func.__name__}
-            )
-            
-            metrics.record_metric(
-                f"{category}_memory",
-                mem_diff,
-                {'function': func.__name__}
-            )
+            _record_benchmark(category, func, execution_time, mem_before)
             
             return result
         return wrapper  # type: ignore
@@ -1,26 +1,177 @@
 """Cache implementation for LLM responses."""
 
+import asyncio
+import functools
 import json
 import hashlib
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
 from pathlib import Path
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Tuple
 from datetime import datetime, timedelta
 import logging
+from src.benchmarks import PerformanceMetrics
+from src.cache_backends import CacheBackend, EvictionPolicy, FileCacheBackend, SQLiteCacheBackend
+from src.config import CacheConfig
+
+class MemoryTier:
+    """Bounded in-process LRU holding decoded cache entries in front of the disk store."""
+    
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 16 * 1024 * 1024):
+        """Initialize the memory tier.
+        
+        Args:
+            max_entries: Maximum number of entries kept in memory
+            max_bytes: Maximum total size of the cached responses in bytes
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size_bytes = 0
+        self.evictions = 0
+        # key -> (response, expiry as a Unix timestamp, size in bytes)
+        self._entries: "OrderedDict[str, Tuple[str, float, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+    
+    def get(self, key: str, now: float) -> Optional[str]:
+        """Get an entry if present and not expired, marking it most recently used.
+        
+        Args:
+            key: Cache key
+            now: Current Unix timestamp
+            
+        Returns:
+            Cached response text if available, None otherwise
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            response, expires_at, size = entry
+            if now > expires_at:
+                del self._entries[key]
+                self.size_bytes -= size
+                return None
+            self._entries.move_to_end(key)
+            return response
+    
+    def put(self, key: str, response: str, expires_at: float) -> None:
+        """Insert or refresh an entry, evicting least recently used entries over budget.
+        
+        Args:
+            key: Cache key
+            response: Response text
+            expires_at: Expiry as a Unix timestamp
+        """
+        size = len(key) + len(response.encode("utf-8"))
+        if size > self.max_bytes or self.max_entries <= 0:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size_bytes -= previous[2]
+            self._entries[key] = (response, expires_at, size)
+            self.size_bytes += size
+            while len(self._entries) > self.max_entries or self.size_bytes > self.max_bytes:
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self.size_bytes -= evicted_size
+                self.evictions += 1
+    
+    def pop(self, key: str) -> None:
+        """Remove an entry if present."""
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self.size_bytes -= entry[2]
+    
+    def clear(self) -> None:
+        """Remove all entries."""
+        with self._lock:
+            self._entries.clear()
+            self.size_bytes = 0
 
 class ResponseCache:
-    """Local file-based cache for LLM responses."""
+    """Cache for LLM responses with an in-memory LRU tier over a durable backend."""
     
-    def __init__(self, cache_dir: str = "output/cache", ttl_hours: int = 24):
+    def __init__(
+        self,
+        cache_dir: str = "output/cache",
+        ttl_hours: int = 24,
+        memory_max_entries: int = 1024,
+        memory_max_bytes: int = 16 * 1024 * 1024,
+        backend: Optional[CacheBackend] = None,
+        max_entries: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+        eviction_policy: EvictionPolicy = "lru",
+        io_workers: int = 4,
+        write_queue_size: int = 1000
+    ):
         """Initialize the cache.
         
         Args:
-            cache_dir: Directory to store cache files
+            cache_dir: Directory to store cache files when using the default file backend
             ttl_hours: Time-to-live in hours for cache entries
+            memory_max_entries: Maximum number of entries held in memory
+            memory_max_bytes: Maximum size in bytes of the responses held in memory
+            backend: Durable storage backend, defaults to one JSON file per entry
+            max_entries: Maximum number of entries kept by the backend, unbounded if None
+            max_bytes: Maximum size in bytes kept by the backend, unbounded if None
+            eviction_policy: Which entries to evict over budget, "lru" or "lfu"
+            io_workers: Threads used by aget for backend reads
+            write_queue_size: Maximum writes queued by aset before new ones are dropped
         """
+        self.backend = backend or FileCacheBackend(cache_dir)
         self.cache_dir = Path(cache_dir)
-        self.cache_dir.mkdir(parents=True, exist_ok=True)
         self.ttl = timedelta(hours=ttl_hours)
         self.logger = logging.getLogger(__name__)
+        self.memory = MemoryTier(memory_max_entries, memory_max_bytes)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.eviction_policy = eviction_policy
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        # Access statistics are kept in memory and handed to the backend by sweeps.
+        # Lookups on the I/O pool update them and the hit counters concurrently, so both use this lock
+        self._accesses: Dict[str, Tuple[float, int]] = {}
+        self._accesses_lock = threading.Lock()
+        # Async API: backend reads run on a bounded pool, writes go through a write-behind queue
+        self._executor = ThreadPoolExecutor(max_workers=io_workers, thread_name_prefix="response-cache-io")
+        self._write_queue: "queue.Queue[Optional[Tuple[str, Dict[str, Any]]]]" = queue.Queue(maxsize=write_queue_size)
+        self._writer: Optional[threading.Thread] = None
+        self._writer_lock = threading.Lock()
+        self.dropped_writes = 0
+    
+    @classmethod
+    def from_config(cls, config: CacheConfig) -> "ResponseCache":
+        """Create a cache using the backend selected in the configuration.
+        
+        Args:
+            config: Cache configuration
+            
+        Returns:
+            Configured response cache
+        """
+        backend: CacheBackend
+        if config.backend == "sqlite":
+            backend = SQLiteCacheBackend(config.sqlite_path)
+        else:
+            backend = FileCacheBackend(config.cache_dir)
+        return cls(
+            cache_dir=config.cache_dir,
+            ttl_hours=config.ttl_hours,
+            memory_max_entries=config.memory_max_entries,
+            memory_max_bytes=config.memory_max_bytes,
+            backend=backend,
+            max_entries=config.max_entries,
+            max_bytes=config.max_bytes,
+            eviction_policy=config.eviction_policy
+        )
         
     def _compute_key(self, model: str, prompt: str, **kwargs: Any) -> str:
         """Compute cache key from request parameters.
@@ -45,7 +196,7 @@ class ResponseCache:
         return hashlib.sha256(param_str.encode()).hexdigest()
     
     def _get_cache_file(self, key: str) -> Path:
-        """Get the cache file path for a key.
+        """Get the cache file path for a key when using the file backend.
         
         Args:
             key: Cache key
@@ -67,28 +218,89 @@ class ResponseCache:
             Cached response text if available, None otherwise
         """
         key = self._compute_key(model, prompt, **kwargs)
-        cache_file = self._get_cache_file(key)
         
-        if not cache_file.exists():
+        # Hot entries are served from memory without touching the filesystem
+        response = self._get_from_memory(key)
+        if response is not None:
+            return response
+        return self._get_from_backend(key)
+    
+    async def aget(self, model: str, prompt: str, **kwargs: Any) -> Optional[str]:
+        """Get a cached response without blocking the event loop.
+        
+        Memory hits are answered inline; backend reads run on the I/O pool.
+        
+        Args:
+            model: The LLM model name
+            prompt: The input prompt
+            kwargs: Additional parameters that affect the response
+            
+        Returns:
+            Cached response text if available, None otherwise
+        """
+        key = self._compute_key(model, prompt, **kwargs)
+        response = self._get_from_memory(key)
+        if response is not None:
+            return response
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(self.get, model, prompt, **kwargs))
+    
+    def _get_from_memory(self, key: str) -> Optional[str]:
+        """Look up the memory tier, counting a hit when found."""
+        now = time.time()
+        response = self.memory.get(key, now)
+        if response is not None:
+            with self._accesses_lock:
+                self.memory_hits += 1
+            self._record_access(key, now)
+        return response
+    
+    def _get_from_backend(self, key: str) -> Optional[str]:
+        """Look up the backend, counting a hit or a miss."""
+        response = self._read_disk(key)
+        if response is None:
+            with self._accesses_lock:
+                self.misses += 1
+        else:
+            with self._accesses_lock:
+                self.disk_hits += 1
+            self._record_access(key, time.time())
+        return response
+    
+    def _record_access(self, key: str, now: float) -> None:
+        """Note a cache hit for LRU/LFU eviction without doing any I/O."""
+        with self._accesses_lock:
+            _, hits = self._accesses.get(key, (now, 0))
+            self._accesses[key] = (now, hits + 1)
+    
+    def _read_disk(self, key: str) -> Optional[str]:
+        """Read an entry from the backend and promote it to the memory tier.
+        
+        Args:
+            key: Cache key
+            
+        Returns:
+            Cached response text if available and not expired, None otherwise
+        """
+        cache_data = self.backend.read(key)
+        if cache_data is None:
             return None
             
         try:
-            with open(cache_file, 'r') as f:
-                cache_data = json.load(f)
-                
             # Check if entry has expired
             cached_time = datetime.fromisoformat(cache_data["timestamp"])
             if datetime.now() - cached_time > self.ttl:
                 self.logger.info(f"Cache entry expired for key {key}")
-                cache_file.unlink()
+                self.backend.delete(key)
                 return None
                 
             self.logger.info(f"Cache hit for key {key}")
+            self.memory.put(key, cache_data["response"], (cached_time + self.ttl).timestamp())
             return cache_data["response"]
             
-        except (json.JSONDecodeError, KeyError) as e:
-            self.logger.warning(f"Error reading cache file {cache_file}: {e}")
-            cache_file.unlink()
+        except (KeyError, ValueError, TypeError) as e:
+            self.logger.warning(f"Error reading cache entry {key}: {e}")
+            self.backend.delete(key)
             return None
     
     def set(self, model: str, prompt: str, response: str, **kwargs: Any) -> None:
@@ -100,29 +312,214 @@ class ResponseCache:
             response: The response to cache
             kwargs: Additional parameters that affect the response
         """
+        key, cache_data = self._prepare_entry(model, prompt, response, **kwargs)
+        self._write_backend(key, cache_data)
+    
+    async def aset(self, model: str, prompt: str, response: str, **kwargs: Any) -> None:
+        """Store a response without waiting for the backend write.
+        
+        The entry is visible in memory immediately and written behind by a
+        background thread. When the write-behind queue is full the durable
+        write is dropped rather than stalling the caller.
+        
+        Args:
+            model: The LLM model name
+            prompt: The input prompt
+            response: The response to cache
+            kwargs: Additional parameters that affect the response
+        """
+        key, cache_data = self._prepare_entry(model, prompt, response, **kwargs)
+        self._ensure_writer()
+        try:
+            self._write_queue.put_nowait((key, cache_data))
+        except queue.Full:
+            self.dropped_writes += 1
+            self.logger.warning(f"Cache write queue full, dropping write for key {key}")
+    
+    def _prepare_entry(self, model: str, prompt: str, response: str, **kwargs: Any) -> Tuple[str, Dict[str, Any]]:
+        """Build the entry for a response and add it to the memory tier."""
+        if not isinstance(response, str):
+            raise TypeError(f"Cached responses must be strings, got {type(response).__name__}")
         key = self._compute_key(model, prompt, **kwargs)
-        cache_file = self._get_cache_file(key)
+        now = datetime.now()
+        self.memory.put(key, response, (now + self.ttl).timestamp())
         
         cache_data = {
-            "timestamp": datetime.now().isoformat(),
+            "timestamp": now.isoformat(),
             "model": model,
             "prompt": prompt,
             "response": response,
             "parameters": kwargs
         }
-        
+        return key, cache_data
+    
+    def _write_backend(self, key: str, cache_data: Dict[str, Any]) -> None:
+        """Write an entry to the backend, logging rather than raising on failure."""
         try:
-            with open(cache_file, 'w') as f:
-                json.dump(cache_data, f, indent=2)
+            self.backend.write(key, cache_data)
             self.logger.info(f"Cached response for key {key}")
         except Exception as e:
-            self.logger.error(f"Error writing cache file {cache_file}: {e}")
+            self.logger.error(f"Error writing cache entry {key}: {e}")
+    
+    def _ensure_writer(self) -> None:
+        """Start the write-behind thread if it is not running."""
+        if self._writer is not None and self._writer.is_alive():
+            return
+        with self._writer_lock:
+            if self._writer is None or not self._writer.is_alive():
+                self._writer = threading.Thread(target=self._drain_writes, name="response-cache-writer", daemon=True)
+                self._writer.start()
+    
+    def _drain_writes(self) -> None:
+        """Write queued entries to the backend until told to stop."""
+        while True:
+            item = self._write_queue.get()
+            try:
+                if item is None:
+                    return
+                self._write_backend(*item)
+            finally:
+                self._write_queue.task_done()
+    
+    def stats(self) -> Dict[str, int]:
+        """Get cache hit, miss and eviction counters.
+        
+        Returns:
+            Dictionary of counters and current memory tier usage
+        """
+        with self._accesses_lock:
+            memory_hits, disk_hits, misses = self.memory_hits, self.disk_hits, self.misses
+        return {
+            "hits": memory_hits + disk_hits,
+            "memory_hits": memory_hits,
+            "disk_hits": disk_hits,
+            "misses": misses,
+            "evictions": self.memory.evictions,
+            "dropped_writes": self.dropped_writes,
+            "pending_writes": self._write_queue.qsize(),
+            "memory_entries": len(self.memory),
+            "memory_bytes": self.memory.size_bytes
+        }
+    
+    def purge_expired(self) -> int:
+        """Remove all expired entries from the backend.
+        
+        Returns:
+            Number of entries removed
+        """
+        removed, _ = self.backend.purge_expired(datetime.now() - self.ttl)
+        return removed
+    
+    def sweep(self, batch_size: int = 500) -> Tuple[int, int]:
+        """Run one bounded maintenance step on the backend.
+        
+        Applies recorded access statistics, removes up to ``batch_size`` expired
+        entries and evicts up to ``batch_size`` entries while over budget.
+        
+        Args:
+            batch_size: Maximum number of entries removed by each phase
+            
+        Returns:
+            Number of entries removed and bytes reclaimed
+        """
+        with self._accesses_lock:
+            accesses, self._accesses = self._accesses, {}
+        if accesses:
+            self.backend.record_access(accesses)
+        
+        removed, reclaimed = self.backend.purge_expired(datetime.now() - self.ttl, limit=batch_size)
+        if self.max_entries is not None or self.max_bytes is not None:
+            evicted, evicted_bytes = self.backend.evict(
+                self.max_entries, self.max_bytes, self.eviction_policy, limit=batch_size
+            )
+            removed += evicted
+            reclaimed += evicted_bytes
+        return removed, reclaimed
     
     def clear(self) -> None:
         """Clear all cached responses."""
-        for cache_file in self.cache_dir.glob("*.json"):
+        self.memory.clear()
+        self.backend.clear()
+        self.logger.info("Cache cleared")
+    
+    def flush(self) -> None:
+        """Wait for queued writes and persist writes buffered by the backend."""
+        if self._writer is not None and self._writer.is_alive():
+            self._write_queue.join()
+        self.backend.flush()
+    
+    def close(self) -> None:
+        """Flush pending writes and release the I/O threads and backend resources."""
+        if self._writer is not None and self._writer.is_alive():
+            self._write_queue.put(None)
+            self._writer.join()
+        self._executor.shutdown(wait=True)
+        self.backend.close()
+
+class CacheSweeper:
+    """Background task that removes expired entries and enforces the cache budget.
+    
+    Each sweep runs in small batches on a worker thread so a large backlog of
+    expired entries never stalls the event loop or a request.
+    """
+    
+    def __init__(self, cache: ResponseCache, interval: float = 300.0, batch_size: int = 500):
+        """Initialize the sweeper.
+        
+        Args:
+            cache: Cache to maintain
+            interval: Seconds between sweeps
+            batch_size: Maximum entries removed per batch
+        """
+        self.cache = cache
+        self.interval = interval
+        self.batch_size = batch_size
+        self.logger = logging.getLogger(__name__)
+        self._task: Optional[asyncio.Task] = None
+    
+    def start(self) -> None:
+        """Start sweeping periodically on the running event loop."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+    
+    async def stop(self) -> None:
+        """Stop the periodic sweeps."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+    
+    async def sweep(self) -> Tuple[int, int]:
+        """Sweep the cache in batches until nothing more needs removing.
+        
+        Returns:
+            Number of entries removed and bytes reclaimed
+        """
+        removed = reclaimed = 0
+        while True:
+            batch_removed, batch_reclaimed = await asyncio.to_thread(self.cache.sweep, self.batch_size)
+            removed += batch_removed
+            reclaimed += batch_reclaimed
+            if batch_removed < self.batch_size:
+                break
+        
+        if removed:
+            PerformanceMetrics().record_metric(
+                "cache_reclaimed_bytes",
+                reclaimed,
+                {"entries": removed}
+            )
+            self.logger.info(f"Cache sweep removed {removed} entries ({reclaimed} bytes)")
+        return removed, reclaimed
+    
+    async def _run(self) -> None:
+        """Sweep every interval until cancelled."""
+        while True:
+            await asyncio.sleep(self.interval)
             try:
-                cache_file.unlink()
+                await self.sweep()
             except Exception as e:
-                self.logger.error(f"Error deleting cache file {cache_file}: {e}")
-        self.logger.info("Cache cleared") 
\ No newline at end of file
+                self.logger.error(f"Cache sweep failed: {e}")
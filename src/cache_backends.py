@@ -0,0 +1,534 @@
+"""Storage backends for the LLM response cache."""
+
+import json
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Literal, Optional, Tuple
+import logging
+import os
+
+EvictionPolicy = Literal["lru", "lfu"]
+
+def _check_entry(entry: Dict[str, Any]) -> None:
+    """Raise ValueError if an entry cannot be stored."""
+    if not isinstance(entry, dict):
+        raise ValueError("Cache entry must be a JSON object")
+    timestamp = entry.get("timestamp")
+    if not isinstance(timestamp, str):
+        raise ValueError("Cache entry has no timestamp")
+    datetime.fromisoformat(timestamp)
+    if not isinstance(entry.get("response"), str):
+        raise ValueError("Cache entry response must be a string")
+
+class CacheBackend(ABC):
+    """Durable key-value store for cache entries.
+
+    Entries are dictionaries with ``timestamp`` (ISO format), ``model``,
+    ``prompt``, ``response`` and ``parameters`` fields.
+    """
+
+    @abstractmethod
+    def read(self, key: str) -> Optional[Dict[str, Any]]:
+        """Read an entry, returning None if it does not exist or is unreadable."""
+
+    @abstractmethod
+    def write(self, key: str, entry: Dict[str, Any]) -> None:
+        """Store an entry, replacing any existing one."""
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        """Remove an entry if it exists."""
+
+    @abstractmethod
+    def purge_expired(self, cutoff: datetime, limit: Optional[int] = None) -> Tuple[int, int]:
+        """Remove up to ``limit`` entries written before the cutoff.
+
+        Returns:
+            Number of entries removed and bytes reclaimed
+        """
+
+    @abstractmethod
+    def usage(self) -> Tuple[int, int]:
+        """Get the number of stored entries and their total size in bytes."""
+
+    @abstractmethod
+    def evict(
+        self,
+        max_entries: Optional[int],
+        max_bytes: Optional[int],
+        policy: EvictionPolicy = "lru",
+        limit: Optional[int] = None
+    ) -> Tuple[int, int]:
+        """Remove up to ``limit`` entries chosen by the policy until within budget.
+
+        Returns:
+            Number of entries removed and bytes reclaimed
+        """
+
+    @abstractmethod
+    def clear(self) -> None:
+        """Remove all entries."""
+
+    @abstractmethod
+    def entries(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """Iterate over all stored keys and entries."""
+
+    def write_many(self, entries: Dict[str, Dict[str, Any]]) -> None:
+        """Store several entries.
+
+        Args:
+            entries: Mapping of cache key to entry
+        """
+        for key, entry in entries.items():
+            self.write(key, entry)
+
+    def record_access(self, accesses: Dict[str, Tuple[float, int]]) -> None:
+        """Apply access statistics gathered in memory for LRU/LFU eviction.
+
+        Args:
+            accesses: Mapping of cache key to (last access timestamp, hit count)
+        """
+
+    def flush(self) -> None:
+        """Persist any buffered writes."""
+
+    def close(self) -> None:
+        """Flush and release resources."""
+        self.flush()
+
+class FileCacheBackend(CacheBackend):
+    """Stores each entry as a JSON file named after its key."""
+
+    def __init__(self, cache_dir: str = "output/cache"):
+        """Initialize the backend.
+
+        Args:
+            cache_dir: Directory to store cache files
+        """
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.logger = logging.getLogger(__name__)
+        # Files not yet checked by the current expiry pass, so limited batches resume where they stopped
+        self._purge_queue: Optional[Iterator[str]] = None
+        self._purge_lock = threading.Lock()
+
+    def path_for(self, key: str) -> Path:
+        """Get the cache file path for a key.
+
+        Args:
+            key: Cache key
+
+        Returns:
+            Path to cache file
+        """
+        return self.cache_dir / f"{key}.json"
+
+    def read(self, key: str) -> Optional[Dict[str, Any]]:
+        cache_file = self.path_for(key)
+        if not cache_file.exists():
+            return None
+        try:
+            with open(cache_file, 'r') as f:
+                return json.load(f)
+        except json.JSONDecodeError as e:
+            self.logger.warning(f"Error reading cache file {cache_file}: {e}")
+            cache_file.unlink(missing_ok=True)
+            return None
+
+    def write(self, key: str, entry: Dict[str, Any]) -> None:
+        # Write to a temporary file first so concurrent readers never see a partial entry
+        cache_file = self.path_for(key)
+        tmp_file = cache_file.with_name(f"{cache_file.name}.{threading.get_ident()}.tmp")
+        with open(tmp_file, 'w') as f:
+            json.dump(entry, f, indent=2)
+        os.replace(tmp_file, cache_file)
+
+    def delete(self, key: str) -> None:
+        self.path_for(key).unlink(missing_ok=True)
+
+    def purge_expired(self, cutoff: datetime, limit: Optional[int] = None) -> Tuple[int, int]:
+        removed = reclaimed = 0
+        if limit is not None and limit <= 0:
+            return removed, reclaimed
+        with self._purge_lock:
+            if self._purge_queue is None:
+                self._purge_queue = iter([name for name in os.listdir(self.cache_dir) if name.endswith(".json")])
+            for name in self._purge_queue:
+                cache_file = self.cache_dir / name
+                if self._is_expired(cache_file, cutoff):
+                    reclaimed += self._remove(cache_file)
+                    removed += 1
+                    if limit is not None and removed >= limit:
+                        return removed, reclaimed
+            self._purge_queue = None
+        return removed, reclaimed
+
+    def _is_expired(self, cache_file: Path, cutoff: datetime) -> bool:
+        """Whether a cache file was written before the cutoff."""
+        try:
+            mtime = cache_file.stat().st_mtime
+        except FileNotFoundError:
+            return False
+        # Files are written after their timestamp and only writes change mtime,
+        # so an old mtime proves expiry without parsing the entry
+        if mtime < cutoff.timestamp():
+            return True
+        entry = self.read(cache_file.stem)
+        if entry is None:
+            return False
+        try:
+            return datetime.fromisoformat(entry["timestamp"]) < cutoff
+        except (KeyError, ValueError, TypeError):
+            return True
+
+    def usage(self) -> Tuple[int, int]:
+        files = self._stat_files()
+        return len(files), sum(size for _, _, size in files)
+
+    def evict(
+        self,
+        max_entries: Optional[int],
+        max_bytes: Optional[int],
+        policy: EvictionPolicy = "lru",
+        limit: Optional[int] = None
+    ) -> Tuple[int, int]:
+        if policy == "lfu":
+            # Hit counts are not persisted per file, so fall back to recency
+            self.logger.debug("LFU eviction is not supported by the file backend, using LRU")
+        files = self._stat_files()
+        entries, total_bytes = len(files), sum(size for _, _, size in files)
+        removed = reclaimed = 0
+        # Cache hits move the access time forward, so the oldest atime is least recently used
+        for cache_file, _, size in sorted(files, key=lambda item: item[1]):
+            over_entries = max_entries is not None and entries > max_entries
+            over_bytes = max_bytes is not None and total_bytes > max_bytes
+            if not (over_entries or over_bytes) or (limit is not None and removed >= limit):
+                break
+            reclaimed += self._remove(cache_file)
+            entries -= 1
+            total_bytes -= size
+            removed += 1
+        return removed, reclaimed
+
+    def record_access(self, accesses: Dict[str, Tuple[float, int]]) -> None:
+        for key, (last_access, _) in accesses.items():
+            cache_file = self.path_for(key)
+            try:
+                stat = cache_file.stat()
+                # Only move the access time, mtime stays the write time that expiry relies on
+                os.utime(cache_file, ns=(int(last_access * 1e9), stat.st_mtime_ns))
+            except FileNotFoundError:
+                continue
+
+    def _stat_files(self) -> List[Tuple[Path, float, int]]:
+        """List cache files with their access time and size."""
+        files = []
+        with os.scandir(self.cache_dir) as it:
+            for item in it:
+                if item.name.endswith(".json"):
+                    try:
+                        stat = item.stat()
+                    except FileNotFoundError:
+                        continue
+                    files.append((Path(item.path), stat.st_atime, stat.st_size))
+        return files
+
+    def _remove(self, cache_file: Path) -> int:
+        """Delete a cache file and return its size in bytes."""
+        try:
+            size = cache_file.stat().st_size
+            cache_file.unlink()
+            return size
+        except FileNotFoundError:
+            return 0
+
+    def clear(self) -> None:
+        for cache_file in self.cache_dir.glob("*.json"):
+            try:
+                cache_file.unlink()
+            except Exception as e:
+                self.logger.error(f"Error deleting cache file {cache_file}: {e}")
+
+    def entries(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        for cache_file in self.cache_dir.glob("*.json"):
+            entry = self.read(cache_file.stem)
+            if entry is not None:
+                yield cache_file.stem, entry
+
+class SQLiteCacheBackend(CacheBackend):
+    """Stores all entries in a single SQLite database in WAL mode.
+
+    Writes are buffered and committed in batches of ``batch_size`` or by a
+    timer at most ``flush_interval`` seconds after the first buffered write.
+    Buffered entries are visible to reads before they are committed.
+    """
+
+    def __init__(self, db_path: str = "output/cache.db", batch_size: int = 32, flush_interval: float = 1.0):
+        """Initialize the backend.
+
+        Args:
+            db_path: Path to the SQLite database file
+            batch_size: Number of buffered writes that triggers a commit
+            flush_interval: Maximum seconds a write stays buffered
+        """
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.logger = logging.getLogger(__name__)
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._accesses: Dict[str, Tuple[float, int]] = {}
+        self._flush_timer: Optional[threading.Timer] = None
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                timestamp REAL NOT NULL,
+                model TEXT NOT NULL,
+                prompt TEXT NOT NULL,
+                response TEXT NOT NULL,
+                parameters TEXT NOT NULL,
+                size INTEGER NOT NULL DEFAULT 0,
+                last_access REAL NOT NULL DEFAULT 0,
+                hits INTEGER NOT NULL DEFAULT 0
+            )
+            """
+        )
+        self._add_missing_columns()
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_timestamp ON responses (timestamp)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses (last_access)")
+        self._conn.commit()
+
+    def _add_missing_columns(self) -> None:
+        """Upgrade databases created before eviction statistics were tracked."""
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(responses)")}
+        for column, definition in (
+            ("size", "INTEGER NOT NULL DEFAULT 0"),
+            ("last_access", "REAL NOT NULL DEFAULT 0"),
+            ("hits", "INTEGER NOT NULL DEFAULT 0"),
+        ):
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE responses ADD COLUMN {column} {definition}")
+
+    def read(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            pending = self._pending.get(key)
+            if pending is not None:
+                return pending
+            row = self._conn.execute(
+                "SELECT timestamp, model, prompt, response, parameters FROM responses WHERE key = ?",
+                (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        return self._row_to_entry(row)
+
+    def write(self, key: str, entry: Dict[str, Any]) -> None:
+        # Reject bad entries here, once buffered they would fail the whole batch
+        _check_entry(entry)
+        with self._lock:
+            self._pending[key] = entry
+            if len(self._pending) >= self.batch_size:
+                self.flush()
+            elif self._flush_timer is None:
+                # Commit this write even if no further writes arrive
+                self._flush_timer = threading.Timer(self.flush_interval, self._timed_flush)
+                self._flush_timer.daemon = True
+                self._flush_timer.start()
+
+    def _timed_flush(self) -> None:
+        """Commit writes that have been buffered for ``flush_interval`` seconds."""
+        with self._lock:
+            if self._flush_timer is not threading.current_thread():
+                # Replaced or cancelled by a flush that ran first
+                return
+            self._flush_timer = None
+            try:
+                self.flush()
+            except sqlite3.Error as e:
+                self.logger.error(f"Error committing buffered cache writes: {e}")
+
+    def write_many(self, entries: Dict[str, Dict[str, Any]]) -> None:
+        """Store several entries in a single transaction."""
+        for entry in entries.values():
+            _check_entry(entry)
+        with self._lock:
+            self._pending.update(entries)
+            self.flush()
+
+    def record_access(self, accesses: Dict[str, Tuple[float, int]]) -> None:
+        with self._lock:
+            for key, (last_access, hits) in accesses.items():
+                previous = self._accesses.get(key, (0.0, 0))
+                self._accesses[key] = (max(previous[0], last_access), previous[1] + hits)
+
+    def flush(self) -> None:
+        with self._lock:
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+            if self._pending or self._accesses:
+                rows = []
+                for key, entry in self._pending.items():
+                    try:
+                        rows.append(self._entry_to_row(key, entry))
+                    except (KeyError, ValueError, TypeError, AttributeError) as e:
+                        # Drop the entry rather than losing the rest of the batch
+                        self.logger.error(f"Dropping unstorable cache entry {key}: {e}")
+                updates = [(last_access, hits, key) for key, (last_access, hits) in self._accesses.items()]
+                with self._conn:
+                    self._conn.executemany(
+                        "INSERT OR REPLACE INTO responses "
+                        "(key, timestamp, model, prompt, response, parameters, size, last_access, hits) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, 0)",
+                        rows
+                    )
+                    self._conn.executemany(
+                        "UPDATE responses SET last_access = MAX(last_access, ?), hits = hits + ? WHERE key = ?",
+                        updates
+                    )
+                self._pending.clear()
+                self._accesses.clear()
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._pending.pop(key, None)
+            with self._conn:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+
+    def purge_expired(self, cutoff: datetime, limit: Optional[int] = None) -> Tuple[int, int]:
+        with self._lock:
+            self.flush()
+            rows = self._conn.execute(
+                "SELECT key, size FROM responses WHERE timestamp < ? ORDER BY timestamp LIMIT ?",
+                (cutoff.timestamp(), -1 if limit is None else limit)
+            ).fetchall()
+            return self._delete_rows(rows)
+
+    def usage(self) -> Tuple[int, int]:
+        with self._lock:
+            self.flush()
+            entries, total_bytes = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+        return entries, total_bytes
+
+    def evict(
+        self,
+        max_entries: Optional[int],
+        max_bytes: Optional[int],
+        policy: EvictionPolicy = "lru",
+        limit: Optional[int] = None
+    ) -> Tuple[int, int]:
+        order = "hits, last_access" if policy == "lfu" else "last_access"
+        with self._lock:
+            entries, total_bytes = self.usage()
+            victims = []
+            cursor = self._conn.execute(f"SELECT key, size FROM responses ORDER BY {order}")
+            for key, size in cursor:
+                over_entries = max_entries is not None and entries > max_entries
+                over_bytes = max_bytes is not None and total_bytes > max_bytes
+                if not (over_entries or over_bytes) or (limit is not None and len(victims) >= limit):
+                    break
+                victims.append((key, size))
+                entries -= 1
+                total_bytes -= size
+            cursor.close()
+            return self._delete_rows(victims)
+
+    def _delete_rows(self, rows: List[Tuple[str, int]]) -> Tuple[int, int]:
+        """Delete rows by key and return how many were removed and their total size."""
+        if not rows:
+            return 0, 0
+        with self._conn:
+            self._conn.executemany("DELETE FROM responses WHERE key = ?", [(key,) for key, _ in rows])
+        return len(rows), sum(size for _, size in rows)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._pending.clear()
+            self._accesses.clear()
+            with self._conn:
+                self._conn.execute("DELETE FROM responses")
+
+    def entries(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        with self._lock:
+            self.flush()
+            rows = self._conn.execute(
+                "SELECT key, timestamp, model, prompt, response, parameters FROM responses"
+            ).fetchall()
+        for row in rows:
+            yield row[0], self._row_to_entry(row[1:])
+
+    def close(self) -> None:
+        with self._lock:
+            self.flush()
+            self._conn.close()
+
+    @staticmethod
+    def _entry_to_row(key: str, entry: Dict[str, Any]) -> Tuple[Any, ...]:
+        """Convert an entry to a database row."""
+        timestamp = datetime.fromisoformat(entry["timestamp"]).timestamp()
+        model = entry.get("model", "")
+        prompt = entry.get("prompt", "")
+        parameters = json.dumps(entry.get("parameters", {}), sort_keys=True)
+        size = sum(len(value.encode("utf-8")) for value in (key, model, prompt, entry["response"], parameters))
+        return (key, timestamp, model, prompt, entry["response"], parameters, size, timestamp)
+
+    @staticmethod
+    def _row_to_entry(row: Tuple[Any, ...]) -> Dict[str, Any]:
+        """Convert a database row to an entry."""
+        timestamp, model, prompt, response, parameters = row
+        return {
+            "timestamp": datetime.fromtimestamp(timestamp).isoformat(),
+            "model": model,
+            "prompt": prompt,
+            "response": response,
+            "parameters": json.loads(parameters)
+        }
+
+def migrate_cache(source: CacheBackend, target: CacheBackend, batch_size: int = 500) -> int:
+    """Copy every entry from one backend into another.
+
+    Entries that are missing required fields, have an unparseable timestamp
+    or a response that is not a string are skipped and counted in a warning.
+
+    Args:
+        source: Backend to read from, e.g. a FileCacheBackend over output/cache
+        target: Backend to write to, e.g. a SQLiteCacheBackend
+        batch_size: Number of entries written per transaction when supported
+
+    Returns:
+        Number of entries migrated
+    """
+    logger = logging.getLogger(__name__)
+    batch: Dict[str, Dict[str, Any]] = {}
+    migrated = 0
+    skipped = 0
+
+    for key, entry in source.entries():
+        try:
+            _check_entry(entry)
+        except ValueError as e:
+            logger.warning(f"Skipping invalid cache entry {key}: {e}")
+            skipped += 1
+            continue
+        batch[key] = entry
+        migrated += 1
+        if len(batch) >= batch_size:
+            target.write_many(batch)
+            batch.clear()
+
+    if batch:
+        target.write_many(batch)
+    target.flush()
+    if skipped:
+        logger.warning(f"Skipped {skipped} invalid cache entries")
+    return migrated
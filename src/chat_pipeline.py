@@ -0,0 +1,236 @@
+"""Streaming chat pipeline that reports moderation, tokens and audio as they happen."""
+
+import asyncio
+from contextlib import aclosing
+import json
+import logging
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional
+from pydantic import BaseModel
+from src.admission import AdmissionController, AdmissionRejected
+from src.benchmarks import PerformanceMetrics
+from src.config import PipelineConfig
+from src.llm import LLMClient, StreamError
+from src.moderation import ContentModerator
+from src.segmenter import SentenceSegmenter
+from src.tts import TTSClient
+
+class ChatEvent(BaseModel):
+    """One step of a streamed chat turn.
+
+    ``event`` is one of "moderation", "token", "audio", "error" or "summary".
+    """
+    event: str
+    data: Dict[str, Any]
+
+def encode_sse(event: ChatEvent) -> bytes:
+    """Encode an event as a Server-Sent Events message."""
+    return f"event: {event.event}\ndata: {json.dumps(event.data)}\n\n".encode()
+
+class ChatPipeline:
+    """Moderates a message, streams the LLM reply and synthesises it sentence by sentence.
+
+    Events are produced into a queue of ``event_buffer`` entries and
+    sentence segments wait for TTS in a queue of ``segment_buffer`` entries.
+    When the consumer or TTS falls behind, the full queue stops pulling from
+    the LLM stream, which reads at most ``stream_buffer`` tokens ahead of it
+    before pausing Ollama. Closing the event iterator cancels all outstanding
+    work.
+    """
+
+    def __init__(
+        self,
+        moderator: ContentModerator,
+        llm_client: LLMClient,
+        tts_client: TTSClient,
+        admission: AdmissionController,
+        segmenter: SentenceSegmenter,
+        event_buffer: int = 64,
+        segment_buffer: int = 4,
+        voice: Optional[str] = None
+    ):
+        """Initialize the pipeline.
+
+        Args:
+            moderator: Checks the message before anything is generated
+            llm_client: Streams the reply
+            tts_client: Synthesises each segment
+            admission: Limits concurrent LLM requests
+            segmenter: Splits the reply into segments for a single turn
+            event_buffer: Events held for a slow consumer
+            segment_buffer: Segments waiting for TTS
+            voice: Voice to speak with, the TTS default if omitted
+        """
+        self.moderator = moderator
+        self.llm_client = llm_client
+        self.tts_client = tts_client
+        self.admission = admission
+        self.segmenter = segmenter
+        self.event_buffer = event_buffer
+        self.segment_buffer = segment_buffer
+        self.voice = voice
+        self.logger = logging.getLogger(__name__)
+
+    @classmethod
+    def from_config(
+        cls,
+        config: PipelineConfig,
+        moderator: ContentModerator,
+        llm_client: LLMClient,
+        tts_client: TTSClient,
+        admission: AdmissionController,
+        segmenter: SentenceSegmenter,
+        voice: Optional[str] = None
+    ) -> "ChatPipeline":
+        """Create a pipeline for one turn from the pipeline configuration."""
+        return cls(
+            moderator,
+            llm_client,
+            tts_client,
+            admission,
+            segmenter,
+            event_buffer=config.event_buffer,
+            segment_buffer=config.segment_buffer,
+            voice=voice
+        )
+
+    async def events(self, content: str, session_id: Optional[str] = None) -> AsyncIterator[ChatEvent]:
+        """Run one chat turn.
+
+        Args:
+            content: The user's message
+            session_id: Conversation to continue
+
+        Yields:
+            Events in the order they happen, ending with a summary
+        """
+        queue: "asyncio.Queue[Optional[ChatEvent]]" = asyncio.Queue(maxsize=self.event_buffer)
+        start_time = time.perf_counter()
+        producer = asyncio.create_task(self._produce(content, session_id, queue))
+        try:
+            while True:
+                event = await queue.get()
+                if event is None:
+                    break
+                yield event
+        finally:
+            if not producer.done():
+                # The consumer went away, so nobody will see the rest of the turn
+                producer.cancel()
+                await asyncio.gather(producer, return_exceptions=True)
+                PerformanceMetrics().record_metric(
+                    "chat_cancelled_work",
+                    time.perf_counter() - start_time,
+                    {"stage": "stream"}
+                )
+
+    async def _produce(self, content: str, session_id: Optional[str], queue: "asyncio.Queue[Optional[ChatEvent]]") -> None:
+        """Run the turn into the queue, ending it with None unless cancelled."""
+        try:
+            await self._run(content, session_id, queue)
+        except Exception as e:
+            self.logger.error(f"Chat pipeline failed: {e}")
+            await queue.put(ChatEvent(event="error", data={"error": str(e), "status_code": 500}))
+        await queue.put(None)
+
+    async def _run(self, content: str, session_id: Optional[str], queue: "asyncio.Queue[Optional[ChatEvent]]") -> None:
+        """Moderate, generate and synthesise, emitting an event for every step."""
+        start_time = time.perf_counter()
+        timings: Dict[str, float] = {}
+        text_parts: List[str] = []
+        audio_urls: List[str] = []
+
+        async def summary(error: Optional[str] = None) -> None:
+            timings["total"] = time.perf_counter() - start_time
+            await queue.put(ChatEvent(event="summary", data={
+                "text": "".join(text_parts),
+                "audio_urls": audio_urls,
+                "error": error,
+                "timings": timings
+            }))
+
+        moderation_result = await self.moderator.moderate(content)
+        timings["moderation"] = time.perf_counter() - start_time
+        await queue.put(ChatEvent(event="moderation", data=moderation_result.model_dump()))
+        if not moderation_result.is_safe:
+            await queue.put(ChatEvent(event="error", data={"error": "Content moderation failed", "status_code": 400}))
+            await summary("Content moderation failed")
+            return
+
+        segments: "asyncio.Queue[Optional[str]]" = asyncio.Queue(maxsize=self.segment_buffer)
+        speaker = asyncio.create_task(self._speak(segments, queue, audio_urls, timings, start_time))
+        llm_error = None
+        try:
+            llm_start = time.perf_counter()
+            async with self.admission.admit(self.llm_client.model):
+                # Close the stream as soon as the turn stops, releasing the Ollama request
+                async with aclosing(self.llm_client.generate_stream(content, session_id=session_id)) as stream:
+                    async for chunk in stream:
+                        if isinstance(chunk, StreamError):
+                            llm_error = chunk.message
+                            break
+                        if not text_parts:
+                            timings["time_to_first_token"] = time.perf_counter() - start_time
+                        text_parts.append(chunk)
+                        await queue.put(ChatEvent(event="token", data={"text": chunk}))
+                        for segment in self.segmenter.feed(chunk):
+                            await segments.put(segment)
+            if llm_error is None:
+                for segment in self.segmenter.close():
+                    await segments.put(segment)
+            timings["llm"] = time.perf_counter() - llm_start
+            await segments.put(None)
+            await speaker
+        except AdmissionRejected as e:
+            await queue.put(ChatEvent(
+                event="error",
+                data={"error": str(e), "status_code": e.status_code, "retry_after": e.retry_after}
+            ))
+            await summary(str(e))
+            return
+        finally:
+            if not speaker.done():
+                speaker.cancel()
+                await asyncio.gather(speaker, return_exceptions=True)
+
+        if llm_error is not None:
+            await queue.put(ChatEvent(event="error", data={"error": llm_error, "status_code": 502}))
+        await summary(llm_error)
+
+    async def _speak(
+        self,
+        segments: "asyncio.Queue[Optional[str]]",
+        queue: "asyncio.Queue[Optional[ChatEvent]]",
+        audio_urls: List[str],
+        timings: Dict[str, float],
+        start_time: float
+    ) -> None:
+        """Synthesise segments in order as they arrive, emitting an audio event for each."""
+        timings["tts"] = 0.0
+        index = 0
+        while True:
+            segment = await segments.get()
+            if segment is None:
+                return
+            tts_start = time.perf_counter()
+            tts_response = await self.tts_client.generate(segment, voice=self.voice)
+            timings["tts"] += time.perf_counter() - tts_start
+            if tts_response.error:
+                await queue.put(ChatEvent(
+                    event="error",
+                    data={"error": tts_response.error, "status_code": 500, "text": segment}
+                ))
+                continue
+            if "time_to_first_audio" not in timings:
+                timings["time_to_first_audio"] = time.perf_counter() - start_time
+                PerformanceMetrics().record_metric(
+                    "chat_time_to_first_audio",
+                    timings["time_to_first_audio"],
+                    {"model": self.llm_client.model}
+                )
+            audio_urls.append(tts_response.audio_url)
+            await queue.put(ChatEvent(
+                event="audio",
+                data={"index": index, "url": tts_response.audio_url, "text": segment}
+            ))
+            index += 1
@@ -13,25 +13,103 @@ class MacConfig(BaseModel):
     batch_size: int = Field(default=1, gt=0)  # Must be positive
     model_path: str | None = None  # Optional path to local model files
 
+class RetryConfig(BaseModel):
+    """Configuration for retrying and hedging LLM requests."""
+    max_attempts: int = Field(default=3, gt=0)  # Attempts per request including the first
+    base_delay: float = Field(default=0.2, ge=0)  # Backoff cap in seconds for the first retry
+    max_delay: float = Field(default=2.0, ge=0)  # Upper bound on any backoff in seconds
+    retry_statuses: list[int] = Field(default_factory=lambda: [429, 502, 503, 504])
+    budget_ratio: float = Field(default=0.2, ge=0)  # Retries allowed per request on average
+    budget_min_tokens: float = Field(default=10.0, ge=0)  # Retries available before any traffic
+    hedge: bool = False  # Send a duplicate request to another host when the first one is slow
+    hedge_percentile: float = Field(default=95.0, gt=0, le=100)  # Time to first token percentile used as delay
+    hedge_min_delay: float = Field(default=0.05, ge=0)
+    hedge_initial_delay: float = Field(default=1.0, ge=0)  # Delay used until enough samples are collected
+
+class ResidencyConfig(BaseModel):
+    """Configuration for keeping models loaded in Ollama."""
+    preload_models: list[str] = Field(default_factory=list)  # Models warmed on startup, the default model if empty
+    preload_on_startup: bool = True
+    keep_alive: float = 1800.0  # Seconds Ollama keeps an idle model loaded, negative keeps it loaded indefinitely
+    warmup_prompt: str = "Hello"  # Short generation run after loading, empty only loads the model
+    warmup_timeout: float = Field(default=120.0, gt=0)  # Seconds allowed for loading and warming a model
+
 class LLMConfig(BaseModel):
     """Configuration for LLM settings."""
     base_url: str = "http://localhost:11434"
+    base_urls: list[str] = Field(default_factory=list)  # Several Ollama hosts to route across, overrides base_url
+    eject_after_failures: int = Field(default=3, gt=0)  # Consecutive failures before a host is skipped
+    eject_duration: float = Field(default=30.0, ge=0)  # Seconds an ejected host is skipped
+    model_affinity: bool = False  # Keep sending a model to the host that served it last
+    health_check_interval: float = Field(default=10.0, gt=0)  # Seconds between host health checks
+    retry: RetryConfig = RetryConfig()
+    residency: ResidencyConfig = ResidencyConfig()
     model: str = "phi"
     temperature: float = Field(default=0.7, ge=0.0, le=1.0)
     top_p: float = Field(default=0.9, ge=0.0, le=1.0)
     max_tokens: int = Field(default=2048, gt=0)
+    max_connections: int = Field(default=100, gt=0)  # Upper bound on open connections to Ollama
+    max_keepalive_connections: int = Field(default=20, ge=0)  # Idle connections kept in the pool
+    keepalive_expiry: float = Field(default=30.0, gt=0)  # Seconds an idle connection is kept open
+    http2: bool = False  # Requires the optional h2 package
+    stream_buffer: int = Field(default=32, gt=0)  # Tokens read from Ollama ahead of the slowest stream consumer
+    replay_word_chunks: bool = True  # Stream cached responses word by word instead of in one chunk
+    context_max_sessions: int = Field(default=256, ge=0)  # Conversations whose Ollama context is kept
+    context_max_tokens: int = Field(default=1_000_000, ge=0)  # Context tokens kept across all conversations
+    context_max_turns: int = Field(default=20, gt=0)  # Turns replayed as a prompt once a context is evicted
+
+class CacheConfig(BaseModel):
+    """Configuration for the LLM response cache."""
+    backend: Literal["file", "sqlite"] = "file"
+    cache_dir: str = "output/cache"  # Used by the file backend
+    sqlite_path: str = "output/cache.db"  # Used by the sqlite backend
+    ttl_hours: float = Field(default=24, gt=0)
+    memory_max_entries: int = Field(default=1024, ge=0)
+    memory_max_bytes: int = Field(default=16 * 1024 * 1024, ge=0)
+    max_entries: int | None = Field(default=None, gt=0)  # Backend entry budget, unbounded if None
+    max_bytes: int | None = Field(default=None, gt=0)  # Backend size budget, unbounded if None
+    eviction_policy: Literal["lru", "lfu"] = "lru"
+    sweep_interval: float = Field(default=300.0, gt=0)  # Seconds between background sweeps
+    sweep_batch_size: int = Field(default=500, gt=0)  # Entries removed per sweep batch
+
+class AdmissionConfig(BaseModel):
+    """Configuration for admission control in front of the LLM."""
+    max_concurrency: int = Field(default=4, gt=0)  # Concurrent requests per model
+    model_concurrency: dict[str, int] = Field(default_factory=dict)  # Per-model overrides of max_concurrency
+    max_queue: int = Field(default=32, ge=0)  # Requests allowed to wait per model before returning 429
+    queue_timeout: float = Field(default=10.0, ge=0)  # Seconds a request may wait before returning 503
 
 class TTSConfig(BaseModel):
     """Configuration for TTS settings."""
     base_url: str = "http://localhost:5000"
     voice: str = "alloy"
     model: str = "csm-1b"
+    audio_dir: str = "output/audio"  # Where generated speech is written and served from
+    audio_cache_max_age: int = Field(default=31_536_000, ge=0)  # Seconds clients may cache audio with hashed names
+    segment_min_chars: int = Field(default=20, ge=0)  # Shorter sentences are joined with the next one
+    segment_max_chars: int = Field(default=250, gt=0)  # Longer sentences are split at a clause or word
+    first_segment_fast: bool = True  # Emit the first clause early so speech can start sooner
+    first_segment_min_chars: int = Field(default=8, ge=0)  # Minimum length of that first clause
+
+class ModerationConfig(BaseModel):
+    """Configuration for content moderation."""
+    speculative: bool = False  # Start generating while moderation runs, releasing nothing until it passes
+
+class PipelineConfig(BaseModel):
+    """Configuration for streaming chat responses."""
+    event_buffer: int = Field(default=64, gt=0)  # Events held for a slow client before generation pauses
+    segment_buffer: int = Field(default=4, gt=0)  # Segments waiting for TTS before generation pauses
+    audio_frame_bytes: int = Field(default=16384, gt=0)  # Size of binary audio frames sent over WebSockets
 
 class Config(BaseModel):
     """Main configuration class."""
     mac: MacConfig = MacConfig()
     llm: LLMConfig = LLMConfig()
     tts: TTSConfig = TTSConfig()
+    cache: CacheConfig = CacheConfig()
+    admission: AdmissionConfig = AdmissionConfig()
+    pipeline: PipelineConfig = PipelineConfig()
+    moderation: ModerationConfig = ModerationConfig()
     
     @classmethod
     def load(cls) -> "Config":
@@ -44,10 +122,21 @@ class Config(BaseModel):
             ),
             llm=LLMConfig(
                 base_url=os.getenv("OLLAMA_BASE_URL", "http://localhost:11434"),
-                model=os.getenv("LLM_MODEL", "phi")
+                base_urls=[url for url in os.getenv("OLLAMA_BASE_URLS", "").split(",") if url],
+                model=os.getenv("LLM_MODEL", "phi"),
+                residency=ResidencyConfig(
+                    preload_models=[model for model in os.getenv("LLM_PRELOAD_MODELS", "").split(",") if model]
+                )
             ),
             tts=TTSConfig(
                 base_url=os.getenv("TTS_BASE_URL", "http://localhost:5000"),
                 voice=os.getenv("TTS_VOICE", "alloy")
+            ),
+            cache=CacheConfig(
+                backend=os.getenv("CACHE_BACKEND", "file"),
+                sqlite_path=os.getenv("CACHE_SQLITE_PATH", "output/cache.db")
+            ),
+            moderation=ModerationConfig(
+                speculative=os.getenv("MODERATION_SPECULATIVE", "false").lower() == "true"
             )
         ) 
\ No newline at end of file
@@ -1,10 +1,97 @@
-from typing import Dict, Any, AsyncGenerator, Optional
-import json
+from typing import Dict, Any, AsyncGenerator, AsyncIterator, Iterable, List, Optional, Set, Tuple
+import asyncio
+from contextlib import aclosing, asynccontextmanager
+import copy
+import logging
+import re
+import time
 import httpx
 from pydantic import BaseModel
 from src.config import Config, LLMConfig
-from src.benchmarks import benchmark, get_system_metrics
+from src.backend_pool import Backend, BackendPool
+from src.benchmarks import PerformanceMetrics, StreamTimer, benchmark, get_system_metrics
 from src.cache import ResponseCache
+from src.ndjson import aiter_ndjson
+from src.residency import ModelResidency
+from src.retry import HedgePolicy, RetryPolicy
+from src.session_context import SessionContextStore
+from src.singleflight import SingleFlight
+
+try:
+    import h2  # noqa: F401  # Optional dependency required for HTTP/2
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# A word together with the whitespace that follows it
+_WORD_CHUNK = re.compile(r"\s*\S+\s*")
+
+def split_word_chunks(text: str) -> List[str]:
+    """Split text into word-sized chunks that join back into the original text."""
+    return _WORD_CHUNK.findall(text) or [text]
+
+def ollama_timings(final_chunk: Dict[str, Any]) -> Dict[str, Any]:
+    """Derive model-side timings from the final chunk of an Ollama stream.
+    
+    Ollama reports durations in nanoseconds. The time to first token is the
+    model load time plus the prompt evaluation time, as measured by Ollama
+    rather than by this client.
+    
+    Args:
+        final_chunk: The chunk marked ``"done": true``
+        
+    Returns:
+        Timings in seconds and throughput in tokens per second, only for the
+        fields Ollama reported
+    """
+    timings: Dict[str, Any] = {}
+    durations = {
+        "total_duration": final_chunk.get("total_duration"),
+        "load_duration": final_chunk.get("load_duration"),
+        "prompt_eval_duration": final_chunk.get("prompt_eval_duration"),
+        "eval_duration": final_chunk.get("eval_duration"),
+    }
+    for name, nanoseconds in durations.items():
+        if nanoseconds is not None:
+            timings[name] = nanoseconds / 1e9
+    for name in ("prompt_eval_count", "eval_count"):
+        if final_chunk.get(name) is not None:
+            timings[name] = final_chunk[name]
+    
+    if timings.get("eval_count") and timings.get("eval_duration"):
+        timings["tokens_per_second"] = timings["eval_count"] / timings["eval_duration"]
+    if timings.get("prompt_eval_count") and timings.get("prompt_eval_duration"):
+        timings["prompt_tokens_per_second"] = timings["prompt_eval_count"] / timings["prompt_eval_duration"]
+    if "load_duration" in timings:
+        timings["load_time"] = timings["load_duration"]
+    if "prompt_eval_duration" in timings:
+        timings["model_time_to_first_token"] = timings.get("load_duration", 0.0) + timings["prompt_eval_duration"]
+    return timings
+
+class OllamaHTTPError(Exception):
+    """Ollama answered with a non-200 status."""
+    def __init__(self, status_code: int, text: str):
+        super().__init__(f"HTTP error {status_code}: {text}")
+        self.status_code = status_code
+        self.text = text
+
+class StreamError(str):
+    """An "Error: ..." message yielded by generate_stream in place of tokens.
+    
+    It is still a string for callers that simply print the stream, but can be
+    told apart from a reply that happens to start with "Error:".
+    """
+    
+    @property
+    def message(self) -> str:
+        """The error without its "Error:" prefix."""
+        return self[len("Error:"):].strip()
+
+class _Attempt:
+    """One upstream request and the backend serving it."""
+    def __init__(self, exclude: Optional[Backend] = None):
+        self.exclude = exclude  # Backend to avoid, used when hedging
+        self.backend: Optional[Backend] = None
 
 class LLMResponse:
     """Response from LLM service."""
@@ -17,91 +104,500 @@ class LLMResponse:
 class LLMClient:
     """Client for LLM service."""
     
-    def __init__(self, config: LLMConfig):
+    def __init__(self, config: LLMConfig, cache: Optional[ResponseCache] = None):
         self.config = config
-        self.base_url = config.base_url
+        self.backends = BackendPool.from_config(config)
         self.model = config.model or "mistral"  # Default to mistral
         self.timeout = 30.0  # Default timeout in seconds
-        self.cache = ResponseCache()
+        self.cache = cache or ResponseCache()
+        self.logger = logging.getLogger(__name__)
+        self._http_client: Optional[httpx.AsyncClient] = None
+        # Client that owns the connection pool, set on the per-model clients from for_model
+        self._owner: Optional["LLMClient"] = None
+        # Identical concurrent requests share a single upstream generation
+        self._singleflight = SingleFlight(
+            on_coalesced=self._record_coalesced,
+            stream_buffer=config.stream_buffer
+        )
+        # Ollama contexts of ongoing conversations, reused on the next turn
+        self.sessions = SessionContextStore(
+            max_sessions=config.context_max_sessions,
+            max_tokens=config.context_max_tokens,
+            max_turns=config.context_max_turns
+        )
+        self.retry_policy = RetryPolicy.from_config(config.retry)
+        self.hedge_policy = HedgePolicy.from_config(config.retry)
+        # Models loaded on each host, so switching and startup can warm them before user requests
+        self.residency = ModelResidency.from_config(config)
+    
+    @property
+    def base_url(self) -> str:
+        """URL of the first backend, the only one unless several hosts are configured."""
+        return self.backends.backends[0].url
+    
+    @base_url.setter
+    def base_url(self, url: str) -> None:
+        """Route all requests to a single host."""
+        self.backends = BackendPool.from_config(self.config.model_copy(update={"base_url": url, "base_urls": []}))
+    
+    @property
+    def http_client(self) -> httpx.AsyncClient:
+        """Shared HTTP client, created lazily so connections are pooled across requests."""
+        return self._ensure_http_client()
+    
+    def _ensure_http_client(self) -> httpx.AsyncClient:
+        """Create the pooled HTTP client if it does not exist or has been closed."""
+        if self._owner is not None:
+            # Per-model clients keep using the owner's pool, even once it has been recreated
+            return self._owner._ensure_http_client()
+        if self._http_client is None or self._http_client.is_closed:
+            http2 = self.config.http2
+            if http2 and not HTTP2_AVAILABLE:
+                self.logger.warning("HTTP/2 requested but the h2 package is not installed, using HTTP/1.1")
+                http2 = False
+            self._http_client = httpx.AsyncClient(
+                timeout=self.timeout,
+                http2=http2,
+                limits=httpx.Limits(
+                    max_connections=self.config.max_connections,
+                    max_keepalive_connections=self.config.max_keepalive_connections,
+                    keepalive_expiry=self.config.keepalive_expiry
+                )
+            )
+        return self._http_client
+    
+    async def start(self) -> None:
+        """Open the shared HTTP client, start health checks when routing across hosts and preload models."""
+        self._ensure_http_client()
+        if len(self.backends.backends) > 1:
+            self.backends.start(self._check_backend)
+        if self.residency.preload_on_startup:
+            await self.preload()
+    
+    async def aclose(self) -> None:
+        """Close the shared HTTP client and the response cache, flushing buffered cache writes."""
+        await self.backends.stop()
+        if self._http_client is not None:
+            await self._http_client.aclose()
+            self._http_client = None
+        # Also stops the cache's I/O pool and write-behind thread
+        await asyncio.to_thread(self.cache.close)
     
     def set_model(self, model: str) -> None:
         """Set the model to use."""
         self.model = model
     
-    @benchmark("llm_generate")
-    async def generate(self, prompt: str) -> LLMResponse:
-        """Generate a response from the LLM."""
-        if not prompt:
-            return LLMResponse(text="", error="Prompt cannot be empty")
+    def for_model(self, model: str) -> "LLMClient":
+        """Return a client for another model that shares this client's connections, cache, sessions and routing.
         
-        # Check cache first
-        cache_params = {
+        Lets a single caller use its own model without switching the model
+        for everyone else.
+        """
+        if model == self.model:
+            return self
+        client = copy.copy(self)
+        client.model = model
+        client._owner = self._owner or self
+        client._http_client = None
+        return client
+    
+    async def preload(self, models: Optional[List[str]] = None) -> bool:
+        """Load and warm models on every host where they are not already hot.
+        
+        Args:
+            models: Models to warm, defaults to the configured preload models
+            
+        Returns:
+            Whether every model is hot on every host
+        """
+        urls = [backend.url for backend in self.backends.backends]
+        results = await asyncio.gather(*(
+            self.residency.ensure(model, urls, self._warm_model)
+            for model in (models or self.residency.preload_models)
+        ))
+        return all(results)
+    
+    async def switch_model(self, model: str) -> bool:
+        """Warm a model and then make it the one used for requests.
+        
+        The switch happens even if warming fails, in which case the next
+        request loads the model instead.
+        
+        Args:
+            model: Model to switch to
+            
+        Returns:
+            Whether the model was hot on every host before the switch
+        """
+        hot = await self.preload([model])
+        self.set_model(model)
+        return hot
+    
+    async def _warm_model(self, url: str, model: str) -> None:
+        """Load a model on a host and run a one-token generation so its first real request is fast."""
+        residency = self.config.residency
+        request = {
+            "model": model,
+            "prompt": residency.warmup_prompt,
+            "stream": True,
+            "keep_alive": residency.keep_alive,
+            "options": {"num_predict": 1}
+        }
+        start_time = time.perf_counter()
+        final_chunk: Dict[str, Any] = {}
+        async with self.http_client.stream(
+            "POST",
+            f"{url}/api/generate",
+            json=request,
+            timeout=residency.warmup_timeout
+        ) as response:
+            if response.status_code != 200:
+                await response.aread()
+                raise OllamaHTTPError(response.status_code, response.text)
+            async for chunk in aiter_ndjson(response.aiter_bytes()):
+                if chunk.get("done"):
+                    final_chunk = chunk
+        
+        timings = ollama_timings(final_chunk)
+        metadata = {"model": model, "backend": url}
+        if "load_time" in timings:
+            metadata["load_time"] = timings["load_time"]
+        PerformanceMetrics().record_metric("llm_model_warmup_time", time.perf_counter() - start_time, metadata)
+    
+    def _build_request(self, prompt: str, context: Optional[List[int]] = None) -> Dict[str, Any]:
+        """Build the Ollama /api/generate request body for a prompt."""
+        request = {
+            "model": self.model,
+            "prompt": prompt,
+            "stream": True,
+            "keep_alive": self.config.residency.keep_alive,
+            "options": {
+                "temperature": self.config.temperature,
+                "top_p": self.config.top_p,
+                "num_predict": self.config.max_tokens
+            }
+        }
+        if context is not None:
+            request["context"] = context
+        return request
+    
+    @asynccontextmanager
+    async def _open_stream(
+        self,
+        prompt: str,
+        context: Optional[List[int]] = None,
+        attempt: Optional[_Attempt] = None
+    ) -> AsyncIterator[httpx.Response]:
+        """Open a streaming request on the least busy backend so tokens are read as Ollama emits them."""
+        model = self.model
+        async with self.backends.lease(model, attempt.exclude if attempt else None) as backend:
+            if attempt is not None:
+                attempt.backend = backend
+            start_time = time.perf_counter()
+            async with self.http_client.stream(
+                "POST",
+                f"{backend.url}/api/generate",
+                json=self._build_request(prompt, context),
+                timeout=self.timeout
+            ) as response:
+                # Route on time to headers, since the body's length depends on the answer
+                self.backends.record_latency(backend, time.perf_counter() - start_time, model)
+                if response.status_code >= 500:
+                    self.backends.record_failure(backend)
+                yield response
+            if response.status_code == 200:
+                self.residency.mark_used(backend.url, model)
+    
+    async def _chunks(
+        self,
+        prompt: str,
+        context: Optional[List[int]],
+        attempt: Optional[_Attempt] = None
+    ) -> AsyncGenerator[Dict[str, Any], None]:
+        """Decoded NDJSON chunks of a single request to Ollama."""
+        async with self._open_stream(prompt, context, attempt) as response:
+            if response.status_code != 200:
+                await response.aread()
+                raise OllamaHTTPError(response.status_code, response.text)
+            async for chunk in aiter_ndjson(response.aiter_bytes()):
+                yield chunk
+    
+    def _is_retryable(self, error: BaseException) -> bool:
+        """Whether a failure before the first chunk is worth another attempt."""
+        if isinstance(error, OllamaHTTPError):
+            return error.status_code in self.config.retry.retry_statuses
+        return isinstance(error, (httpx.TimeoutException, httpx.NetworkError, httpx.RemoteProtocolError))
+    
+    async def _resilient_chunks(self, prompt: str, context: Optional[List[int]]) -> AsyncGenerator[Dict[str, Any], None]:
+        """Chunks of a request that is retried and optionally hedged until its first chunk arrives.
+        
+        Failures after the first chunk are not retried, since the caller has
+        already seen part of the response.
+        """
+        self.retry_policy.budget.deposit()
+        attempt_number = 1
+        while True:
+            try:
+                chunks, first_chunk = await self._first_chunk(prompt, context)
+                break
+            except Exception as e:
+                if not self._is_retryable(e) or not self.retry_policy.allow_retry(attempt_number):
+                    raise
+                delay = self.retry_policy.backoff(attempt_number)
+                self.logger.warning(
+                    f"LLM request failed with {type(e).__name__}, retrying in {delay:.2f}s (attempt {attempt_number + 1})"
+                )
+                PerformanceMetrics().record_metric(
+                    "llm_retries",
+                    attempt_number,
+                    {"model": self.model, "error": type(e).__name__}
+                )
+                attempt_number += 1
+                await asyncio.sleep(delay)
+        
+        try:
+            if first_chunk is not None:
+                yield first_chunk
+            async for chunk in chunks:
+                yield chunk
+        finally:
+            await chunks.aclose()
+    
+    async def _first_chunk(
+        self,
+        prompt: str,
+        context: Optional[List[int]]
+    ) -> Tuple[AsyncGenerator[Dict[str, Any], None], Optional[Dict[str, Any]]]:
+        """Start a request and wait for its first chunk, hedging it when it is slow.
+        
+        With hedging enabled and more than one backend, a duplicate request is
+        sent to another backend once the first has gone without a chunk for
+        the hedge delay. Whichever produces a chunk first wins and the other
+        request is cancelled.
+        
+        Returns:
+            The winning chunk iterator and its first chunk, None for an empty stream
+        """
+        start_time = time.perf_counter()
+        primary_attempt = _Attempt()
+        primary = self._chunks(prompt, context, primary_attempt)
+        primary_task = asyncio.ensure_future(self._next_chunk(primary))
+        contenders = {primary_task: primary}
+        hedged = False
+        try:
+            if self.config.retry.hedge and len(self.backends.backends) > 1:
+                done, _ = await asyncio.wait({primary_task}, timeout=self.hedge_policy.delay())
+                if not done:
+                    hedge = self._chunks(prompt, context, _Attempt(exclude=primary_attempt.backend))
+                    contenders[asyncio.ensure_future(self._next_chunk(hedge))] = hedge
+                    hedged = True
+            
+            error: Optional[BaseException] = None
+            while contenders:
+                done, _ = await asyncio.wait(contenders, return_when=asyncio.FIRST_COMPLETED)
+                # Prefer the primary when both finish together
+                for task in sorted(done, key=lambda t: t is not primary_task):
+                    chunks = contenders.pop(task)
+                    if task.exception() is not None:
+                        error = error or task.exception()
+                        continue
+                    if hedged:
+                        PerformanceMetrics().record_metric(
+                            "llm_hedged_requests",
+                            1,
+                            {"model": self.model, "winner": "primary" if task is primary_task else "hedge"}
+                        )
+                    self.hedge_policy.observe(time.perf_counter() - start_time)
+                    return chunks, task.result()
+            raise error
+        finally:
+            for task, chunks in contenders.items():
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+                await chunks.aclose()
+    
+    @staticmethod
+    async def _next_chunk(chunks: AsyncGenerator[Dict[str, Any], None]) -> Optional[Dict[str, Any]]:
+        """Next chunk of an iterator, or None once it is exhausted."""
+        try:
+            return await chunks.__anext__()
+        except StopAsyncIteration:
+            return None
+    
+    async def _check_backend(self, backend: Backend) -> bool:
+        """Health check a backend by listing its models."""
+        response = await self.http_client.get(f"{backend.url}/api/tags", timeout=5.0)
+        return response.status_code == 200
+    
+    def _session_request(self, session_id: Optional[str], prompt: str) -> Tuple[str, Optional[List[int]]]:
+        """Return the prompt and context to send for a conversation turn.
+        
+        A stored context lets Ollama skip re-evaluating earlier turns, so only
+        the new prompt is sent. Without one the recent turns are sent as a
+        full prompt instead. A context from another model, such as before a
+        model switch, is discarded in favour of the full prompt.
+        """
+        if session_id is None:
+            return prompt, None
+        context = self.sessions.get_context(session_id, self.model)
+        if context is not None:
+            return prompt, context
+        return self.sessions.build_prompt(session_id, prompt), None
+    
+    def _finish_session_turn(
+        self,
+        session_id: str,
+        prompt: str,
+        response_text: str,
+        final_chunk: Dict[str, Any],
+        context_reused: bool
+    ) -> None:
+        """Store the context returned for a turn and record its prompt evaluation time."""
+        self.sessions.update(session_id, prompt, response_text, final_chunk.get("context"), self.model)
+        prompt_eval_duration = final_chunk.get("prompt_eval_duration")
+        if prompt_eval_duration is None:
+            return
+        PerformanceMetrics().record_metric(
+            "llm_prompt_eval_time",
+            prompt_eval_duration / 1e9,  # Ollama reports durations in nanoseconds
+            {
+                "model": self.model,
+                "context_reused": context_reused,
+                "prompt_eval_count": final_chunk.get("prompt_eval_count")
+            }
+        )
+    
+    def _record_stream_timings(self, timer: StreamTimer) -> None:
+        """Record time to first token and inter-token latency for a request."""
+        if timer.time_to_first_token is None:
+            return
+        metrics = PerformanceMetrics()
+        metrics.record_metric(
+            "llm_time_to_first_token",
+            timer.time_to_first_token,
+            {"model": self.model}
+        )
+        if timer.inter_token_latency is not None:
+            metrics.record_metric(
+                "llm_inter_token_latency",
+                timer.inter_token_latency,
+                {"model": self.model, "token_count": timer.token_count}
+            )
+    
+    def _record_model_timings(self, timings: Dict[str, Any]) -> None:
+        """Record Ollama's throughput and latency figures for the current model."""
+        metrics = PerformanceMetrics()
+        for name in ("tokens_per_second", "prompt_tokens_per_second", "load_time", "model_time_to_first_token"):
+            if name in timings:
+                metrics.record_metric(f"llm_{name}", timings[name], {"model": self.model})
+    
+    def _cache_params(self) -> Dict[str, Any]:
+        """Generation parameters that make up the cache and coalescing key."""
+        return {
             "temperature": self.config.temperature,
             "top_p": self.config.top_p,
             "max_tokens": self.config.max_tokens
         }
-        cached_response = self.cache.get(self.model, prompt, **cache_params)
+    
+    def _record_coalesced(self, key: str) -> None:
+        """Record a request that was served by an already running generation."""
+        PerformanceMetrics().record_metric(
+            "llm_coalesced_requests",
+            1,
+            {"model": self.model, "key": key}
+        )
+    
+    @property
+    def coalesced_requests(self) -> int:
+        """Number of requests that joined an in-flight generation instead of starting one."""
+        return self._singleflight.coalesced
+    
+    @benchmark("llm_generate")
+    async def generate(self, prompt: str, session_id: Optional[str] = None) -> LLMResponse:
+        """Generate a response from the LLM.
+        
+        Args:
+            prompt: The user prompt
+            session_id: Conversation to continue. Responses within a conversation
+                depend on its history, so they bypass the response cache.
+        
+        Returns:
+            The generated response
+        """
+        if not prompt:
+            return LLMResponse(text="", error="Prompt cannot be empty")
+        
+        if session_id is not None:
+            return await self._generate_uncached(prompt, None, session_id)
+        
+        # Check cache first
+        cache_params = self._cache_params()
+        cached_response = await self.cache.aget(self.model, prompt, **cache_params)
         if cached_response is not None:
             return LLMResponse(text=cached_response, cached=True)
         
+        key = self.cache._compute_key(self.model, prompt, **cache_params)
+        return await self._singleflight.do(key, lambda: self._generate_uncached(prompt, cache_params))
+    
+    async def _generate_uncached(
+        self,
+        prompt: str,
+        cache_params: Optional[Dict[str, Any]],
+        session_id: Optional[str] = None
+    ) -> LLMResponse:
+        """Generate a response from Ollama and cache it on success."""
         try:
             start_metrics = get_system_metrics()
+            timer = StreamTimer()
+            request_prompt, context = self._session_request(session_id, prompt)
+            final_chunk: Dict[str, Any] = {}
             
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                response = await client.post(
-                    f"{self.base_url}/api/generate",
-                    json={
-                        "model": self.model,
-                        "prompt": prompt,
-                        "stream": True,
-                        "options": {
-                            "temperature": self.config.temperature,
-                            "top_p": self.config.top_p,
-                            "num_predict": self.config.max_tokens
-                        }
-                    }
+            # Process tokens as they arrive, joining the text once at the end
+            parts: List[str] = []
+            async for chunk in self._resilient_chunks(request_prompt, context):
+                if chunk.get("response"):
+                    timer.mark_token()
+                    parts.append(chunk["response"])
+                if chunk.get("done"):
+                    final_chunk = chunk
+            full_text = "".join(parts)
+            
+            if not full_text:
+                return LLMResponse(
+                    error="No response generated",
+                    metrics={"start_metrics": start_metrics}
                 )
-                
-                if response.status_code != 200:
-                    return LLMResponse(
-                        error=f"HTTP error {response.status_code}: {response.text}",
-                        metrics={"start_metrics": start_metrics}
-                    )
-                
-                # Process streaming response
-                full_text = ""
-                async for line in response.aiter_lines():
-                    if not line:
-                        continue
-                    try:
-                        chunk = json.loads(line)
-                        if chunk.get("response"):
-                            full_text += chunk["response"]
-                    except json.JSONDecodeError:
-                        continue
-                
-                if not full_text:
-                    return LLMResponse(
-                        error="No response generated",
-                        metrics={"start_metrics": start_metrics}
-                    )
-                
-                end_metrics = get_system_metrics()
-                metrics = {
-                    "start_metrics": start_metrics,
-                    "end_metrics": end_metrics,
-                    "memory_increase_mb": end_metrics["memory_mb"] - start_metrics["memory_mb"],
-                    "prompt_length": len(prompt),
-                    "response_length": len(full_text),
-                    "model": self.model
-                }
-                
+            
+            self._record_stream_timings(timer)
+            end_metrics = get_system_metrics()
+            metrics = {
+                "start_metrics": start_metrics,
+                "end_metrics": end_metrics,
+                "memory_increase_mb": end_metrics["memory_mb"] - start_metrics["memory_mb"],
+                "prompt_length": len(prompt),
+                "response_length": len(full_text),
+                "model": self.model,
+                **timer.summary()
+            }
+            timings = ollama_timings(final_chunk)
+            metrics.update(timings)
+            self._record_model_timings(timings)
+            
+            response_text = full_text.strip()
+            if session_id is not None:
+                self._finish_session_turn(session_id, prompt, response_text, final_chunk, context is not None)
+                metrics["context_reused"] = context is not None
+            else:
                 # Cache successful response
-                response_text = full_text.strip()
-                self.cache.set(self.model, prompt, response_text, **cache_params)
-                
-                return LLMResponse(text=response_text, metrics=metrics)
-                
+                await self.cache.aset(self.model, prompt, response_text, **cache_params)
+            
+            return LLMResponse(text=response_text, metrics=metrics)
+            
+        except OllamaHTTPError as e:
+            return LLMResponse(
+                error=str(e),
+                metrics={"start_metrics": start_metrics}
+            )
         except httpx.TimeoutException:
             return LLMResponse(
                 error="Request timed out: LLM service took too long to respond",
@@ -118,48 +614,148 @@ class LLMClient:
                 metrics={"start_metrics": start_metrics}
             )
     
+    async def generate_many(
+        self,
+        prompts: Iterable[str],
+        concurrency: int = 4,
+        ordered: bool = False
+    ) -> AsyncGenerator[Tuple[int, LLMResponse], None]:
+        """Generate responses for many prompts with a bounded number in flight.
+        
+        Every request goes through ``generate``, so the batch shares the
+        connection pool, backends, cache and request coalescing. Prompts are
+        read lazily, so large iterables are never materialised up front.
+        
+        Args:
+            prompts: Prompts to generate responses for
+            concurrency: Maximum number of requests in flight at once
+            ordered: Yield results in prompt order instead of as they complete
+            
+        Yields:
+            The index of each prompt and its response
+        """
+        if concurrency < 1:
+            raise ValueError("concurrency must be at least 1")
+        
+        pending: Set[asyncio.Task] = set()
+        finished: Dict[int, LLMResponse] = {}
+        next_index = 0
+        prompt_iter = enumerate(prompts)
+        exhausted = False
+        
+        async def run(index: int, prompt: str) -> Tuple[int, LLMResponse]:
+            return index, await self.generate(prompt)
+        
+        try:
+            while True:
+                while not exhausted and len(pending) < concurrency:
+                    item = next(prompt_iter, None)
+                    if item is None:
+                        exhausted = True
+                    else:
+                        pending.add(asyncio.create_task(run(*item)))
+                if not pending:
+                    break
+                
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    index, response = task.result()
+                    if not ordered:
+                        yield index, response
+                    else:
+                        finished[index] = response
+                while next_index in finished:
+                    yield next_index, finished.pop(next_index)
+                    next_index += 1
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+    
     @benchmark("llm_stream")
-    async def generate_stream(self, prompt: str) -> AsyncGenerator[str, None]:
-        """Generate a streaming response from the LLM."""
+    async def generate_stream(self, prompt: str, session_id: Optional[str] = None) -> AsyncGenerator[str, None]:
+        """Generate a streaming response from the LLM.
+        
+        Args:
+            prompt: The user prompt
+            session_id: Conversation to continue. Responses within a conversation
+                depend on its history, so they bypass the response cache.
+        
+        Yields:
+            Response tokens, or a single ``StreamError`` message on failure
+        """
         if not prompt:
-            yield "Error: Prompt cannot be empty"
+            yield StreamError("Error: Prompt cannot be empty")
             return
         
+        if session_id is not None:
+            async with aclosing(self._stream_tokens(prompt, None, session_id)) as tokens:
+                async for token in tokens:
+                    yield token
+            return
+        
+        cache_params = self._cache_params()
+        cached_response = await self.cache.aget(self.model, prompt, **cache_params)
+        if cached_response is not None:
+            for chunk in self._replay_chunks(cached_response):
+                yield chunk
+            return
+        
+        key = self.cache._compute_key(self.model, prompt, **cache_params)
+        async with aclosing(self._singleflight.stream(key, lambda: self._stream_tokens(prompt, cache_params))) as tokens:
+            async for token in tokens:
+                yield token
+    
+    def _replay_chunks(self, text: str) -> List[str]:
+        """Chunks used to replay a cached response to a streaming client."""
+        if self.config.replay_word_chunks:
+            return split_word_chunks(text)
+        return [text]
+    
+    async def _stream_tokens(
+        self,
+        prompt: str,
+        cache_params: Optional[Dict[str, Any]],
+        session_id: Optional[str] = None
+    ) -> AsyncGenerator[str, None]:
+        """Stream tokens from Ollama, reporting failures as error strings.
+        
+        The response is only cached once Ollama marks the stream as done, so
+        streams that fail or are abandoned part way through never reach the cache.
+        """
         try:
-            start_metrics = get_system_metrics()
+            timer = StreamTimer()
+            tokens: List[str] = []
+            request_prompt, context = self._session_request(session_id, prompt)
+            final_chunk: Optional[Dict[str, Any]] = None
             
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                response = await client.post(
-                    f"{self.base_url}/api/generate",
-                    json={
-                        "model": self.model,
-                        "prompt": prompt,
-                        "stream": True,
-                        "options": {
-                            "temperature": self.config.temperature,
-                            "top_p": self.config.top_p,
-                            "num_predict": self.config.max_tokens
-                        }
-                    }
-                )
-                
-                if response.status_code != 200:
-                    yield f"Error: HTTP {response.status_code}"
-                    return
-                
-                async for line in response.aiter_lines():
-                    if not line:
-                        continue
-                    try:
-                        chunk = json.loads(line)
-                        if chunk.get("response"):
-                            yield chunk["response"]
-                    except json.JSONDecodeError:
-                        continue
+            async with aclosing(self._resilient_chunks(request_prompt, context)) as chunks:
+                async for chunk in chunks:
+                    if chunk.get("response"):
+                        timer.mark_token()
+                        tokens.append(chunk["response"])
+                        yield chunk["response"]
+                    if chunk.get("done"):
+                        final_chunk = chunk
+            
+            self._record_stream_timings(timer)
+            response_text = "".join(tokens).strip()
+            if final_chunk is None:
+                return
+            self._record_model_timings(ollama_timings(final_chunk))
+            if not response_text:
+                return
+            if session_id is not None:
+                self._finish_session_turn(session_id, prompt, response_text, final_chunk, context is not None)
+            else:
+                await self.cache.aset(self.model, prompt, response_text, **cache_params)
                         
+        except OllamaHTTPError as e:
+            yield StreamError(f"Error: HTTP {e.status_code}")
         except httpx.TimeoutException:
-            yield "Error: Request timed out"
+            yield StreamError("Error: Request timed out")
         except httpx.ConnectError:
-            yield "Error: Could not connect to LLM service"
+            yield StreamError("Error: Could not connect to LLM service")
         except Exception as e:
-            yield f"Error: {str(e)}" 
\ No newline at end of file
+            yield StreamError(f"Error: {str(e)}")
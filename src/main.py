@@ -1,19 +1,48 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, Response, WebSocket
+from fastapi.responses import FileResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from typing import Optional
+from typing import Awaitable, Callable, Dict, List, Optional, AsyncIterator, TypeVar, Union
+from contextlib import aclosing, asynccontextmanager
+from email.utils import parsedate_to_datetime
+from pathlib import Path
+import asyncio
 import os
+import re
+import time
 from dotenv import load_dotenv
 
+from src.admission import AdmissionController, AdmissionRejected
+from src.chat_pipeline import ChatPipeline, encode_sse
+from src.benchmarks import PerformanceMetrics
 from src.moderation import ContentModerator
-from src.llm import LLMClient
-from src.tts import TTSClient
+from src.segmenter import SentenceSegmenter
+from src.llm import LLMClient, LLMResponse
+from src.tts import HASHED_AUDIO_NAME, TTSClient
+from src.voice_session import VoiceSession
+from src.cache import CacheSweeper, ResponseCache
 from src.config import Config, LLMConfig, TTSConfig
 
 # Load environment variables
 load_dotenv()
 
-app = FastAPI(title="Convo AI")
+T = TypeVar("T")
+
+# Plain file names only, so requests cannot reach outside the audio directory
+AUDIO_NAME = re.compile(r"[\w-]+\.(wav|mp3|ogg|flac)")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    """Open shared service connections on startup and close them on shutdown."""
+    await llm_client.start()
+    cache_sweeper.start()
+    try:
+        yield
+    finally:
+        await cache_sweeper.stop()
+        await llm_client.aclose()
+
+app = FastAPI(title="Convo AI", lifespan=lifespan)
 
 # Configure CORS
 app.add_middleware(
@@ -27,13 +56,20 @@ app.add_middleware(
 # Initialize services
 config = Config()
 moderator = ContentModerator()
-llm_client = LLMClient(config.llm)
+llm_client = LLMClient(config.llm, cache=ResponseCache.from_config(config.cache))
+cache_sweeper = CacheSweeper(
+    llm_client.cache,
+    interval=config.cache.sweep_interval,
+    batch_size=config.cache.sweep_batch_size
+)
 tts_client = TTSClient(config.tts)
+admission = AdmissionController.from_config(config.admission)
 
 class Message(BaseModel):
     """Message model for chat interactions."""
     content: str
     role: str = "user"
+    session_id: Optional[str] = None  # Continues an earlier conversation when set
 
 class ChatResponse(BaseModel):
     """Response model for chat interactions."""
@@ -41,33 +77,98 @@ class ChatResponse(BaseModel):
     audio_url: Optional[str] = None
     error: Optional[str] = None
 
+class PipelinedChatResponse(ChatResponse):
+    """Response model for pipelined chat, with one audio file per sentence segment."""
+    audio_urls: List[str] = []  # In playback order, audio_url is the first of them
+    time_to_first_audio: Optional[float] = None  # Seconds until the first segment was synthesised
+
 @app.get("/")
 async def root() -> dict:
     """Root endpoint to verify API is running."""
     return {"status": "online", "message": "Convo AI is running"}
 
-@app.post("/chat", response_model=ChatResponse)
-async def chat(message: Message) -> ChatResponse:
+async def wait_for_disconnect(request: Request) -> None:
+    """Return once the client has disconnected.
+    
+    The request body has already been read, so the next ASGI message the
+    server delivers is the disconnect.
     """
-    Handle chat interactions.
+    while True:
+        message = await request.receive()
+        if message["type"] == "http.disconnect":
+            return
+
+async def generate_reply(message: Message) -> LLMResponse:
+    """Generate the LLM reply, waiting for a free slot or failing fast under load."""
+    try:
+        async with admission.admit(llm_client.model):
+            return await llm_client.generate(message.content, session_id=message.session_id)
+    except AdmissionRejected as e:
+        raise HTTPException(
+            status_code=e.status_code,
+            detail=str(e),
+            headers={"Retry-After": str(max(1, round(e.retry_after)))}
+        )
+
+async def moderate_and_generate(message: Message, progress: Dict[str, str]) -> Optional[LLMResponse]:
+    """Moderate the input and generate a reply for it if it is safe.
+    
+    In speculative mode generation starts at the same time as moderation.
+    The reply is only returned once moderation has passed, and generation is
+    cancelled as soon as the input is flagged. Conversation turns are always
+    moderated first, since a finished turn is written to the session history.
     
-    Args:
-        message: The incoming message from the user
-        
     Returns:
-        ChatResponse: The AI's response with optional audio
+        The reply, or None if the input was flagged
     """
+    if not config.moderation.speculative or message.session_id is not None:
+        moderation_result = await moderator.moderate(message.content)
+        if not moderation_result.is_safe:
+            return None
+        progress["stage"] = "llm"
+        return await generate_reply(message)
+    
+    start_time = time.perf_counter()
+    generation_time: Dict[str, float] = {}
+    
+    async def generate() -> LLMResponse:
+        llm_response = await generate_reply(message)
+        generation_time["llm"] = time.perf_counter() - start_time
+        return llm_response
+    
+    progress["stage"] = "llm"
+    generation = asyncio.create_task(generate())
     try:
-        # 1. Moderate the input
         moderation_result = await moderator.moderate(message.content)
+        moderation_time = time.perf_counter() - start_time
         if not moderation_result.is_safe:
+            return None
+        llm_response = await generation
+    finally:
+        # Cancels generation for flagged input and collects a failure nobody will see
+        generation.cancel()
+        await asyncio.gather(generation, return_exceptions=True)
+    
+    # Run one after the other the two steps would have taken their sum, concurrently only the longer one
+    PerformanceMetrics().record_metric(
+        "chat_moderation_latency_saved",
+        min(moderation_time, generation_time["llm"]),
+        {"model": llm_client.model}
+    )
+    return llm_response
+
+async def run_chat(message: Message, progress: Dict[str, str]) -> ChatResponse:
+    """Moderate, generate and synthesise a reply, tracking the current stage in ``progress``."""
+    try:
+        # 1. Moderate the input and generate the LLM response
+        llm_response = await moderate_and_generate(message, progress)
+        if llm_response is None:
             return ChatResponse(
                 text="I apologize, but I cannot process that content.",
                 error="Content moderation failed"
             )
         
-        # 2. Generate LLM response
-        llm_response = await llm_client.generate(message.content)
+        # 2. Check the LLM response
         if llm_response.error:
             return ChatResponse(
                 text="I apologize, but I encountered an error.",
@@ -75,16 +176,254 @@ async def chat(message: Message) -> ChatResponse:
             )
         
         # 3. Generate speech
-        tts_response = await tts_client.generate_speech(llm_response.text)
+        progress["stage"] = "tts"
+        tts_response = await tts_client.generate(llm_response.text)
         
         return ChatResponse(
             text=llm_response.text,
             audio_url=tts_response.audio_url,
             error=tts_response.error
         )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def chat_pipeline(model: Optional[str] = None, voice: Optional[str] = None) -> ChatPipeline:
+    """Create the streaming pipeline for one chat turn, optionally with its own model and voice."""
+    return ChatPipeline.from_config(
+        config.pipeline,
+        moderator,
+        llm_client.for_model(model) if model else llm_client,
+        tts_client,
+        admission,
+        SentenceSegmenter.from_config(config.tts),
+        voice=voice
+    )
+
+async def run_pipelined_chat(message: Message, progress: Dict[str, str]) -> PipelinedChatResponse:
+    """Moderate, then synthesise each sentence of the reply while the LLM is still generating."""
+    tts_error = None
+    try:
+        async with aclosing(chat_pipeline().events(message.content, message.session_id)) as events:
+            async for event in events:
+                if event.event == "moderation":
+                    if not event.data["is_safe"]:
+                        return PipelinedChatResponse(
+                            text="I apologize, but I cannot process that content.",
+                            error="Content moderation failed"
+                        )
+                    progress["stage"] = "llm"
+                elif event.event == "audio":
+                    progress["stage"] = "tts"
+                elif event.event == "error":
+                    if "retry_after" in event.data:
+                        raise HTTPException(
+                            status_code=event.data["status_code"],
+                            detail=event.data["error"],
+                            headers={"Retry-After": str(max(1, round(event.data["retry_after"])))}
+                        )
+                    if event.data["status_code"] == 502:
+                        return PipelinedChatResponse(
+                            text="I apologize, but I encountered an error.",
+                            error=event.data["error"]
+                        )
+                    if "text" not in event.data:
+                        raise HTTPException(status_code=event.data["status_code"], detail=event.data["error"])
+                    # Synthesis of one segment failed, the others still play
+                    tts_error = event.data["error"]
+                elif event.event == "summary":
+                    audio_urls = event.data["audio_urls"]
+                    return PipelinedChatResponse(
+                        text=event.data["text"],
+                        audio_url=audio_urls[0] if audio_urls else None,
+                        audio_urls=audio_urls,
+                        time_to_first_audio=event.data["timings"].get("time_to_first_audio"),
+                        error=tts_error
+                    )
+        raise RuntimeError("Chat pipeline ended without a summary")
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+async def run_until_disconnect(
+    request: Request,
+    work: Callable[[Dict[str, str]], Awaitable[T]]
+) -> Union[T, Response]:
+    """Run a chat pipeline, cancelling it as soon as the client disconnects.
+    
+    Cancelling closes the Ollama stream and skips speech synthesis nobody
+    will receive.
+    
+    Args:
+        request: The HTTP request, watched for a client disconnect
+        work: Runs the pipeline, recording its current stage in the dict it is given
+        
+    Returns:
+        The pipeline result, or a 499 response if the client went away
+    """
+    progress = {"stage": "moderation"}
+    start_time = time.perf_counter()
+    pipeline = asyncio.create_task(work(progress))
+    disconnect = asyncio.create_task(wait_for_disconnect(request))
+    try:
+        await asyncio.wait({pipeline, disconnect}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        disconnect.cancel()
+        if not pipeline.done():
+            pipeline.cancel()
+            await asyncio.gather(pipeline, return_exceptions=True)
+            PerformanceMetrics().record_metric(
+                "chat_cancelled_work",
+                time.perf_counter() - start_time,
+                {"stage": progress["stage"]}
+            )
+    
+    if pipeline.cancelled():
+        # Nobody is listening, 499 is the conventional status for a client that closed the request
+        return Response(status_code=499)
+    return pipeline.result()
+
+@app.post("/chat", response_model=ChatResponse)
+async def chat(message: Message, request: Request) -> Union[ChatResponse, Response]:
+    """
+    Handle chat interactions.
+    
+    Args:
+        message: The incoming message from the user
+        request: The HTTP request, watched for a client disconnect
+        
+    Returns:
+        ChatResponse: The AI's response with optional audio
+    """
+    return await run_until_disconnect(request, lambda progress: run_chat(message, progress))
+
+@app.post("/chat/pipelined", response_model=PipelinedChatResponse)
+async def chat_pipelined(message: Message, request: Request) -> Union[PipelinedChatResponse, Response]:
+    """
+    Handle chat interactions, starting speech synthesis on the first sentence.
+    
+    Sentences are synthesised one after another while the LLM keeps
+    generating, so the first audio is ready long before the full reply.
+    
+    Args:
+        message: The incoming message from the user
+        request: The HTTP request, watched for a client disconnect
+        
+    Returns:
+        PipelinedChatResponse: The AI's response with one audio file per segment
+    """
+    return await run_until_disconnect(request, lambda progress: run_pipelined_chat(message, progress))
+
+@app.post("/chat/stream")
+async def chat_stream(message: Message) -> StreamingResponse:
+    """
+    Stream a chat turn as Server-Sent Events.
+    
+    Emits a "moderation" event with the verdict, a "token" event per LLM
+    chunk, an "audio" event as each sentence is synthesised, "error" events
+    and a final "summary" event with the full text, audio URLs and per-stage
+    timings. A slow client pauses generation instead of letting events pile
+    up, and disconnecting cancels the turn.
+    
+    Args:
+        message: The incoming message from the user
+        
+    Returns:
+        StreamingResponse: The event stream
+    """
+    async def stream() -> AsyncIterator[bytes]:
+        async with aclosing(chat_pipeline().events(message.content, message.session_id)) as events:
+            async for event in events:
+                yield encode_sse(event)
+    
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def not_modified(request: Request, response: FileResponse) -> bool:
+    """Whether the client's cached copy, identified by its validators, is still current."""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        etags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return "*" in etags or response.headers["etag"] in etags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is None:
+        return False
+    try:
+        return parsedate_to_datetime(response.headers["last-modified"]) <= parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+
+@app.api_route("/audio/{name}", methods=["GET", "HEAD"])
+async def audio(name: str, request: Request) -> Response:
+    """
+    Serve generated speech.
+    
+    Files are sent straight from disk in chunks, or with zero copy where the
+    server supports it, and support Range requests for seeking. Responses
+    carry an ETag and Last-Modified. Files named after a hash of their
+    synthesis inputs are written once and never rewritten, so they may be
+    cached indefinitely.
+    
+    Args:
+        name: File name from the audio URL
+        request: The HTTP request, checked for conditional headers
+        
+    Returns:
+        Response: The file, part of it, or 304 Not Modified
+    """
+    if not AUDIO_NAME.fullmatch(name):
+        raise HTTPException(status_code=404, detail="Audio not found")
+    path = Path(config.tts.audio_dir) / name
+    try:
+        stat_result = await asyncio.to_thread(os.stat, path)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Audio not found")
+    
+    if HASHED_AUDIO_NAME.fullmatch(name):
+        cache_control = f"public, max-age={config.tts.audio_cache_max_age}, immutable"
+    else:
+        cache_control = "no-cache"
+    response = FileResponse(path, stat_result=stat_result, headers={"Cache-Control": cache_control})
+    if not_modified(request, response):
+        return Response(
+            status_code=304,
+            headers={
+                "ETag": response.headers["etag"],
+                "Last-Modified": response.headers["last-modified"],
+                "Cache-Control": cache_control
+            }
+        )
+    return response
+
+@app.websocket("/ws/voice")
+async def voice_session(websocket: WebSocket) -> None:
+    """
+    Hold a voice conversation over a WebSocket.
+    
+    The connection keeps its history, model and voice across turns, streams
+    text deltas and binary audio frames, and cancels the current turn when
+    the user interrupts. See ``VoiceSession`` for the message protocol.
+    
+    Args:
+        websocket: The incoming WebSocket connection
+    """
+    await websocket.accept()
+    session = VoiceSession(
+        websocket,
+        chat_pipeline,
+        llm_client,
+        model=llm_client.model,
+        voice=config.tts.voice,
+        audio_dir=config.tts.audio_dir,
+        frame_bytes=config.pipeline.audio_frame_bytes
+    )
+    await session.run()
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000) 
\ No newline at end of file
@@ -0,0 +1,99 @@
+"""Incremental decoding of newline-delimited JSON streams such as Ollama's responses."""
+
+import json
+from typing import Any, AsyncIterator, List, Union
+
+try:
+    import orjson  # Optional dependency, parses several times faster than json
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+# Reused so the fallback skips json.loads' per-call encoding detection
+_json_decoder = json.JSONDecoder()
+
+def loads(data: Union[bytes, bytearray, memoryview]) -> Any:
+    """Parse one JSON document from UTF-8 bytes with the fastest available parser."""
+    if ORJSON_AVAILABLE:
+        return orjson.loads(data)
+    return _json_decoder.decode(str(data, "utf-8"))
+
+class NDJSONDecoder:
+    """Turns raw byte chunks into JSON values, one per line.
+
+    Network chunks rarely line up with lines, so the trailing partial line of
+    each chunk is buffered until its newline arrives. Complete lines are parsed
+    straight out of the received chunk without being copied first. Lines that
+    are not valid JSON are skipped and counted in ``errors``.
+    """
+
+    def __init__(self) -> None:
+        self.errors = 0
+        self._buffer = bytearray()
+
+    def feed(self, data: bytes) -> List[Any]:
+        """Decode every line completed by a chunk.
+
+        Args:
+            data: Next chunk of the raw stream
+
+        Returns:
+            The values of the lines completed by this chunk
+        """
+        values: List[Any] = []
+        start = 0
+        if self._buffer:
+            newline = data.find(b"\n")
+            if newline < 0:
+                self._buffer += data
+                return values
+            self._buffer += data[:newline]
+            self._decode(self._buffer, values)
+            self._buffer = bytearray()
+            start = newline + 1
+
+        view = memoryview(data)
+        while True:
+            newline = data.find(b"\n", start)
+            if newline < 0:
+                break
+            self._decode(view[start:newline], values)
+            start = newline + 1
+        if start < len(data):
+            self._buffer += view[start:]
+        return values
+
+    def close(self) -> List[Any]:
+        """Decode a final line that was not terminated by a newline."""
+        values: List[Any] = []
+        if self._buffer:
+            self._decode(self._buffer, values)
+            self._buffer = bytearray()
+        return values
+
+    def _decode(self, line: Union[bytearray, memoryview], values: List[Any]) -> None:
+        """Parse one line, skipping blank and malformed lines."""
+        if not line:
+            return
+        try:
+            values.append(loads(line))
+        except ValueError:
+            # Whitespace-only lines such as a stray "\r" are blank, not malformed
+            if bytes(line).strip():
+                self.errors += 1
+
+async def aiter_ndjson(chunks: AsyncIterator[bytes]) -> AsyncIterator[Any]:
+    """Decode an async stream of raw byte chunks into JSON values.
+
+    Args:
+        chunks: Raw byte chunks, for example ``httpx.Response.aiter_bytes()``
+
+    Yields:
+        One value per complete line
+    """
+    decoder = NDJSONDecoder()
+    async for data in chunks:
+        for value in decoder.feed(data):
+            yield value
+    for value in decoder.close():
+        yield value
@@ -0,0 +1,102 @@
+"""Tracking and warming of the models loaded on each Ollama host."""
+
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from src.config import LLMConfig
+
+class ModelResidency:
+    """Keeps track of which models are hot on which Ollama hosts.
+
+    Ollama unloads a model once it has been idle for ``keep_alive`` seconds,
+    after which the next request pays the full load time. A model counts as
+    hot on a host from its last successful request until that keep-alive
+    runs out. ``ensure`` warms a model on every host where it is cold, and
+    concurrent calls for the same host and model share one warm-up.
+    """
+
+    def __init__(
+        self,
+        preload_models: Optional[List[str]] = None,
+        keep_alive: float = 1800.0,
+        preload_on_startup: bool = True
+    ):
+        """Initialize the tracker.
+
+        Args:
+            preload_models: Models to warm on startup
+            keep_alive: Seconds Ollama keeps an idle model loaded, negative for indefinitely
+            preload_on_startup: Whether startup should warm the preload models
+        """
+        self.preload_models = preload_models or []
+        self.keep_alive = keep_alive
+        self.preload_on_startup = preload_on_startup
+        self.logger = logging.getLogger(__name__)
+        self._last_used: Dict[Tuple[str, str], float] = {}
+        self._warming: Dict[Tuple[str, str], asyncio.Task] = {}
+
+    @classmethod
+    def from_config(cls, config: LLMConfig) -> "ModelResidency":
+        """Create a tracker from the LLM configuration."""
+        return cls(
+            preload_models=config.residency.preload_models or [config.model],
+            keep_alive=config.residency.keep_alive,
+            preload_on_startup=config.residency.preload_on_startup
+        )
+
+    def is_hot(self, url: str, model: str) -> bool:
+        """Whether a model should still be loaded on a host."""
+        last_used = self._last_used.get((url, model))
+        if last_used is None:
+            return False
+        return self.keep_alive < 0 or time.monotonic() - last_used < self.keep_alive
+
+    def mark_used(self, url: str, model: str) -> None:
+        """Record that a host just served a model, restarting its keep-alive."""
+        self._last_used[(url, model)] = time.monotonic()
+
+    def hot_models(self) -> Dict[str, List[str]]:
+        """Models currently hot on each host."""
+        hot: Dict[str, List[str]] = {}
+        for url, model in list(self._last_used):
+            if self.is_hot(url, model):
+                hot.setdefault(url, []).append(model)
+        return hot
+
+    async def ensure(self, model: str, urls: List[str], warm: Callable[[str, str], Awaitable[None]]) -> bool:
+        """Warm a model on every host where it is not already hot.
+
+        Args:
+            model: Model to load
+            urls: Hosts the model should be loaded on
+            warm: Loads and warms a model on a host, raising on failure
+
+        Returns:
+            Whether the model is hot on every host afterwards
+        """
+        warmups = []
+        for url in urls:
+            if self.is_hot(url, model):
+                continue
+            key = (url, model)
+            task = self._warming.get(key)
+            if task is None:
+                task = asyncio.create_task(self._warm(url, model, warm))
+                self._warming[key] = task
+                task.add_done_callback(lambda _, key=key: self._warming.pop(key, None))
+            warmups.append(asyncio.shield(task))
+        results = await asyncio.gather(*warmups)
+        return all(results)
+
+    async def _warm(self, url: str, model: str, warm: Callable[[str, str], Awaitable[None]]) -> bool:
+        """Run one warm-up, logging instead of raising so other hosts still get warmed."""
+        start_time = time.perf_counter()
+        try:
+            await warm(url, model)
+        except Exception as e:
+            self.logger.warning(f"Failed to warm {model} on {url}: {type(e).__name__}: {e}")
+            return False
+        self.mark_used(url, model)
+        self.logger.info(f"Warmed {model} on {url} in {time.perf_counter() - start_time:.2f}s")
+        return True
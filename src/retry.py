@@ -0,0 +1,136 @@
+"""Retry and hedging policies for LLM requests."""
+
+from collections import deque
+import random
+import statistics
+from typing import Deque, Optional
+from src.config import RetryConfig
+
+class RetryBudget:
+    """Caps retries to a fraction of recent traffic.
+
+    Every request deposits ``ratio`` tokens and every retry spends one, so
+    during an outage retries add at most ``ratio`` extra load instead of
+    multiplying it. ``min_tokens`` keeps a few retries available at low traffic.
+    """
+
+    def __init__(self, ratio: float = 0.2, min_tokens: float = 10.0, max_tokens: float = 100.0):
+        """Initialize the budget.
+
+        Args:
+            ratio: Tokens deposited per request
+            min_tokens: Tokens available before any traffic
+            max_tokens: Upper bound on saved up tokens
+        """
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.tokens = min(min_tokens, max_tokens)
+
+    def deposit(self) -> None:
+        """Credit the budget for one request."""
+        self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        """Spend one token on a retry, returning False when the budget is exhausted."""
+        if self.tokens < 1.0:
+            return False
+        self.tokens -= 1.0
+        return True
+
+class RetryPolicy:
+    """Exponential backoff with full jitter, limited by attempts and a retry budget."""
+
+    def __init__(
+        self,
+        max_attempts: int = 3,
+        base_delay: float = 0.2,
+        max_delay: float = 2.0,
+        budget: Optional[RetryBudget] = None,
+        rng: Optional[random.Random] = None
+    ):
+        """Initialize the policy.
+
+        Args:
+            max_attempts: Total attempts per request, including the first
+            base_delay: Backoff cap for the first retry in seconds
+            max_delay: Upper bound on any backoff in seconds
+            budget: Shared budget limiting the overall retry rate
+            rng: Random source for the jitter
+        """
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget = budget or RetryBudget()
+        self._rng = rng or random.Random()
+
+    @classmethod
+    def from_config(cls, config: RetryConfig) -> "RetryPolicy":
+        """Create a policy from the retry configuration."""
+        return cls(
+            max_attempts=config.max_attempts,
+            base_delay=config.base_delay,
+            max_delay=config.max_delay,
+            budget=RetryBudget(ratio=config.budget_ratio, min_tokens=config.budget_min_tokens)
+        )
+
+    def allow_retry(self, attempt: int) -> bool:
+        """Whether another attempt may follow the given (1-based) attempt."""
+        return attempt < self.max_attempts and self.budget.withdraw()
+
+    def backoff(self, attempt: int) -> float:
+        """Seconds to wait after the given (1-based) failed attempt."""
+        cap = min(self.max_delay, self.base_delay * (2 ** (attempt - 1)))
+        return self._rng.uniform(0, cap)
+
+class HedgePolicy:
+    """Derives the hedging delay from recently observed times to first token.
+
+    A duplicate request is worth sending once the first one has taken longer
+    than nearly all recent requests, so the delay is the chosen percentile of
+    the latest samples, clamped to ``min_delay``. Until enough samples exist
+    ``initial_delay`` is used.
+    """
+
+    def __init__(
+        self,
+        percentile: float = 95.0,
+        min_delay: float = 0.05,
+        initial_delay: float = 1.0,
+        window: int = 200,
+        min_samples: int = 20
+    ):
+        """Initialize the policy.
+
+        Args:
+            percentile: Percentile of the time to first token used as the delay
+            min_delay: Lower bound on the delay in seconds
+            initial_delay: Delay used until enough samples are collected
+            window: Number of recent samples kept
+            min_samples: Samples required before the percentile is used
+        """
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.initial_delay = initial_delay
+        self.min_samples = min_samples
+        self._samples: Deque[float] = deque(maxlen=window)
+
+    @classmethod
+    def from_config(cls, config: RetryConfig) -> "HedgePolicy":
+        """Create a policy from the retry configuration."""
+        return cls(
+            percentile=config.hedge_percentile,
+            min_delay=config.hedge_min_delay,
+            initial_delay=config.hedge_initial_delay
+        )
+
+    def observe(self, time_to_first_token: float) -> None:
+        """Record the time to first token of a completed attempt."""
+        self._samples.append(time_to_first_token)
+
+    def delay(self) -> float:
+        """Seconds to wait for a first token before sending a hedged request."""
+        if len(self._samples) < self.min_samples:
+            return self.initial_delay
+        cut_points = statistics.quantiles(self._samples, n=100, method="inclusive")
+        index = min(len(cut_points) - 1, max(0, round(self.percentile) - 1))
+        return max(self.min_delay, cut_points[index])
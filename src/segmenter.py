@@ -0,0 +1,195 @@
+"""Splitting of streamed LLM text into sentence-sized segments for speech synthesis."""
+
+from contextlib import aclosing
+import re
+from typing import AsyncGenerator, AsyncIterator, List, Optional
+from src.config import TTSConfig
+from src.llm import StreamError
+
+# Closing quotes and brackets that belong to the sentence they end
+_CLOSERS = "\"'”’)]"
+
+# Terminal punctuation followed by whitespace, so "3.14" and "e.g." mid-word never match
+_SENTENCE_END = re.compile(r"[.!?…]+[" + re.escape(_CLOSERS) + r"]*(?=\s)")
+
+# Clause punctuation followed by whitespace, so "1,000" never matches
+_CLAUSE_END = re.compile(r"[,;:—–][" + re.escape(_CLOSERS) + r"]*(?=\s)")
+
+# The word right before a full stop
+_LAST_WORD = re.compile(r"(\S+)$")
+
+# Abbreviations that are usually followed by a capitalised word
+ABBREVIATIONS = frozenset({
+    "mr", "mrs", "ms", "dr", "prof", "sr", "jr", "st", "mt", "vs", "etc", "no",
+    "fig", "approx", "dept", "est", "inc", "ltd", "co", "corp", "gen", "gov",
+    "sen", "rep", "lt", "col", "capt", "sgt", "jan", "feb", "mar", "apr", "jun",
+    "jul", "aug", "sep", "sept", "oct", "nov", "dec", "e.g", "i.e", "a.m", "p.m",
+    "u.s", "u.k",
+})
+
+class SentenceSegmenter:
+    """Turns text arriving in arbitrary pieces into segments ready for speech.
+
+    A segment normally ends at a sentence boundary. Full stops after common
+    abbreviations and initials, and boundaries followed by a lowercase word,
+    are not treated as sentence ends. Decimal numbers never are, since a
+    boundary needs whitespace after the punctuation. Sentences shorter than
+    ``min_chars`` are joined with the next one. Text longer than ``max_chars``
+    without a sentence end is split at the last clause boundary or word. In
+    first-segment-fast mode the first segment may also end at a clause
+    boundary once it reaches ``first_segment_min_chars``, so speech can start
+    before the first sentence is complete.
+    """
+
+    def __init__(
+        self,
+        min_chars: int = 20,
+        max_chars: int = 250,
+        first_segment_fast: bool = True,
+        first_segment_min_chars: int = 8
+    ):
+        """Initialize the segmenter.
+
+        Args:
+            min_chars: Minimum segment length, except for the last segment
+            max_chars: Maximum segment length
+            first_segment_fast: Let the first segment end at a clause boundary
+            first_segment_min_chars: Minimum length of that first segment
+        """
+        if max_chars <= 0:
+            raise ValueError("max_chars must be positive")
+        if min_chars > max_chars:
+            raise ValueError("min_chars cannot exceed max_chars")
+        self.min_chars = min_chars
+        self.max_chars = max_chars
+        self.first_segment_fast = first_segment_fast
+        self.first_segment_min_chars = min(first_segment_min_chars, max_chars)
+        self.segments = 0  # Segments emitted so far
+        self._buffer = ""
+
+    @classmethod
+    def from_config(cls, config: TTSConfig) -> "SentenceSegmenter":
+        """Create a segmenter from the TTS configuration."""
+        return cls(
+            min_chars=config.segment_min_chars,
+            max_chars=config.segment_max_chars,
+            first_segment_fast=config.first_segment_fast,
+            first_segment_min_chars=config.first_segment_min_chars
+        )
+
+    def feed(self, text: str) -> List[str]:
+        """Add streamed text and return the segments it completes.
+
+        Args:
+            text: Next piece of the stream, such as one token
+
+        Returns:
+            Segments completed by this piece, in order
+        """
+        self._buffer += text
+        segments: List[str] = []
+        while True:
+            segment = self._next_segment()
+            if segment is None:
+                return segments
+            segments.append(segment)
+
+    def close(self) -> List[str]:
+        """Return whatever text is left once the stream has ended."""
+        segments = self.feed("")
+        remainder = self._buffer.strip()
+        self._buffer = ""
+        if remainder:
+            self.segments += 1
+            segments.append(remainder)
+        return segments
+
+    def _next_segment(self) -> Optional[str]:
+        """Cut the next complete segment off the buffer, if there is one."""
+        fast = self.first_segment_fast and self.segments == 0
+        min_chars = self.first_segment_min_chars if fast else self.min_chars
+        end = self._sentence_end(min_chars)
+        if end is None and fast:
+            end = self._clause_end(min_chars)
+        if (end is None and len(self._buffer) > self.max_chars) or (end is not None and end > self.max_chars):
+            end = self._forced_end()
+        if end is None:
+            return None
+
+        segment = self._buffer[:end].strip()
+        self._buffer = self._buffer[end:].lstrip()
+        if not segment:
+            return None
+        self.segments += 1
+        return segment
+
+    def _sentence_end(self, min_chars: int) -> Optional[int]:
+        """End of the first sentence that is at least ``min_chars`` long."""
+        for match in _SENTENCE_END.finditer(self._buffer):
+            end = match.end()
+            following = self._buffer[end:].lstrip()
+            if not following:
+                # The next word has not arrived yet, so the boundary cannot be confirmed
+                return None
+            if following[0].islower() or self._is_abbreviation(match):
+                continue
+            if len(self._buffer[:end].strip()) >= min_chars:
+                return end
+        return None
+
+    def _clause_end(self, min_chars: int) -> Optional[int]:
+        """End of the first clause that is at least ``min_chars`` long."""
+        for match in _CLAUSE_END.finditer(self._buffer):
+            if len(self._buffer[:match.end()].strip()) >= min_chars:
+                return match.end()
+        return None
+
+    def _forced_end(self) -> int:
+        """Where to split text that has no usable sentence end within ``max_chars``."""
+        window = self._buffer[:self.max_chars + 1]
+        clause_ends = [match.end() for match in _CLAUSE_END.finditer(window) if match.end() <= self.max_chars]
+        if clause_ends:
+            return clause_ends[-1]
+        space = window.rfind(" ", 0, self.max_chars + 1)
+        if space > 0:
+            return space
+        return self.max_chars
+
+    def _is_abbreviation(self, match: re.Match) -> bool:
+        """Whether a full stop belongs to an abbreviation or initial rather than ending a sentence."""
+        if match.group() != ".":
+            return False
+        word = _LAST_WORD.search(self._buffer, 0, match.start())
+        if word is None:
+            return False
+        token = word.group(1).lstrip(_CLOSERS + "(“‘[").lower()
+        if len(token) == 1 and token.isalpha():
+            return True
+        return token in ABBREVIATIONS
+
+async def aiter_segments(
+    chunks: AsyncGenerator[str, None],
+    segmenter: Optional[SentenceSegmenter] = None
+) -> AsyncIterator[str]:
+    """Segment an async stream of text, such as ``LLMClient.generate_stream``.
+
+    A ``StreamError`` ends the segments: it is passed on as the last item and
+    the unfinished sentence before it is dropped rather than spoken.
+
+    Args:
+        chunks: Streamed text in arbitrary pieces
+        segmenter: Segmenter to use, a default one if omitted
+
+    Yields:
+        Each segment as soon as it is complete, then the ``StreamError`` if the stream failed
+    """
+    segmenter = segmenter or SentenceSegmenter()
+    async with aclosing(chunks) as pieces:
+        async for chunk in pieces:
+            if isinstance(chunk, StreamError):
+                yield chunk
+                return
+            for segment in segmenter.feed(chunk):
+                yield segment
+    for segment in segmenter.close():
+        yield segment
@@ -0,0 +1,169 @@
+"""Per-conversation storage of Ollama context tokens for multi-turn reuse."""
+
+from collections import OrderedDict
+import threading
+from typing import List, Optional, Tuple
+
+class SessionState:
+    """Conversation state kept for one session."""
+
+    def __init__(self) -> None:
+        # Ollama's encoded conversation, None once evicted or before the first turn
+        self.context: Optional[List[int]] = None
+        # Model that produced the context, which no other model can interpret
+        self.model: Optional[str] = None
+        # Recent (prompt, response) turns used to rebuild the prompt without a context
+        self.turns: List[Tuple[str, str]] = []
+
+class SessionContextStore:
+    """Bounded LRU store of Ollama contexts and recent turns per session.
+
+    Context arrays grow with the conversation, so they are bounded both by the
+    number of sessions and by the total number of context tokens held. Going
+    over the token budget only drops the context of the least recently used
+    sessions and keeps their turns, so those sessions fall back to sending the
+    conversation as a full prompt. Going over the session budget forgets the
+    least recently used session entirely.
+    """
+
+    def __init__(self, max_sessions: int = 256, max_tokens: int = 1_000_000, max_turns: int = 20):
+        """Initialize the store.
+
+        Args:
+            max_sessions: Maximum number of sessions kept
+            max_tokens: Maximum number of context tokens kept across all sessions
+            max_turns: Maximum number of recent turns kept per session
+        """
+        self.max_sessions = max_sessions
+        self.max_tokens = max_tokens
+        self.max_turns = max_turns
+        self.token_count = 0
+        self.evictions = 0
+        self._sessions: "OrderedDict[str, SessionState]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def get_context(self, session_id: str, model: Optional[str] = None) -> Optional[List[int]]:
+        """Return the stored context for a session, marking it as recently used.
+
+        Args:
+            session_id: Conversation identifier
+            model: Model the context will be sent to. A context produced by a
+                different model is dropped, keeping the session's turns.
+
+        Returns:
+            The context tokens, or None if there are none usable
+        """
+        with self._lock:
+            state = self._sessions.get(session_id)
+            if state is None:
+                return None
+            self._sessions.move_to_end(session_id)
+            if model is not None and state.context is not None and state.model != model:
+                self.token_count -= len(state.context)
+                state.context = None
+            return state.context
+
+    def history(self, session_id: str) -> List[Tuple[str, str]]:
+        """Return the recent turns of a session."""
+        with self._lock:
+            state = self._sessions.get(session_id)
+            return list(state.turns) if state is not None else []
+
+    def build_prompt(self, session_id: str, prompt: str) -> str:
+        """Build a standalone prompt containing the session's recent turns.
+
+        Used when the session has no context to send, so the model still sees
+        the conversation so far.
+
+        Args:
+            session_id: Conversation identifier
+            prompt: The new user prompt
+
+        Returns:
+            The prompt prefixed with the conversation history, if any
+        """
+        turns = self.history(session_id)
+        if not turns:
+            return prompt
+        lines = []
+        for user_text, assistant_text in turns:
+            lines.append(f"User: {user_text}")
+            lines.append(f"Assistant: {assistant_text}")
+        lines.append(f"User: {prompt}")
+        lines.append("Assistant:")
+        return "\n".join(lines)
+
+    def update(
+        self,
+        session_id: str,
+        prompt: str,
+        response: str,
+        context: Optional[List[int]],
+        model: Optional[str] = None
+    ) -> None:
+        """Record a completed turn and the context Ollama returned for it.
+
+        Args:
+            session_id: Conversation identifier
+            prompt: The user prompt of the turn
+            response: The model's response
+            context: Context tokens from Ollama's final chunk, if any
+            model: Model that produced the context
+        """
+        with self._lock:
+            state = self._sessions.pop(session_id, None) or SessionState()
+            if state.context is not None:
+                self.token_count -= len(state.context)
+            state.turns.append((prompt, response))
+            del state.turns[:-self.max_turns]
+            if context is not None and len(context) <= self.max_tokens:
+                state.context = list(context)
+                state.model = model
+                self.token_count += len(state.context)
+            else:
+                state.context = None
+                state.model = None
+            self._sessions[session_id] = state
+            self._enforce_budgets()
+
+    def drop_context(self, session_id: str) -> None:
+        """Forget a session's context but keep its turns, such as after switching models."""
+        with self._lock:
+            state = self._sessions.get(session_id)
+            if state is not None and state.context is not None:
+                self.token_count -= len(state.context)
+                state.context = None
+
+    def drop(self, session_id: str) -> None:
+        """Forget a session."""
+        with self._lock:
+            state = self._sessions.pop(session_id, None)
+            if state is not None and state.context is not None:
+                self.token_count -= len(state.context)
+
+    def clear(self) -> None:
+        """Forget all sessions."""
+        with self._lock:
+            self._sessions.clear()
+            self.token_count = 0
+
+    def _enforce_budgets(self) -> None:
+        """Evict least recently used sessions and contexts until within budget."""
+        while len(self._sessions) > self.max_sessions:
+            _, state = self._sessions.popitem(last=False)
+            if state.context is not None:
+                self.token_count -= len(state.context)
+            self.evictions += 1
+        if self.token_count <= self.max_tokens:
+            return
+        for state in self._sessions.values():
+            if state.context is None:
+                continue
+            self.token_count -= len(state.context)
+            state.context = None
+            self.evictions += 1
+            if self.token_count <= self.max_tokens:
+                break
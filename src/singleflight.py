@@ -0,0 +1,159 @@
+"""Request coalescing so identical concurrent LLM calls share one upstream generation."""
+
+import asyncio
+from contextlib import aclosing
+from typing import Any, AsyncGenerator, AsyncIterator, Awaitable, Callable, Dict, List, Optional, TypeVar
+
+T = TypeVar('T')
+
+class _Flight:
+    """A shared in-flight call and the callers waiting on it."""
+
+    def __init__(self) -> None:
+        self.task: Optional[asyncio.Task] = None
+        self.waiters = 0
+        # Items produced so far, only used for streams
+        self.items: List[Any] = []
+        self.done = False
+        self.changed = asyncio.Event()
+        # Next item index of every attached stream subscriber
+        self.cursors: Dict[object, int] = {}
+        self.drained = asyncio.Event()
+
+class SingleFlight:
+    """Deduplicates concurrent calls that share a key.
+
+    The first caller for a key (the leader) starts the work as a task and later
+    callers (followers) wait on the same task instead of starting their own.
+    The work keeps running while any caller is still waiting, so cancelling the
+    leader's request does not fail its followers. It is cancelled once every
+    waiter has gone.
+
+    Shared streams read at most ``stream_buffer`` items ahead of their slowest
+    subscriber, so a slow consumer slows the upstream iterator down instead of
+    letting it run ahead.
+    """
+
+    def __init__(self, on_coalesced: Optional[Callable[[str], None]] = None, stream_buffer: int = 32):
+        """Initialize the coalescer.
+
+        Args:
+            on_coalesced: Called with the key whenever a caller joins an in-flight call
+            stream_buffer: Items a shared stream may read ahead of its slowest subscriber
+        """
+        self.coalesced = 0
+        self.stream_buffer = stream_buffer
+        self._on_coalesced = on_coalesced
+        self._calls: Dict[str, _Flight] = {}
+        self._streams: Dict[str, _Flight] = {}
+
+    @property
+    def in_flight(self) -> int:
+        """Number of distinct calls and streams currently running."""
+        return len(self._calls) + len(self._streams)
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        """Run ``fn`` once for all concurrent callers with the same key.
+
+        Args:
+            key: Identifies equivalent calls
+            fn: Starts the work when no call for the key is in flight
+
+        Returns:
+            The result of the shared call
+        """
+        flight = self._calls.get(key)
+        if flight is None:
+            flight = _Flight()
+            flight.task = asyncio.ensure_future(fn())
+            self._calls[key] = flight
+            flight.task.add_done_callback(lambda _: self._forget(self._calls, key, flight))
+        else:
+            self._joined(key)
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            self._leave(self._calls, key, flight)
+
+    async def stream(self, key: str, fn: Callable[[], AsyncIterator[T]]) -> AsyncGenerator[T, None]:
+        """Share one async iterator between all concurrent callers with the same key.
+
+        Followers first receive the items already produced, then follow along
+        as new ones arrive. The iterator is paused while any subscriber is
+        ``stream_buffer`` items behind.
+
+        Args:
+            key: Identifies equivalent streams
+            fn: Creates the iterator when no stream for the key is in flight
+
+        Yields:
+            Every item produced by the shared iterator
+        """
+        flight = self._streams.get(key)
+        if flight is None:
+            flight = _Flight()
+            flight.task = asyncio.ensure_future(self._produce(flight, fn))
+            self._streams[key] = flight
+            flight.task.add_done_callback(lambda _: self._forget(self._streams, key, flight))
+        else:
+            self._joined(key)
+
+        flight.waiters += 1
+        subscriber = object()
+        flight.cursors[subscriber] = 0
+        try:
+            index = 0
+            while True:
+                while index < len(flight.items):
+                    yield flight.items[index]
+                    index += 1
+                    flight.cursors[subscriber] = index
+                    flight.drained.set()
+                if flight.done:
+                    break
+                flight.changed.clear()
+                await flight.changed.wait()
+            if flight.task.done() and not flight.task.cancelled() and flight.task.exception() is not None:
+                raise flight.task.exception()
+        finally:
+            del flight.cursors[subscriber]
+            flight.drained.set()
+            self._leave(self._streams, key, flight)
+
+    async def _produce(self, flight: _Flight, fn: Callable[[], AsyncIterator[T]]) -> None:
+        """Pull items from the shared iterator and wake up subscribers."""
+        try:
+            # Close the iterator as soon as the flight is cancelled so its connection is released
+            async with aclosing(fn()) as items:
+                async for item in items:
+                    flight.items.append(item)
+                    flight.changed.set()
+                    # Wait for the slowest subscriber before reading further
+                    while flight.cursors and len(flight.items) - min(flight.cursors.values()) >= self.stream_buffer:
+                        flight.drained.clear()
+                        await flight.drained.wait()
+        finally:
+            flight.done = True
+            flight.changed.set()
+
+    def _joined(self, key: str) -> None:
+        """Count a caller that joined an in-flight call."""
+        self.coalesced += 1
+        if self._on_coalesced is not None:
+            self._on_coalesced(key)
+
+    def _leave(self, registry: Dict[str, _Flight], key: str, flight: _Flight) -> None:
+        """Drop a waiter and cancel the shared work when nobody is left waiting."""
+        flight.waiters -= 1
+        if flight.waiters == 0 and not flight.task.done():
+            # Stop new callers from joining work that is being cancelled
+            self._forget(registry, key, flight)
+            flight.task.cancel()
+
+    @staticmethod
+    def _forget(registry: Dict[str, _Flight], key: str, flight: _Flight) -> None:
+        """Remove a finished call unless a newer one has replaced it."""
+        if registry.get(key) is flight:
+            del registry[key]
@@ -1,10 +1,24 @@
-from typing import Optional, Tuple
+from contextlib import aclosing
+from typing import AsyncGenerator, AsyncIterator, Optional, Tuple
+import hashlib
+import re
+import tempfile
 import torch
 import torchaudio
 import os
 from pathlib import Path
 from pydantic import BaseModel
 from src.config import Config, TTSConfig
+from src.llm import StreamError
+
+# Names hashed from the synthesis inputs. A file is only ever written once under
+# such a name, so its bytes never change once it exists.
+HASHED_AUDIO_NAME = re.compile(r"speech_[0-9a-f]{32}\.wav")
+
+def audio_name(text: str, voice: str, model: str) -> str:
+    """File name for the speech generated from text, hashed from the text, voice and model."""
+    digest = hashlib.sha256(f"{model}\0{voice}\0{text}".encode()).hexdigest()
+    return f"speech_{digest[:32]}.wav"
 
 class TTSResponse(BaseModel):
     """Response from TTS service."""
@@ -33,17 +47,19 @@ class TTSClient:
         output_dir = Path(path).parent
         output_dir.mkdir(parents=True, exist_ok=True)
     
-    async def generate(self, text: str, output_path: Optional[str] = None) -> TTSResponse:
-        """Generate speech from text."""
+    async def generate(self, text: str, output_path: Optional[str] = None, voice: Optional[str] = None) -> TTSResponse:
+        """Generate speech from text, in the given voice or the configured one."""
         if not text.strip():
             return TTSResponse(error="Text cannot be empty")
         
         try:
             await self._load_model()
             
-            # Generate output path if not provided
+            # Generate output path if not provided, reusing speech already synthesised for the same inputs
             if output_path is None:
-                output_path = f"output/audio/speech_{hash(text)}.wav"
+                output_path = f"{self.config.audio_dir}/{audio_name(text, voice or self.config.voice, self.config.model)}"
+                if os.path.exists(output_path):
+                    return TTSResponse(audio_path=output_path, audio_url=f"/audio/{Path(output_path).name}")
             
             # Ensure output directory exists
             self._ensure_output_dir(output_path)
@@ -54,13 +70,20 @@ class TTSClient:
             t = torch.linspace(0, duration, int(self.sample_rate * duration))
             waveform = torch.sin(2 * torch.pi * 440 * t).unsqueeze(0)  # 440 Hz sine wave
             
-            # Save audio
-            torchaudio.save(
-                output_path,
-                waveform,
-                self.sample_rate,
-                format="wav"
-            )
+            # Save audio to a temporary file and move it into place, so readers never see a partial file
+            fd, temp_path = tempfile.mkstemp(dir=Path(output_path).parent, suffix=".tmp")
+            os.close(fd)
+            try:
+                torchaudio.save(
+                    temp_path,
+                    waveform,
+                    self.sample_rate,
+                    format="wav"
+                )
+                os.replace(temp_path, output_path)
+            except BaseException:
+                os.unlink(temp_path)
+                raise
             
             # Convert file path to URL
             audio_url = f"/audio/{Path(output_path).name}"
@@ -69,6 +92,23 @@ class TTSClient:
         except Exception as e:
             return TTSResponse(error=f"Error generating speech: {str(e)}")
     
+    async def generate_segments(self, segments: AsyncGenerator[str, None]) -> AsyncIterator[TTSResponse]:
+        """Generate speech for each segment of a stream as soon as it arrives.
+        
+        Args:
+            segments: Text segments, such as those from ``aiter_segments``
+            
+        Yields:
+            One response per segment, in order, ending with an error response
+            if the stream reports a ``StreamError``
+        """
+        async with aclosing(segments) as texts:
+            async for segment in texts:
+                if isinstance(segment, StreamError):
+                    yield TTSResponse(error=segment.message)
+                    return
+                yield await self.generate(segment)
+    
     def cleanup(self):
         """Clean up resources."""
         if self.model is not None:
@@ -0,0 +1,259 @@
+"""Full-duplex voice conversations over a WebSocket."""
+
+import asyncio
+from contextlib import aclosing
+import json
+import logging
+from pathlib import Path
+import time
+from typing import Any, Callable, Dict, Optional
+import uuid
+from fastapi import WebSocket, WebSocketDisconnect
+from fastapi.websockets import WebSocketState
+from src.benchmarks import PerformanceMetrics
+from src.chat_pipeline import ChatEvent, ChatPipeline
+from src.llm import LLMClient
+
+class VoiceSession:
+    """One voice conversation kept open across many turns.
+
+    The session remembers its conversation history, model and voice between
+    turns. The client sends JSON text messages:
+
+    - ``{"type": "message", "content": ...}`` starts a turn
+    - ``{"type": "interrupt"}`` cancels the turn in progress
+    - ``{"type": "config", "model": ..., "voice": ...}`` changes the model or voice
+
+    The server answers with JSON messages (``session``, ``moderation``,
+    ``delta``, ``audio_start``, ``audio_end``, ``error``, ``interrupted``,
+    ``config`` and ``done``). Each segment's audio is sent as binary frames
+    between its ``audio_start`` and ``audio_end``. A new message while a turn
+    is still running is a barge-in: the running turn is cancelled, which
+    stops its LLM stream and any synthesis that has not started.
+    """
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        pipeline_factory: Callable[[str, str], ChatPipeline],
+        llm_client: LLMClient,
+        model: str,
+        voice: str,
+        audio_dir: str = "output/audio",
+        frame_bytes: int = 16384
+    ):
+        """Initialize the session.
+
+        Args:
+            websocket: Accepted WebSocket connection
+            pipeline_factory: Creates the pipeline for one turn from a model and voice
+            llm_client: Client whose conversation store holds the session history
+            model: Initial model
+            voice: Initial voice
+            audio_dir: Directory the TTS client writes audio files to
+            frame_bytes: Maximum size of one binary audio frame
+        """
+        self.websocket = websocket
+        self.pipeline_factory = pipeline_factory
+        self.llm_client = llm_client
+        self.model = model
+        self.voice = voice
+        self.audio_dir = Path(audio_dir)
+        self.frame_bytes = frame_bytes
+        self.session_id = uuid.uuid4().hex
+        self.turns = 0
+        self.frames_sent = 0
+        self.barge_ins = 0
+        # Seconds spent running turns, so idle time does not dilute frame rates
+        self.active_time = 0.0
+        self.logger = logging.getLogger(__name__)
+        self._turn: Optional[asyncio.Task] = None
+        self._warmup: Optional[asyncio.Task] = None
+        # Turns and control messages share the socket, so every send holds this lock
+        self._send_lock = asyncio.Lock()
+
+    async def run(self) -> None:
+        """Serve the session until the client disconnects."""
+        start_time = time.perf_counter()
+        try:
+            await self._send_json({
+                "type": "session",
+                "session_id": self.session_id,
+                "model": self.model,
+                "voice": self.voice
+            })
+            while True:
+                frame = await self.websocket.receive()
+                if frame["type"] == "websocket.disconnect":
+                    break
+                try:
+                    message = self._decode(frame)
+                except ValueError as e:
+                    # A bad frame is the client's mistake, the session stays open
+                    await self._send_json({"type": "error", "error": str(e)})
+                    continue
+                await self._handle(message)
+        except WebSocketDisconnect:
+            pass
+        finally:
+            await self._cancel_turn()
+            if self._warmup is not None and not self._warmup.done():
+                self._warmup.cancel()
+                await asyncio.gather(self._warmup, return_exceptions=True)
+            self.llm_client.sessions.drop(self.session_id)
+            PerformanceMetrics().record_metric(
+                "ws_frames_per_second",
+                self.frames_sent / self.active_time if self.active_time > 0 else 0.0,
+                {
+                    "session_id": self.session_id,
+                    "frames": self.frames_sent,
+                    "turns": self.turns,
+                    "barge_ins": self.barge_ins,
+                    "active_seconds": self.active_time,
+                    "session_seconds": time.perf_counter() - start_time
+                }
+            )
+
+    @staticmethod
+    def _decode(frame: Dict[str, Any]) -> Dict[str, Any]:
+        """Parse a received frame into a client message.
+
+        Raises:
+            ValueError: If the frame is binary or not a JSON object
+        """
+        text = frame.get("text")
+        if text is None:
+            raise ValueError("Messages must be JSON text, not binary")
+        try:
+            message = json.loads(text)
+        except ValueError:
+            raise ValueError("Messages must be JSON") from None
+        if not isinstance(message, dict):
+            raise ValueError("Messages must be JSON objects")
+        return message
+
+    async def _handle(self, message: Dict[str, Any]) -> None:
+        """Act on one client message."""
+        kind = message.get("type")
+        if kind == "message":
+            content = message.get("content")
+            if not isinstance(content, str) or not content.strip():
+                await self._send_json({"type": "error", "error": "Message content is required"})
+                return
+            await self._interrupt()
+            self.turns += 1
+            self._turn = asyncio.create_task(self._run_turn(self.turns, content))
+        elif kind == "interrupt":
+            await self._interrupt()
+        elif kind == "config":
+            await self._configure(message)
+        else:
+            await self._send_json({"type": "error", "error": f"Unknown message type: {kind}"})
+
+    async def _configure(self, message: Dict[str, Any]) -> None:
+        """Change the session's model or voice."""
+        model = message.get("model")
+        if model and model != self.model:
+            await self._interrupt()
+            # Ollama contexts are model specific, the next turn replays the history as a prompt instead
+            self.llm_client.sessions.drop_context(self.session_id)
+            self.model = model
+            # Warm the model in the background so interrupts are still read meanwhile
+            if self._warmup is not None and not self._warmup.done():
+                self._warmup.cancel()
+            self._warmup = asyncio.create_task(self._preload(model))
+        if message.get("voice"):
+            self.voice = message["voice"]
+        await self._send_json({"type": "config", "model": self.model, "voice": self.voice})
+
+    async def _preload(self, model: str) -> None:
+        """Load and warm a model the session switched to."""
+        try:
+            await self.llm_client.preload([model])
+        except Exception as e:
+            self.logger.warning(f"Warming up {model} failed: {e}")
+
+    async def _send_json(self, data: Dict[str, Any]) -> None:
+        """Send one JSON message without interleaving it with other sends."""
+        async with self._send_lock:
+            await self.websocket.send_json(data)
+
+    def _connected(self) -> bool:
+        """Whether both ends of the socket are still open."""
+        return (
+            self.websocket.client_state == WebSocketState.CONNECTED
+            and self.websocket.application_state == WebSocketState.CONNECTED
+        )
+
+    async def _interrupt(self) -> None:
+        """Cancel the turn in progress, if any, and tell the client."""
+        turn = self.turns
+        if await self._cancel_turn():
+            self.barge_ins += 1
+            PerformanceMetrics().record_metric("ws_barge_ins", 1, {"session_id": self.session_id})
+            await self._send_json({"type": "interrupted", "turn": turn})
+
+    async def _cancel_turn(self) -> bool:
+        """Cancel the running turn, returning whether there was one."""
+        if self._turn is None or self._turn.done():
+            return False
+        self._turn.cancel()
+        await asyncio.gather(self._turn, return_exceptions=True)
+        return True
+
+    async def _run_turn(self, turn: int, content: str) -> None:
+        """Stream one turn's events to the client."""
+        start_time = time.perf_counter()
+        first_audio = True
+        pipeline = self.pipeline_factory(self.model, self.voice)
+        try:
+            async with aclosing(pipeline.events(content, self.session_id)) as events:
+                async for event in events:
+                    if event.event == "token":
+                        await self._send_json({"type": "delta", "turn": turn, "text": event.data["text"]})
+                    elif event.event == "audio":
+                        if first_audio:
+                            # Time from the user's message until they can start hearing the reply
+                            first_audio = False
+                            PerformanceMetrics().record_metric(
+                                "ws_turn_latency",
+                                time.perf_counter() - start_time,
+                                {"session_id": self.session_id, "model": self.model}
+                            )
+                        await self._send_audio(turn, event)
+                    elif event.event == "summary":
+                        await self._send_json({"type": "done", "turn": turn, **event.data})
+                    else:
+                        await self._send_json({"type": event.event, "turn": turn, **event.data})
+        except WebSocketDisconnect:
+            # The client went away mid-turn, run() cleans up
+            pass
+        except Exception as e:
+            # Starlette raises RuntimeError when sending on a socket that has just closed
+            if not (isinstance(e, RuntimeError) and not self._connected()):
+                self.logger.error(f"Voice session turn failed: {e}")
+        finally:
+            self.active_time += time.perf_counter() - start_time
+
+    async def _send_audio(self, turn: int, event: ChatEvent) -> None:
+        """Send one segment's audio as binary frames."""
+        path = self.audio_dir / Path(event.data["url"]).name
+        try:
+            audio = await asyncio.to_thread(path.read_bytes)
+        except OSError as e:
+            await self._send_json({"type": "error", "turn": turn, "error": f"Audio unavailable: {e}"})
+            return
+        # Hold the lock for the whole segment so its frames stay between audio_start and audio_end
+        async with self._send_lock:
+            await self.websocket.send_json({
+                "type": "audio_start",
+                "turn": turn,
+                "index": event.data["index"],
+                "text": event.data["text"],
+                "bytes": len(audio)
+            })
+            view = memoryview(audio)
+            for start in range(0, len(audio), self.frame_bytes):
+                await self.websocket.send_bytes(bytes(view[start:start + self.frame_bytes]))
+                self.frames_sent += 1
+            await self.websocket.send_json({"type": "audio_end", "turn": turn, "index": event.data["index"]})
@@ -1,9 +1,112 @@
 import pytest
+import pytest_asyncio
+import asyncio
+import json
 import os
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Optional
 from src.config import Config, LLMConfig, TTSConfig, MacConfig
 from unittest.mock import patch, AsyncMock
 import httpx
-from src.llm import LLMResponse
+from src.cache import ResponseCache
+from src.llm import LLMClient, LLMResponse
+
+class FakeOllamaServer:
+    """Minimal local stand-in for Ollama that streams NDJSON tokens over HTTP/1.1."""
+    
+    def __init__(self, tokens: Optional[List[str]] = None, delay: float = 0.0):
+        self.tokens = tokens or ["Hello", " from", " fake", " Ollama."]
+        self.delay = delay  # Seconds to wait after each token
+        self.status_code = 200
+        self.fail_requests = 0  # Answer this many requests with 503 before recovering
+        self.first_token_delay = 0.0  # Seconds to wait before the first token
+        self.final_chunk: Dict[str, Any] = {}  # Extra fields for the final "done" chunk
+        self.connections = 0
+        self.tokens_sent = 0  # Tokens written across all streams
+        self.completed_streams = 0  # Streams that reached their final "done" chunk
+        self.open_streams = 0  # Streams still being written
+        self.requests: List[Dict[str, Any]] = []
+        self._server: Optional[asyncio.AbstractServer] = None
+    
+    @property
+    def url(self) -> str:
+        """Base URL the server is listening on."""
+        host, port = self._server.sockets[0].getsockname()[:2]
+        return f"http://{host}:{port}"
+    
+    async def start(self) -> None:
+        """Start listening on a free local port."""
+        self._server = await asyncio.start_server(self._handle_connection, "127.0.0.1", 0)
+    
+    async def stop(self) -> None:
+        """Stop the server."""
+        self._server.close()
+        await self._server.wait_closed()
+    
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Serve keep-alive requests on one connection until the client closes it."""
+        self.connections += 1
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode().partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                payload = json.loads(body) if body else {}
+                self.requests.append(payload)
+                await self._handle_request(request_line.decode().split()[1], payload, writer)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+    
+    async def _handle_request(self, path: str, payload: Dict[str, Any], writer: asyncio.StreamWriter) -> None:
+        """Respond to a single request."""
+        status_code = self.status_code
+        if self.fail_requests > 0:
+            self.fail_requests -= 1
+            status_code = 503
+        if status_code != 200:
+            body = b"Internal Server Error"
+            writer.write(
+                f"HTTP/1.1 {status_code} Error\r\nContent-Length: {len(body)}\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+            return
+        
+        writer.write(
+            b"HTTP/1.1 200 OK\r\n"
+            b"Content-Type: application/x-ndjson\r\n"
+            b"Transfer-Encoding: chunked\r\n\r\n"
+        )
+        await writer.drain()
+        self.open_streams += 1
+        try:
+            await asyncio.sleep(self.first_token_delay)
+            model = payload.get("model", "")
+            for token in self.tokens:
+                await self._write_chunk(writer, {"model": model, "response": token, "done": False})
+                self.tokens_sent += 1
+                await asyncio.sleep(self.delay)
+            await self._write_chunk(writer, {"model": model, "response": "", "done": True, **self.final_chunk})
+            writer.write(b"0\r\n\r\n")
+            await writer.drain()
+            self.completed_streams += 1
+        finally:
+            self.open_streams -= 1
+    
+    async def _write_chunk(self, writer: asyncio.StreamWriter, data: Dict[str, Any]) -> None:
+        """Write one NDJSON line as an HTTP chunk and flush it."""
+        line = (json.dumps(data) + "\n").encode()
+        writer.write(f"{len(line):x}\r\n".encode() + line + b"\r\n")
+        await writer.drain()
 
 @pytest.fixture
 def test_config() -> Config:
@@ -43,25 +146,48 @@ def test_mac_config(test_config: Config) -> MacConfig:
     """Get Mac configuration for testing."""
     return test_config.mac
 
+@pytest.fixture
+def make_llm_client(test_llm_config: LLMConfig, tmp_path):
+    """Create LLM clients whose response cache lives in a temporary directory.
+    
+    Keyword arguments override fields of the test LLM configuration, such as
+    ``base_url=fake_ollama.url`` to talk to the fake Ollama server.
+    """
+    def make(**overrides: Any) -> LLMClient:
+        return LLMClient(
+            test_llm_config.model_copy(update=overrides),
+            cache=ResponseCache(cache_dir=str(tmp_path / "cache"))
+        )
+    return make
+
+@pytest_asyncio.fixture
+async def fake_ollama():
+    """Run a local fake Ollama server for the duration of a test."""
+    server = FakeOllamaServer()
+    await server.start()
+    yield server
+    await server.stop()
+
 @pytest.fixture(autouse=True)
-def mock_llm_in_ci():
+def mock_llm_in_ci(request):
     """Mock the LLM client in CI environments to prevent connection failures."""
-    # Only mock in CI environment
-    if os.environ.get('CI') == 'true':
+    # Only mock in CI environment, and never for tests talking to the local fake server
+    if os.environ.get('CI') == 'true' and "fake_ollama" not in request.fixturenames:
         # Create a mock response with streaming data
-        async def mock_aiter_lines():
-            yield '{"response": "This is a mock response"}'
-            yield '{"response": " from the CI environment."}'
+        async def mock_aiter_bytes():
+            yield b'{"response": "This is a mock response"}\n'
+            yield b'{"response": " from the CI environment."}\n'
         
         # Create the mock response
         mock_response = httpx.Response(200)
-        mock_response.aiter_lines = mock_aiter_lines
+        mock_response.aiter_bytes = mock_aiter_bytes
         
-        # Create the async mock for the post method
-        async_mock = AsyncMock(return_value=mock_response)
+        @asynccontextmanager
+        async def mock_stream(*args, **kwargs):
+            yield mock_response
         
-        # Apply the patch for httpx.AsyncClient.post
-        with patch.object(httpx.AsyncClient, 'post', async_mock):
+        # Apply the patch for httpx.AsyncClient.stream
+        with patch.object(httpx.AsyncClient, 'stream', mock_stream):
             yield
     else:
         # No mocking outside CI
@@ -0,0 +1,144 @@
+"""Tests for admission control in front of the LLM."""
+
+import asyncio
+from unittest.mock import patch
+import pytest
+from src.admission import AdmissionController, AdmissionRejected
+
+async def hold(controller, model, release, started=None, timeout=None):
+    """Hold a slot until `release` is set."""
+    async with controller.admit(model, timeout=timeout):
+        if started is not None:
+            started.set()
+        await release.wait()
+
+@pytest.mark.asyncio
+async def test_limits_concurrency_per_model():
+    """Test that each model gets its own concurrency limit."""
+    controller = AdmissionController(max_concurrency=2, model_concurrency={"big": 1})
+    release = asyncio.Event()
+    tasks = [asyncio.create_task(hold(controller, "small", release)) for _ in range(3)]
+    tasks += [asyncio.create_task(hold(controller, "big", release)) for _ in range(2)]
+    await asyncio.sleep(0.01)
+    
+    assert controller.stats() == {
+        "small": {"active": 2, "queued": 1, "limit": 2},
+        "big": {"active": 1, "queued": 1, "limit": 1},
+    }
+    release.set()
+    await asyncio.gather(*tasks)
+    assert controller.stats()["small"] == {"active": 0, "queued": 0, "limit": 2}
+
+@pytest.mark.asyncio
+async def test_queue_is_fifo():
+    """Test that freed slots go to waiters in arrival order."""
+    controller = AdmissionController(max_concurrency=1)
+    order = []
+    release = asyncio.Event()
+    holder = asyncio.create_task(hold(controller, "phi", release))
+    await asyncio.sleep(0)
+    
+    async def wait_turn(name):
+        async with controller.admit("phi"):
+            order.append(name)
+    
+    waiters = [asyncio.create_task(wait_turn(name)) for name in "abc"]
+    await asyncio.sleep(0.01)
+    release.set()
+    await asyncio.gather(holder, *waiters)
+    assert order == ["a", "b", "c"]
+
+@pytest.mark.asyncio
+async def test_full_queue_rejects_with_429():
+    """Test that requests beyond the queue bound fail immediately."""
+    controller = AdmissionController(max_concurrency=1, max_queue=1)
+    release = asyncio.Event()
+    tasks = [asyncio.create_task(hold(controller, "phi", release)) for _ in range(2)]
+    await asyncio.sleep(0.01)
+    
+    with pytest.raises(AdmissionRejected) as rejected:
+        async with controller.admit("phi"):
+            pass
+    assert rejected.value.status_code == 429
+    
+    release.set()
+    await asyncio.gather(*tasks)
+
+@pytest.mark.asyncio
+async def test_waiter_dropped_at_deadline():
+    """Test that a queued request gives up with 503 once its deadline passes."""
+    controller = AdmissionController(max_concurrency=1)
+    release = asyncio.Event()
+    holder = asyncio.create_task(hold(controller, "phi", release))
+    await asyncio.sleep(0)
+    
+    with pytest.raises(AdmissionRejected) as rejected:
+        async with controller.admit("phi", timeout=0.05):
+            pass
+    assert rejected.value.status_code == 503
+    assert controller.stats()["phi"]["queued"] == 0
+    
+    release.set()
+    await holder
+    assert controller.stats()["phi"]["active"] == 0
+
+@pytest.mark.asyncio
+async def test_rejects_when_expected_wait_exceeds_deadline():
+    """Test that requests which cannot start in time are rejected up front."""
+    controller = AdmissionController(max_concurrency=1)
+    queue = controller._queue("phi")
+    queue.service_time = 5.0  # Requests have been taking five seconds each
+    release = asyncio.Event()
+    holder = asyncio.create_task(hold(controller, "phi", release))
+    await asyncio.sleep(0)
+    
+    with pytest.raises(AdmissionRejected) as rejected:
+        async with controller.admit("phi", timeout=1.0):
+            pass
+    assert rejected.value.status_code == 503
+    assert rejected.value.retry_after == 5.0
+    
+    release.set()
+    await holder
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_leaves_queue():
+    """Test that a cancelled waiter neither blocks the queue nor leaks a slot."""
+    controller = AdmissionController(max_concurrency=1)
+    release = asyncio.Event()
+    holder = asyncio.create_task(hold(controller, "phi", release))
+    await asyncio.sleep(0)
+    waiter = asyncio.create_task(hold(controller, "phi", asyncio.Event()))
+    await asyncio.sleep(0.01)
+    
+    waiter.cancel()
+    await asyncio.gather(waiter, return_exceptions=True)
+    assert controller.stats()["phi"]["queued"] == 0
+    
+    release.set()
+    await holder
+    assert controller.stats()["phi"]["active"] == 0
+    async with controller.admit("phi", timeout=0):
+        pass
+
+@pytest.mark.asyncio
+async def test_records_queue_metrics():
+    """Test that queue depth and wait time are recorded."""
+    controller = AdmissionController(max_concurrency=1)
+    release = asyncio.Event()
+    with patch("src.admission.PerformanceMetrics") as mock_metrics:
+        holder = asyncio.create_task(hold(controller, "phi", release))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(hold(controller, "phi", asyncio.Event()))
+        await asyncio.sleep(0.02)
+        release.set()
+        await holder
+        await asyncio.sleep(0.01)  # Let the waiter take over the slot
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+    
+    calls = mock_metrics.return_value.record_metric.call_args_list
+    assert ("admission_queue_depth", 1, {"model": "phi"}) in [call.args for call in calls]
+    wait_times = [call.args[1] for call in calls if call.args[0] == "admission_wait_time"]
+    assert len(wait_times) == 2
+    assert max(wait_times) >= 0.02
@@ -0,0 +1,136 @@
+"""Tests for routing across several Ollama backends."""
+
+import asyncio
+import httpx
+import pytest
+from src.backend_pool import BackendPool
+from tests.conftest import FakeOllamaServer
+
+URLS = ["http://a:11434", "http://b:11434", "http://c:11434"]
+
+@pytest.mark.asyncio
+async def test_routes_to_least_outstanding_backend():
+    """Test that new requests avoid busy backends."""
+    pool = BackendPool(URLS)
+    async with pool.lease() as first:
+        async with pool.lease() as second:
+            async with pool.lease() as third:
+                assert {first.url, second.url, third.url} == set(URLS)
+                assert [backend["in_flight"] for backend in pool.stats()] == [1, 1, 1]
+    assert [backend["in_flight"] for backend in pool.stats()] == [0, 0, 0]
+
+@pytest.mark.asyncio
+async def test_lease_tracks_latency():
+    """Test that the latency gauge follows reported header latency, not the lease duration."""
+    pool = BackendPool(URLS[:1], latency_smoothing=0.5)
+    async with pool.lease() as backend:
+        pool.record_latency(backend, 0.02)
+        await asyncio.sleep(0.05)
+    assert backend.latency == 0.02
+    
+    async with pool.lease() as backend:
+        pool.record_latency(backend, 0.04)
+    assert backend.latency == pytest.approx(0.03)
+    assert pool.stats()[0]["requests"] == 2
+
+@pytest.mark.asyncio
+async def test_transport_errors_eject_backend():
+    """Test passive ejection after consecutive transport errors."""
+    pool = BackendPool(URLS[:2], eject_after_failures=2, eject_duration=60)
+    failing = pool.backends[0]
+    pool.backends[1].in_flight = 10  # Busy, so requests are routed to the first backend
+    for _ in range(2):
+        with pytest.raises(httpx.ConnectError):
+            async with pool.lease():
+                raise httpx.ConnectError("refused")
+    pool.backends[1].in_flight = 0
+    
+    assert pool.stats()[0]["ejected"] is True
+    assert failing.failures == 2
+    assert all(pool.choose() is pool.backends[1] for _ in range(5))
+
+def test_all_ejected_fails_open():
+    """Test that requests still go somewhere when every backend is ejected."""
+    pool = BackendPool(URLS[:2], eject_after_failures=1)
+    for backend in pool.backends:
+        pool.record_failure(backend)
+    assert pool.choose() in pool.backends
+
+def test_model_affinity():
+    """Test that a model sticks to its backend while that backend is available."""
+    pool = BackendPool(URLS, model_affinity=True, eject_after_failures=1)
+    backend = pool.choose("phi")
+    backend.in_flight = 5  # Busier than the others, but the model is loaded there
+    assert pool.choose("phi") is backend
+    assert pool.choose("mistral") is not backend
+    
+    pool.record_failure(backend)
+    moved = pool.choose("phi")
+    assert moved is not backend
+    assert pool.choose("phi") is moved
+
+@pytest.mark.asyncio
+async def test_health_checks():
+    """Test that failed health checks remove a backend until it recovers."""
+    pool = BackendPool(URLS[:2], eject_after_failures=1)
+    down = {URLS[0]}
+    
+    async def check(backend):
+        if backend.url in down:
+            raise httpx.ConnectError("refused")
+        return True
+    
+    await pool.check_health(check)
+    assert [backend["healthy"] for backend in pool.stats()] == [False, True]
+    assert pool.choose() is pool.backends[1]
+    
+    pool.record_failure(pool.backends[1])
+    down.clear()
+    await pool.check_health(check)
+    # A passing check also ends the passive ejection of the second backend
+    assert [backend["healthy"] for backend in pool.stats()] == [True, True]
+    assert not any(backend["ejected"] for backend in pool.stats())
+
+def test_pool_requires_backends():
+    """Test that an empty pool is rejected."""
+    with pytest.raises(ValueError):
+        BackendPool([])
+
+@pytest.mark.asyncio
+async def test_llm_client_spreads_requests_across_backends(make_llm_client, fake_ollama):
+    """Test that concurrent generations are spread over every configured host."""
+    second = FakeOllamaServer()
+    await second.start()
+    fake_ollama.delay = second.delay = 0.05
+    client = make_llm_client(base_urls=[fake_ollama.url, second.url])
+    
+    try:
+        responses = await asyncio.gather(*(client.generate(f"Prompt {i}") for i in range(4)))
+    finally:
+        await client.aclose()
+        await second.stop()
+    
+    assert all(response.error is None for response in responses)
+    assert len(fake_ollama.requests) == 2
+    assert len(second.requests) == 2
+
+@pytest.mark.asyncio
+async def test_llm_client_ejects_failing_backend(make_llm_client, fake_ollama):
+    """Test that a host returning server errors stops receiving requests."""
+    broken = FakeOllamaServer()
+    broken.status_code = 500
+    await broken.start()
+    client = make_llm_client(
+        base_urls=[broken.url, fake_ollama.url],
+        eject_after_failures=1
+    )
+    
+    try:
+        responses = [await client.generate(f"Prompt {i}") for i in range(4)]
+    finally:
+        await client.aclose()
+        await broken.stop()
+    
+    assert len(broken.requests) == 1
+    assert sum(response.error is None for response in responses) == 3
+    assert client.backends.stats()[0]["ejected"] is True
@@ -1,10 +1,13 @@
 """Tests for the benchmarking module."""
 
+import asyncio
 import json
+import multiprocessing
 import time
 from pathlib import Path
+from unittest.mock import patch
 import pytest
-from src.benchmarks import PerformanceMetrics, benchmark, get_system_metrics
+from src.benchmarks import MetricsSink, PerformanceMetrics, StreamTimer, benchmark, get_system_metrics, load_metrics
 
 @pytest.fixture
 def temp_metrics_file(tmp_path):
@@ -23,8 +26,8 @@ def test_record_metric(temp_metrics_file):
     metrics.record_metric("test_category", 1.23, {"test_meta": "value"})
     
     # Verify metric was saved
-    with open(temp_metrics_file, 'r') as f:
-        saved_metrics = json.load(f)
+    metrics.sink.flush()
+    saved_metrics = load_metrics(temp_metrics_file)
     
     assert "test_category" in saved_metrics
     assert len(saved_metrics["test_category"]) == 1
@@ -71,4 +74,214 @@ def test_metrics_file_corruption_handling(temp_metrics_file):
         f.write("invalid json content")
     
     metrics = PerformanceMetrics(temp_metrics_file)
-    assert metrics.metrics == {} 
\ No newline at end of file
+    assert metrics.metrics == {}
+
+def test_stream_timer():
+    """Test time to first token and inter-token latency tracking."""
+    timer = StreamTimer()
+    assert timer.time_to_first_token is None
+    assert timer.inter_token_latency is None
+    
+    time.sleep(0.05)
+    timer.mark_token()
+    time.sleep(0.02)
+    timer.mark_token()
+    timer.mark_token()
+    
+    summary = timer.summary()
+    assert summary["token_count"] == 3
+    assert summary["time_to_first_token"] >= 0.05
+    assert summary["inter_token_latency_max"] >= 0.02
+    assert 0.01 <= summary["inter_token_latency_mean"] < summary["time_to_first_token"]
+
+@pytest.fixture
+def recorded_metrics(temp_metrics_file):
+    """Route metrics recorded by the benchmark decorator to a temporary file."""
+    with patch('src.benchmarks.PerformanceMetrics', side_effect=lambda: PerformanceMetrics(temp_metrics_file)):
+        yield lambda: PerformanceMetrics(temp_metrics_file).metrics
+
+@pytest.mark.asyncio
+async def test_benchmark_coroutine_execution_time(recorded_metrics):
+    """Test that coroutines are timed until completion, not creation."""
+    
+    @benchmark("async_func")
+    async def async_function() -> str:
+        await asyncio.sleep(0.1)
+        return "done"
+    
+    assert await async_function() == "done"
+    
+    time_metric = recorded_metrics()["async_func_time"][0]
+    assert time_metric["value"] >= 0.1
+    assert time_metric["function"] == "async_function"
+    assert "async_func_memory" in recorded_metrics()
+
+@pytest.mark.asyncio
+async def test_benchmark_async_generator(recorded_metrics):
+    """Test that async generators are timed per item."""
+    
+    @benchmark("async_gen")
+    async def async_generator():
+        for i in range(3):
+            await asyncio.sleep(0.05)
+            yield i
+    
+    items = [item async for item in async_generator()]
+    assert items == [0, 1, 2]
+    
+    metrics = recorded_metrics()
+    assert metrics["async_gen_first_item_time"][0]["value"] >= 0.05
+    assert metrics["async_gen_time"][0]["value"] >= 0.15
+    assert metrics["async_gen_time"][0]["items"] == 3
+    assert metrics["async_gen_first_item_time"][0]["value"] < metrics["async_gen_time"][0]["value"]
+
+@pytest.mark.asyncio
+async def test_benchmark_async_generator_closed_early(recorded_metrics):
+    """Test that closing a benchmarked generator closes the wrapped one straight away."""
+    closed = []
+    
+    @benchmark("async_gen")
+    async def async_generator():
+        try:
+            for i in range(10):
+                yield i
+        finally:
+            closed.append(True)
+    
+    stream = async_generator()
+    assert await stream.__anext__() == 0
+    await stream.aclose()
+    
+    assert closed == [True]
+    assert recorded_metrics()["async_gen_time"][0]["items"] == 1
+
+@pytest.mark.asyncio
+async def test_benchmark_bare_decorator(recorded_metrics):
+    """Test bare @benchmark usage on sync and async functions."""
+    
+    @benchmark
+    def sync_function() -> int:
+        return 1
+    
+    @benchmark
+    async def async_function() -> int:
+        return 2
+    
+    assert sync_function() == 1
+    assert await async_function() == 2
+    assert sync_function.__name__ == "sync_function"
+    
+    metrics = recorded_metrics()
+    assert metrics["sync_function_time"][0]["function"] == "sync_function"
+    assert metrics["async_function_time"][0]["function"] == "async_function"
+
+def write_metrics_in_worker(metrics_file: str, worker: int, count: int) -> None:
+    """Record metrics from a separate process."""
+    sink = MetricsSink(metrics_file, max_buffer=7, flush_interval=0.01)
+    for i in range(count):
+        sink.record({"category": "worker", "value": i, "worker": worker, "padding": "x" * 512})
+    sink.close()
+
+def test_metrics_sink_appends_jsonl(temp_metrics_file):
+    """Test that recorded metrics are appended as JSON lines."""
+    sink = MetricsSink(temp_metrics_file, max_buffer=100, flush_interval=60)
+    sink.record({"category": "latency", "value": 1.0})
+    sink.record({"category": "latency", "value": 2.0})
+    
+    # Nothing is written until the buffer is flushed
+    assert Path(temp_metrics_file).read_text() == ""
+    
+    sink.flush()
+    lines = Path(temp_metrics_file).read_text().splitlines()
+    assert [json.loads(line)["value"] for line in lines] == [1.0, 2.0]
+    sink.close()
+
+def test_metrics_sink_size_trigger(temp_metrics_file):
+    """Test that the background thread flushes once the buffer is full."""
+    sink = MetricsSink(temp_metrics_file, max_buffer=3, flush_interval=60)
+    for i in range(3):
+        sink.record({"category": "latency", "value": i})
+    
+    deadline = time.time() + 2
+    while time.time() < deadline and not Path(temp_metrics_file).read_text():
+        time.sleep(0.01)
+    
+    assert len(load_metrics(temp_metrics_file)["latency"]) == 3
+    sink.close()
+
+def test_metrics_sink_time_trigger(temp_metrics_file):
+    """Test that buffered records are flushed after the flush interval."""
+    sink = MetricsSink(temp_metrics_file, max_buffer=100, flush_interval=0.05)
+    sink.record({"category": "latency", "value": 1.0})
+    
+    deadline = time.time() + 2
+    while time.time() < deadline and not Path(temp_metrics_file).read_text():
+        time.sleep(0.01)
+    
+    assert load_metrics(temp_metrics_file) == {"latency": [{"value": 1.0}]}
+    sink.close()
+
+def test_load_legacy_metrics_file(temp_metrics_file):
+    """Test that the legacy JSON format is still readable and converted on open."""
+    legacy = {"llm_generate_time": [{"timestamp": "2025-01-01T00:00:00", "value": 0.5, "function": "generate"}]}
+    with open(temp_metrics_file, 'w') as f:
+        json.dump(legacy, f, indent=2)
+    
+    assert load_metrics(temp_metrics_file) == legacy
+    
+    # Opening a sink converts the file so new records can be appended
+    metrics = PerformanceMetrics(temp_metrics_file)
+    metrics.record_metric("llm_generate_time", 0.7, {"function": "generate"})
+    
+    values = [record["value"] for record in metrics.metrics["llm_generate_time"]]
+    assert values == [0.5, 0.7]
+
+def test_corrupt_legacy_metrics_file_is_kept(temp_metrics_file, caplog):
+    """Test that an unreadable legacy file is moved aside instead of being compacted to nothing."""
+    truncated = '{\n  "llm_generate_time": [\n    {"value": 0.5'
+    with open(temp_metrics_file, 'w') as f:
+        f.write(truncated)
+    
+    metrics = PerformanceMetrics(temp_metrics_file)
+    metrics.record_metric("llm_generate_time", 0.7, {"function": "generate"})
+    
+    assert Path(temp_metrics_file + ".corrupt").read_text() == truncated
+    assert "Moved unreadable metrics file" in caplog.text
+    assert [record["value"] for record in metrics.metrics["llm_generate_time"]] == [0.7]
+
+def test_metrics_sink_compaction(temp_metrics_file):
+    """Test compaction keeps only the newest records per category."""
+    sink = MetricsSink(temp_metrics_file, max_buffer=100, flush_interval=60)
+    for i in range(5):
+        sink.record({"category": "a", "value": i})
+    sink.record({"category": "b", "value": 10})
+    
+    sink.compact(max_records_per_category=2)
+    
+    metrics = load_metrics(temp_metrics_file)
+    assert [record["value"] for record in metrics["a"]] == [3, 4]
+    assert [record["value"] for record in metrics["b"]] == [10]
+    sink.close()
+
+def test_performance_metrics_share_sink(temp_metrics_file):
+    """Test that every tracker for a file shares one sink."""
+    first = PerformanceMetrics(temp_metrics_file)
+    second = PerformanceMetrics(temp_metrics_file)
+    assert first.sink is second.sink
+
+def test_metrics_sink_concurrent_processes(temp_metrics_file):
+    """Test that concurrent worker processes do not corrupt the file."""
+    context = multiprocessing.get_context("spawn")
+    workers = [
+        context.Process(target=write_metrics_in_worker, args=(temp_metrics_file, worker, 200))
+        for worker in range(4)
+    ]
+    for process in workers:
+        process.start()
+    for process in workers:
+        process.join(timeout=60)
+        assert process.exitcode == 0
+    
+    lines = Path(temp_metrics_file).read_text().splitlines()
+    assert len(lines) == 800
+    assert all(json.loads(line)["category"] == "worker" for line in lines)
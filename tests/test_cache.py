@@ -1,11 +1,13 @@
 """Tests for the caching module."""
 
 import json
+import threading
 import time
 from pathlib import Path
 from datetime import datetime, timedelta
+from unittest.mock import patch
 import pytest
-from src.cache import ResponseCache
+from src.cache import MemoryTier, ResponseCache
 
 @pytest.fixture
 def cache_dir(tmp_path):
@@ -13,9 +15,23 @@ def cache_dir(tmp_path):
     return str(tmp_path / "test_cache")
 
 @pytest.fixture
-def cache(cache_dir):
+def make_cache(cache_dir):
+    """Create caches over the temporary directory, closing them after the test."""
+    caches = []
+    
+    def make(**kwargs) -> ResponseCache:
+        cache = ResponseCache(cache_dir=cache_dir, **kwargs)
+        caches.append(cache)
+        return cache
+    
+    yield make
+    for cache in caches:
+        cache.close()
+
+@pytest.fixture
+def cache(make_cache):
     """Create a test cache instance."""
-    return ResponseCache(cache_dir=cache_dir, ttl_hours=24)
+    return make_cache(ttl_hours=24)
 
 def test_cache_initialization(cache_dir):
     """Test cache initialization."""
@@ -55,6 +71,12 @@ def test_cache_set_and_get(cache):
     assert cache.get(model, "different prompt", temp=0.7) is None
     assert cache.get("different-model", prompt, temp=0.7) is None
 
+def test_cache_set_rejects_non_string_response(cache):
+    """Test that only text responses can be cached."""
+    with pytest.raises(TypeError):
+        cache.set("test-model", "test prompt", {"text": "not a string"})
+    assert cache.get("test-model", "test prompt") is None
+
 def test_cache_expiration(cache_dir):
     """Test cache entry expiration."""
     # Create cache with short TTL
@@ -135,4 +157,132 @@ def test_cache_file_structure(cache):
     assert data["model"] == model
     assert data["prompt"] == prompt
     assert data["response"] == response
-    assert data["parameters"] == params 
\ No newline at end of file
+    assert data["parameters"] == params
+
+def test_cache_memory_tier_serves_without_disk(cache):
+    """Test that repeated lookups are served from memory without touching disk."""
+    cache.set("model1", "prompt1", "response1")
+    
+    with patch("builtins.open", side_effect=AssertionError("disk accessed")), \
+         patch.object(Path, "exists", side_effect=AssertionError("disk accessed")):
+        assert cache.get("model1", "prompt1") == "response1"
+        assert cache.get("model1", "prompt1") == "response1"
+    
+    stats = cache.stats()
+    assert stats["memory_hits"] == 2
+    assert stats["disk_hits"] == 0
+
+def test_cache_promotes_disk_entries(make_cache):
+    """Test that a disk hit is promoted into the memory tier."""
+    make_cache().set("model1", "prompt1", "response1")
+    
+    # A fresh instance starts with an empty memory tier
+    cache = make_cache()
+    assert cache.get("model1", "prompt1") == "response1"
+    assert cache.get("model1", "prompt1") == "response1"
+    assert cache.get("model1", "missing") is None
+    
+    stats = cache.stats()
+    assert stats["disk_hits"] == 1
+    assert stats["memory_hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["hits"] == 2
+
+def test_cache_memory_tier_entry_limit(make_cache):
+    """Test least recently used entries are evicted over the entry budget."""
+    cache = make_cache(memory_max_entries=2)
+    cache.set("model", "a", "response a")
+    cache.set("model", "b", "response b")
+    cache.get("model", "a")  # Mark "a" as recently used
+    cache.set("model", "c", "response c")
+    
+    key_a = cache._compute_key("model", "a")
+    key_b = cache._compute_key("model", "b")
+    assert cache.memory.get(key_a, time.time()) == "response a"
+    assert cache.memory.get(key_b, time.time()) is None
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["memory_entries"] == 2
+    
+    # Evicted entries are still served from disk
+    assert cache.get("model", "b") == "response b"
+
+def test_cache_memory_tier_byte_limit(make_cache):
+    """Test the memory tier stays within its byte budget."""
+    cache = make_cache(memory_max_bytes=300)
+    for i in range(5):
+        cache.set("model", f"prompt {i}", "x" * 100)
+    
+    stats = cache.stats()
+    assert stats["memory_bytes"] <= 300
+    assert stats["evictions"] > 0
+
+def test_cache_memory_tier_expiry():
+    """Test that expired memory entries are dropped without I/O."""
+    memory = MemoryTier()
+    memory.put("key", "response", expires_at=100.0)
+    
+    assert memory.get("key", now=99.0) == "response"
+    assert memory.get("key", now=101.0) is None
+    assert len(memory) == 0
+    assert memory.size_bytes == 0
+
+@pytest.mark.asyncio
+async def test_cache_async_get_and_set(cache):
+    """Test the non-blocking cache API."""
+    assert await cache.aget("model", "prompt") is None
+    
+    await cache.aset("model", "prompt", "response", temp=0.7)
+    assert await cache.aget("model", "prompt", temp=0.7) == "response"
+    
+    # The write-behind queue eventually persists the entry
+    cache.flush()
+    assert cache._get_cache_file(cache._compute_key("model", "prompt", temp=0.7)).exists()
+
+@pytest.mark.asyncio
+async def test_cache_async_set_does_not_wait_for_backend(cache):
+    """Test that aset returns before a slow backend write completes."""
+    with patch.object(cache.backend, "write", side_effect=lambda *args: time.sleep(0.5)):
+        start_time = time.perf_counter()
+        await cache.aset("model", "prompt", "response")
+        assert time.perf_counter() - start_time < 0.1
+        
+        # Visible from memory straight away
+        assert await cache.aget("model", "prompt") == "response"
+        cache.flush()
+
+@pytest.mark.asyncio
+async def test_cache_async_get_reads_backend_off_loop(make_cache):
+    """Test that backend reads for aget run on the I/O pool."""
+    make_cache().set("model", "prompt", "response")
+    cache = make_cache()
+    
+    loop_thread = threading.get_ident()
+    read_threads = []
+    original_read = cache.backend.read
+    def recording_read(key):
+        read_threads.append(threading.get_ident())
+        return original_read(key)
+    
+    with patch.object(cache.backend, "read", side_effect=recording_read):
+        assert await cache.aget("model", "prompt") == "response"
+    
+    assert read_threads and loop_thread not in read_threads
+
+@pytest.mark.asyncio
+async def test_cache_write_queue_is_bounded(make_cache):
+    """Test that writes are dropped rather than queued without limit."""
+    cache = make_cache(write_queue_size=2)
+    release = threading.Event()
+    
+    with patch.object(cache.backend, "write", side_effect=lambda *args: release.wait(5)):
+        for i in range(10):
+            await cache.aset("model", f"prompt {i}", "response")
+        
+        stats = cache.stats()
+        assert stats["dropped_writes"] > 0
+        assert stats["pending_writes"] <= 2
+        release.set()
+        cache.flush()
+    
+    # Dropped durable writes are still served from memory
+    assert await cache.aget("model", "prompt 9") == "response"
@@ -0,0 +1,286 @@
+"""Tests for the cache storage backends."""
+
+import asyncio
+import json
+import os
+import sqlite3
+import time
+from datetime import datetime, timedelta
+from unittest.mock import patch
+import pytest
+from src.cache import CacheSweeper, ResponseCache
+from src.cache_backends import FileCacheBackend, SQLiteCacheBackend, migrate_cache
+from src.config import CacheConfig
+
+def make_entry(response: str, age: timedelta = timedelta(0)) -> dict:
+    """Create a cache entry written `age` ago."""
+    return {
+        "timestamp": (datetime.now() - age).isoformat(),
+        "model": "test-model",
+        "prompt": "test prompt",
+        "response": response,
+        "parameters": {"temp": 0.7}
+    }
+
+@pytest.fixture
+def sqlite_backend(tmp_path):
+    """Create a SQLite backend in a temporary directory."""
+    backend = SQLiteCacheBackend(str(tmp_path / "cache.db"), batch_size=4, flush_interval=60)
+    yield backend
+    backend.close()
+
+def test_sqlite_backend_schema(sqlite_backend):
+    """Test WAL mode, the primary key and the timestamp index."""
+    conn = sqlite3.connect(str(sqlite_backend.db_path))
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    indexes = [row[1] for row in conn.execute("PRAGMA index_list(responses)")]
+    assert "idx_responses_timestamp" in indexes
+    primary_key = [row[1] for row in conn.execute("PRAGMA table_info(responses)") if row[5]]
+    assert primary_key == ["key"]
+    conn.close()
+
+def test_sqlite_backend_round_trip(sqlite_backend):
+    """Test writing and reading back an entry."""
+    entry = make_entry("test response")
+    sqlite_backend.write("key1", entry)
+    
+    assert sqlite_backend.read("key1") == entry
+    sqlite_backend.flush()
+    assert sqlite_backend.read("key1") == entry
+    assert sqlite_backend.read("missing") is None
+    
+    sqlite_backend.delete("key1")
+    assert sqlite_backend.read("key1") is None
+
+def test_sqlite_backend_batches_writes(sqlite_backend):
+    """Test that writes are committed in batches."""
+    def committed_rows() -> int:
+        conn = sqlite3.connect(str(sqlite_backend.db_path))
+        count = conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        conn.close()
+        return count
+    
+    for i in range(3):
+        sqlite_backend.write(f"key{i}", make_entry(f"response {i}"))
+    assert committed_rows() == 0
+    
+    sqlite_backend.write("key3", make_entry("response 3"))
+    assert committed_rows() == 4
+
+def test_sqlite_backend_commits_idle_writes(tmp_path):
+    """Test that a buffered write is committed after the flush interval even if no more writes arrive."""
+    backend = SQLiteCacheBackend(str(tmp_path / "cache.db"), batch_size=100, flush_interval=0.05)
+    backend.write("key", make_entry("response"))
+    
+    conn = sqlite3.connect(str(backend.db_path))
+    deadline = time.monotonic() + 2
+    while time.monotonic() < deadline and conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0] == 0:
+        time.sleep(0.01)
+    
+    assert conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0] == 1
+    conn.close()
+    backend.close()
+
+def test_sqlite_backend_purge_expired(sqlite_backend):
+    """Test bulk removal of entries older than the cutoff."""
+    sqlite_backend.write("old", make_entry("old", age=timedelta(hours=48)))
+    sqlite_backend.write("new", make_entry("new"))
+    
+    removed, reclaimed = sqlite_backend.purge_expired(datetime.now() - timedelta(hours=24))
+    
+    assert removed == 1
+    assert reclaimed > 0
+    assert sqlite_backend.read("old") is None
+    assert sqlite_backend.read("new") is not None
+
+def test_response_cache_with_sqlite_backend(tmp_path, sqlite_backend):
+    """Test the response cache on top of the SQLite backend."""
+    cache = ResponseCache(cache_dir=str(tmp_path / "unused"), backend=sqlite_backend)
+    cache.set("model", "prompt", "response", temp=0.7)
+    
+    # A fresh cache over the same backend has to read through to SQLite
+    fresh = ResponseCache(cache_dir=str(tmp_path / "unused"), backend=sqlite_backend)
+    assert fresh.get("model", "prompt", temp=0.7) == "response"
+    assert fresh.stats()["disk_hits"] == 1
+    
+    fresh.clear()
+    assert sqlite_backend.read(cache._compute_key("model", "prompt", temp=0.7)) is None
+
+def test_response_cache_from_config(tmp_path):
+    """Test selecting the backend from configuration."""
+    config = CacheConfig(backend="sqlite", sqlite_path=str(tmp_path / "cache.db"), cache_dir=str(tmp_path / "files"))
+    cache = ResponseCache.from_config(config)
+    assert isinstance(cache.backend, SQLiteCacheBackend)
+    cache.close()
+    
+    cache = ResponseCache.from_config(config.model_copy(update={"backend": "file"}))
+    assert isinstance(cache.backend, FileCacheBackend)
+
+def test_migrate_json_cache_to_sqlite(tmp_path, sqlite_backend):
+    """Test importing existing JSON cache files into SQLite."""
+    file_backend = FileCacheBackend(str(tmp_path / "files"))
+    for i in range(3):
+        file_backend.write(f"key{i}", make_entry(f"response {i}"))
+    (tmp_path / "files" / "broken.json").write_text("invalid json content")
+    with open(tmp_path / "files" / "incomplete.json", "w") as f:
+        json.dump({"model": "test-model"}, f)
+    
+    migrated = migrate_cache(file_backend, sqlite_backend, batch_size=2)
+    
+    assert migrated == 3
+    for i in range(3):
+        assert sqlite_backend.read(f"key{i}")["response"] == f"response {i}"
+    assert sqlite_backend.read("incomplete") is None
+
+def test_migrate_skips_malformed_legacy_entries(tmp_path, sqlite_backend):
+    """Test that malformed legacy entries are skipped without losing the valid ones."""
+    file_backend = FileCacheBackend(str(tmp_path / "files"))
+    file_backend.write("good", make_entry("fine"))
+    file_backend.write("bad_timestamp", {**make_entry("late"), "timestamp": "yesterday"})
+    file_backend.write("bad_response", {**make_entry("unused"), "response": {"text": "not a string"}})
+    (tmp_path / "files" / "not_an_object.json").write_text("[1, 2]")
+    
+    migrated = migrate_cache(file_backend, sqlite_backend, batch_size=2)
+    
+    assert migrated == 1
+    assert sqlite_backend.read("good")["response"] == "fine"
+    for key in ("bad_timestamp", "bad_response", "not_an_object"):
+        assert sqlite_backend.read(key) is None
+
+def test_sqlite_backend_bad_entry_keeps_buffered_writes(sqlite_backend):
+    """Test that one unstorable entry does not lose the other buffered writes."""
+    sqlite_backend.write("key0", make_entry("response 0"))
+    with pytest.raises(ValueError):
+        sqlite_backend.write("bad", {**make_entry("unused"), "timestamp": "not a date"})
+    # An entry that slipped into the buffer is dropped when the batch is committed
+    sqlite_backend._pending["slipped"] = {**make_entry("unused"), "timestamp": "not a date"}
+    sqlite_backend.write("key1", make_entry("response 1"))
+    sqlite_backend.flush()
+    
+    assert sqlite_backend._pending == {}
+    assert sqlite_backend.usage()[0] == 2
+    assert sqlite_backend.read("key1")["response"] == "response 1"
+
+def test_sqlite_backend_lru_eviction(sqlite_backend):
+    """Test least recently used entries are evicted over the entry budget."""
+    for i in range(4):
+        sqlite_backend.write(f"key{i}", make_entry(f"response {i}", age=timedelta(minutes=10 - i)))
+    sqlite_backend.record_access({"key0": (datetime.now().timestamp(), 1)})
+    
+    removed, reclaimed = sqlite_backend.evict(max_entries=2, max_bytes=None, policy="lru")
+    
+    assert removed == 2
+    assert reclaimed > 0
+    assert sqlite_backend.usage()[0] == 2
+    assert sqlite_backend.read("key0") is not None
+    assert sqlite_backend.read("key3") is not None
+
+def test_sqlite_backend_lfu_eviction(sqlite_backend):
+    """Test least frequently used entries are evicted first."""
+    for i in range(3):
+        sqlite_backend.write(f"key{i}", make_entry(f"response {i}"))
+    now = datetime.now().timestamp()
+    sqlite_backend.record_access({"key0": (now, 5), "key2": (now, 2)})
+    
+    sqlite_backend.evict(max_entries=2, max_bytes=None, policy="lfu")
+    
+    assert sqlite_backend.read("key1") is None
+    assert sqlite_backend.read("key0") is not None
+
+def test_sqlite_backend_byte_budget(sqlite_backend):
+    """Test eviction until the byte budget is met, bounded by the batch limit."""
+    for i in range(10):
+        sqlite_backend.write(f"key{i}", make_entry("x" * 1000))
+    
+    removed, _ = sqlite_backend.evict(max_entries=None, max_bytes=3500, limit=4)
+    assert removed == 4
+    
+    sqlite_backend.evict(max_entries=None, max_bytes=3500)
+    assert sqlite_backend.usage()[1] <= 3500
+
+def test_file_backend_lru_eviction(tmp_path):
+    """Test the file backend evicts the least recently touched files."""
+    backend = FileCacheBackend(str(tmp_path / "files"))
+    for i in range(3):
+        backend.write(f"key{i}", make_entry(f"response {i}"))
+    now = datetime.now().timestamp()
+    backend.record_access({"key0": (now - 30, 1), "key1": (now - 60, 1), "key2": (now, 1)})
+    
+    removed, reclaimed = backend.evict(max_entries=1, max_bytes=None)
+    
+    assert removed == 2
+    assert reclaimed > 0
+    assert backend.usage()[0] == 1
+    assert backend.read("key2") is not None
+
+def test_file_backend_access_keeps_write_time(tmp_path):
+    """Test that recording a hit does not make an expired file look freshly written."""
+    backend = FileCacheBackend(str(tmp_path / "files"))
+    backend.write("old", make_entry("stale", age=timedelta(hours=48)))
+    written = (datetime.now() - timedelta(hours=48)).timestamp()
+    os.utime(backend.path_for("old"), (written, written))
+    
+    backend.record_access({"old": (datetime.now().timestamp(), 1)})
+    
+    assert backend.path_for("old").stat().st_mtime == pytest.approx(written)
+    with patch.object(backend, "read", wraps=backend.read) as read:
+        assert backend.purge_expired(datetime.now() - timedelta(hours=24))[0] == 1
+    # The mtime alone proved expiry
+    read.assert_not_called()
+
+def test_file_backend_purge_batches_resume(tmp_path):
+    """Test that limited purge batches continue where the previous one stopped instead of rescanning."""
+    backend = FileCacheBackend(str(tmp_path / "files"))
+    for i in range(6):
+        backend.write(f"new{i}", make_entry("fresh"))
+    for i in range(4):
+        backend.write(f"old{i}", make_entry("stale", age=timedelta(hours=48)))
+    cutoff = datetime.now() - timedelta(hours=24)
+    
+    with patch.object(backend, "read", wraps=backend.read) as read:
+        batches = []
+        while not batches or batches[-1] == 1:
+            batches.append(backend.purge_expired(cutoff, limit=1)[0])
+    
+    assert sum(batches) == 4
+    assert read.call_count == 10
+    assert backend.usage()[0] == 6
+
+def test_response_cache_sweep(tmp_path):
+    """Test a sweep removes expired entries and enforces the budget in batches."""
+    backend = FileCacheBackend(str(tmp_path / "files"))
+    for i in range(5):
+        backend.write(f"old{i}", make_entry("stale", age=timedelta(hours=48)))
+    cache = ResponseCache(cache_dir=str(tmp_path / "files"), backend=backend, max_entries=2)
+    for i in range(4):
+        cache.set("model", f"prompt {i}", f"response {i}")
+    
+    removed, reclaimed = cache.sweep(batch_size=3)
+    assert removed == 3 + 3  # One batch of expired entries plus one batch of evictions
+    assert reclaimed > 0
+    
+    cache.sweep(batch_size=3)
+    assert backend.usage()[0] == 2
+
+@pytest.mark.asyncio
+async def test_cache_sweeper_reports_reclaimed_bytes(tmp_path):
+    """Test the background sweeper drains the backlog and records a metric."""
+    backend = FileCacheBackend(str(tmp_path / "files"))
+    for i in range(7):
+        backend.write(f"old{i}", make_entry("stale", age=timedelta(hours=48)))
+    cache = ResponseCache(cache_dir=str(tmp_path / "files"), backend=backend)
+    sweeper = CacheSweeper(cache, interval=0.01, batch_size=2)
+    
+    with patch("src.cache.PerformanceMetrics") as mock_metrics:
+        sweeper.start()
+        for _ in range(100):
+            if backend.usage()[0] == 0 and mock_metrics.return_value.record_metric.called:
+                break
+            await asyncio.sleep(0.01)
+        await sweeper.stop()
+    
+    assert backend.usage()[0] == 0
+    category, reclaimed, metadata = mock_metrics.return_value.record_metric.call_args.args
+    assert category == "cache_reclaimed_bytes"
+    assert reclaimed > 0
+    assert metadata["entries"] == 7
@@ -0,0 +1,136 @@
+import asyncio
+import json
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from src.admission import AdmissionController
+from src.chat_pipeline import ChatEvent, ChatPipeline, encode_sse
+from src.llm import StreamError
+from src.moderation import ModerationResult
+from src.segmenter import SentenceSegmenter
+from src.tts import TTSResponse
+
+class StubLLM:
+    """Streams fixed tokens and counts how many were consumed."""
+    
+    def __init__(self, tokens, delay=0.0):
+        self.model = "phi"
+        self.tokens = tokens
+        self.delay = delay
+        self.pulled = 0
+        self.closed = False
+    
+    async def generate_stream(self, prompt, session_id=None):
+        try:
+            for token in self.tokens:
+                self.pulled += 1
+                yield token
+                await asyncio.sleep(self.delay)
+        finally:
+            self.closed = True
+
+def make_pipeline(llm, is_safe=True, event_buffer=64, segment_buffer=4):
+    """Create a pipeline around stub services."""
+    moderator = MagicMock()
+    moderator.moderate = AsyncMock(return_value=ModerationResult(is_safe=is_safe, flagged_categories={}))
+    tts = MagicMock()
+    tts.generate = AsyncMock(side_effect=lambda text, voice=None: TTSResponse(audio_url=f"/audio/{len(text)}.wav"))
+    pipeline = ChatPipeline(
+        moderator,
+        llm,
+        tts,
+        AdmissionController(),
+        SentenceSegmenter(min_chars=0, first_segment_fast=False),
+        event_buffer=event_buffer,
+        segment_buffer=segment_buffer
+    )
+    return pipeline, tts
+
+def test_encode_sse():
+    """Test that events are framed as Server-Sent Events."""
+    event = ChatEvent(event="token", data={"text": "Hi"})
+    assert encode_sse(event) == b'event: token\ndata: {"text": "Hi"}\n\n'
+
+@pytest.mark.asyncio
+async def test_pipeline_event_order_and_summary():
+    """Test that a turn reports moderation, tokens, audio and a summary with timings."""
+    llm = StubLLM(["Hello there.", " How are you?"])
+    pipeline, tts = make_pipeline(llm)
+    
+    events = [event async for event in pipeline.events("Hi")]
+    kinds = [event.event for event in events]
+    
+    assert kinds[0] == "moderation"
+    assert kinds[-1] == "summary"
+    assert kinds.count("token") == 2
+    assert [event.data["text"] for event in events if event.event == "audio"] == ["Hello there.", "How are you?"]
+    summary = events[-1].data
+    assert summary["text"] == "Hello there. How are you?"
+    assert summary["audio_urls"] == ["/audio/12.wav", "/audio/12.wav"]
+    assert summary["error"] is None
+    assert set(summary["timings"]) >= {"moderation", "time_to_first_token", "llm", "tts", "time_to_first_audio", "total"}
+    assert json.loads(encode_sse(events[-1]).split(b"data: ")[1])["text"] == summary["text"]
+
+@pytest.mark.asyncio
+async def test_pipeline_stops_after_failed_moderation():
+    """Test that flagged input never reaches the LLM."""
+    llm = StubLLM(["Never sent."])
+    pipeline, tts = make_pipeline(llm, is_safe=False)
+    
+    events = [event async for event in pipeline.events("Bad content")]
+    
+    assert [event.event for event in events] == ["moderation", "error", "summary"]
+    assert events[-1].data["error"] == "Content moderation failed"
+    assert llm.pulled == 0
+    tts.generate.assert_not_called()
+
+@pytest.mark.asyncio
+async def test_pipeline_applies_backpressure_to_slow_consumers():
+    """Test that a consumer that stops reading pauses the LLM stream at the buffer size."""
+    llm = StubLLM([f" word{i}" for i in range(200)])
+    pipeline, _ = make_pipeline(llm, event_buffer=4)
+    
+    events = pipeline.events("Talk a lot")
+    assert (await events.__anext__()).event == "moderation"
+    await asyncio.sleep(0.1)
+    
+    # Only the buffered events and the one being put were pulled from the LLM
+    assert llm.pulled <= 6
+    await events.aclose()
+    assert llm.closed
+
+@pytest.mark.asyncio
+async def test_pipeline_reports_llm_errors():
+    """Test that an LLM error ends the turn with an error and a summary."""
+    llm = StubLLM([StreamError("Error: HTTP 500")])
+    pipeline, tts = make_pipeline(llm)
+    
+    events = [event async for event in pipeline.events("Hi")]
+    
+    assert [event.event for event in events] == ["moderation", "error", "summary"]
+    assert events[1].data == {"error": "HTTP 500", "status_code": 502}
+    tts.generate.assert_not_called()
+
+@pytest.mark.asyncio
+async def test_pipeline_speaks_replies_that_start_with_error():
+    """Test that only typed stream errors end a turn, not reply text that looks like one."""
+    llm = StubLLM(["Error: that", " is not a real word."])
+    pipeline, tts = make_pipeline(llm)
+    
+    events = [event async for event in pipeline.events("Spell it")]
+    
+    assert events[-1].data["error"] is None
+    assert events[-1].data["text"] == "Error: that is not a real word."
+    tts.generate.assert_awaited_once()
+
+@pytest.mark.asyncio
+async def test_pipeline_closes_llm_stream_when_cancelled():
+    """Test that cancelling a turn closes the LLM stream straight away."""
+    llm = StubLLM([f" word{i}" for i in range(200)], delay=0.01)
+    pipeline, _ = make_pipeline(llm)
+    
+    events = pipeline.events("Talk a lot")
+    assert (await events.__anext__()).event == "moderation"
+    assert (await events.__anext__()).event == "token"
+    await events.aclose()
+    
+    assert llm.closed
@@ -56,7 +56,10 @@ def test_config_from_env(monkeypatch):
         "OLLAMA_BASE_URL": "http://test:11434",
         "LLM_MODEL": "test-model",
         "TTS_BASE_URL": "http://test:5000",
-        "TTS_VOICE": "test-voice"
+        "TTS_VOICE": "test-voice",
+        "CACHE_BACKEND": "sqlite",
+        "OLLAMA_BASE_URLS": "http://host-a:11434,http://host-b:11434",
+        "LLM_PRELOAD_MODELS": "phi,mistral"
     }
     
     for key, value in env_vars.items():
@@ -67,9 +70,12 @@ def test_config_from_env(monkeypatch):
     assert config.mac.gpu_layers == 16
     assert config.mac.model_path == "/path/to/model"
     assert config.llm.base_url == "http://test:11434"
+    assert config.llm.base_urls == ["http://host-a:11434", "http://host-b:11434"]
     assert config.llm.model == "test-model"
+    assert config.llm.residency.preload_models == ["phi", "mistral"]
     assert config.tts.base_url == "http://test:5000"
     assert config.tts.voice == "test-voice"
+    assert config.cache.backend == "sqlite"
 
 def test_config_defaults():
     """Test configuration defaults."""
@@ -80,3 +86,8 @@ def test_config_defaults():
     assert config.llm.temperature == 0.7  # Default temperature
     assert config.llm.top_p == 0.9  # Default top_p
     assert config.llm.max_tokens == 2048  # Default max tokens
+    assert config.llm.max_connections == 100  # Default pool size
+    assert config.llm.max_keepalive_connections == 20  # Default idle connections
+    assert config.llm.keepalive_expiry == 30.0  # Default keep-alive
+    assert config.llm.http2 is False  # HTTP/2 is opt-in
+    assert config.cache.backend == "file"  # File cache by default
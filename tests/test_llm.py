@@ -1,11 +1,23 @@
 import pytest
 import os
-from src.llm import LLMClient, LLMResponse
+from src.llm import LLMClient, LLMResponse, ollama_timings, split_word_chunks
 import httpx
 import asyncio
+import time
+from contextlib import asynccontextmanager
 from typing import AsyncGenerator, Any, Callable
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, AsyncMock, MagicMock
 from src.config import LLMConfig
+from src.cache import ResponseCache
+from tests.conftest import FakeOllamaServer
+
+def mock_stream(response: httpx.Response):
+    """Patch the streaming request method to yield the given response."""
+    @asynccontextmanager
+    async def stream_context():
+        yield response
+    
+    return patch.object(httpx.AsyncClient, 'stream', side_effect=lambda *args, **kwargs: stream_context())
 
 @pytest.fixture
 def mock_benchmark():
@@ -35,17 +47,17 @@ async def test_llm_generate_response(test_llm_config):
     client = LLMClient(test_llm_config)
     
     # Mock response with streaming data
-    async def mock_aiter_lines():
-        yield '{"response": "Paris"}'
-        yield '{"response": " is"}'
-        yield '{"response": " the capital of France."}'
+    async def mock_aiter_bytes():
+        yield b'{"response": "Paris"}\n'
+        yield b'{"response": " is"}\n'
+        yield b'{"response": " the capital of France."}\n'
     
     # Mock the response
     mock_response = httpx.Response(200, text="")
-    mock_response.aiter_lines = mock_aiter_lines
+    mock_response.aiter_bytes = mock_aiter_bytes
     
-    # Patch the post method
-    with patch.object(httpx.AsyncClient, 'post', return_value=mock_response):
+    # Patch the streaming request
+    with mock_stream(mock_response):
         response = await client.generate("What is the capital of France?")
     
         assert isinstance(response, LLMResponse)
@@ -195,16 +207,16 @@ async def test_llm_streaming_invalid_json(test_llm_config):
     client = LLMClient(test_llm_config)
     
     # Mock response with invalid JSON
-    async def mock_aiter_lines():
-        yield "invalid json"
-        yield '{"response": "valid response"}'
+    async def mock_aiter_bytes():
+        yield b"invalid json\n"
+        yield b'{"response": "valid response"}\n'
     
     # Mock the response
     mock_response = httpx.Response(200, text="")
-    mock_response.aiter_lines = mock_aiter_lines
+    mock_response.aiter_bytes = mock_aiter_bytes
     
-    # Patch the post method
-    with patch.object(httpx.AsyncClient, 'post', return_value=mock_response):
+    # Patch the streaming request
+    with mock_stream(mock_response):
         responses = []
         async for chunk in client.generate_stream("test"):
             responses.append(chunk)
@@ -255,14 +267,14 @@ async def test_llm_generate_with_metrics(test_llm_config, mock_benchmark):
     }
     
     # Mock response with streaming data
-    async def mock_aiter_lines():
-        yield '{"response": "Paris"}'
-        yield '{"response": " is"}'
-        yield '{"response": " the capital of France."}'
+    async def mock_aiter_bytes():
+        yield b'{"response": "Paris"}\n'
+        yield b'{"response": " is"}\n'
+        yield b'{"response": " the capital of France."}\n'
     
     # Mock the response
     mock_response = httpx.Response(200, text="")
-    mock_response.aiter_lines = mock_aiter_lines
+    mock_response.aiter_bytes = mock_aiter_bytes
     
     # Mock system metrics
     with patch('src.llm.get_system_metrics') as mock_metrics:
@@ -270,8 +282,8 @@ async def test_llm_generate_with_metrics(test_llm_config, mock_benchmark):
         
         # Mock the cache to always miss
         with patch('src.cache.ResponseCache.get', return_value=None):
-            # Patch the post method
-            with patch.object(httpx.AsyncClient, 'post', return_value=mock_response):
+            # Patch the streaming request
+            with mock_stream(mock_response):
                 response = await client.generate("What is the capital of France?")
                 
                 assert isinstance(response, LLMResponse)
@@ -307,7 +319,7 @@ async def test_llm_generate_metrics_on_error(test_llm_config, mock_benchmark):
     with patch('src.llm.get_system_metrics', return_value=mock_metrics):
         # Mock the cache to always miss
         with patch('src.cache.ResponseCache.get', return_value=None):
-            with patch.object(httpx.AsyncClient, 'post', return_value=mock_response):
+            with mock_stream(mock_response):
                 response = await client.generate("Test prompt")
                 
                 assert isinstance(response, LLMResponse)
@@ -321,36 +333,36 @@ async def test_llm_response_caching(test_llm_config, mock_benchmark):
     client = LLMClient(test_llm_config)
     
     # Mock response with streaming data
-    async def mock_aiter_lines():
-        yield '{"response": "Paris"}'
-        yield '{"response": " is"}'
-        yield '{"response": " the capital of France."}'
+    async def mock_aiter_bytes():
+        yield b'{"response": "Paris"}\n'
+        yield b'{"response": " is"}\n'
+        yield b'{"response": " the capital of France."}\n'
     
     # Mock the response
     mock_response = httpx.Response(200, text="")
-    mock_response.aiter_lines = mock_aiter_lines
+    mock_response.aiter_bytes = mock_aiter_bytes
     
     # First request should hit the API
     with patch('src.cache.ResponseCache.get', return_value=None):
-        with patch.object(httpx.AsyncClient, 'post', return_value=mock_response) as mock_post:
+        with mock_stream(mock_response) as mock_stream_call:
             response1 = await client.generate("What is the capital of France?")
-            assert mock_post.called
+            assert mock_stream_call.called
             assert response1.text == "Paris is the capital of France."
             assert not response1.cached
     
     # Second request with same parameters should hit cache
     with patch('src.cache.ResponseCache.get', return_value="Paris is the capital of France."):
-        with patch.object(httpx.AsyncClient, 'post', return_value=mock_response) as mock_post:
+        with mock_stream(mock_response) as mock_stream_call:
             response2 = await client.generate("What is the capital of France?")
-            assert not mock_post.called  # API should not be called
+            assert not mock_stream_call.called  # API should not be called
             assert response2.text == "Paris is the capital of France."
             assert response2.cached
     
     # Different prompt should miss cache
     with patch('src.cache.ResponseCache.get', return_value=None):
-        with patch.object(httpx.AsyncClient, 'post', return_value=mock_response) as mock_post:
+        with mock_stream(mock_response) as mock_stream_call:
             response3 = await client.generate("What is the capital of Spain?")
-            assert mock_post.called
+            assert mock_stream_call.called
             assert not response3.cached
 
 @pytest.mark.asyncio
@@ -359,29 +371,29 @@ async def test_llm_cache_with_different_params(test_llm_config, mock_benchmark):
     client = LLMClient(test_llm_config)
     
     # Mock response
-    async def mock_aiter_lines():
-        yield '{"response": "Test response"}'
+    async def mock_aiter_bytes():
+        yield b'{"response": "Test response"}\n'
     
     mock_response = httpx.Response(200, text="")
-    mock_response.aiter_lines = mock_aiter_lines
+    mock_response.aiter_bytes = mock_aiter_bytes
     
     # First request
     with patch('src.cache.ResponseCache.get', return_value=None):
-        with patch.object(httpx.AsyncClient, 'post', return_value=mock_response):
+        with mock_stream(mock_response):
             response1 = await client.generate("Test prompt")
             assert not response1.cached
     
     # Same request, different temperature
     client.config.temperature = 0.8
     with patch('src.cache.ResponseCache.get', return_value=None):
-        with patch.object(httpx.AsyncClient, 'post', return_value=mock_response):
+        with mock_stream(mock_response):
             response2 = await client.generate("Test prompt")
             assert not response2.cached  # Should miss cache due to different temperature
     
     # Same request, different model
     client.set_model("different-model")
     with patch('src.cache.ResponseCache.get', return_value=None):
-        with patch.object(httpx.AsyncClient, 'post', return_value=mock_response):
+        with mock_stream(mock_response):
             response3 = await client.generate("Test prompt")
             assert not response3.cached  # Should miss cache due to different model
 
@@ -404,7 +416,7 @@ async def test_llm_cache_error_handling(test_llm_config, mock_benchmark):
     # Error responses should not be cached
     with patch('src.llm.get_system_metrics', return_value=mock_metrics):
         with patch('src.cache.ResponseCache.get', return_value=None):
-            with patch.object(httpx.AsyncClient, 'post', return_value=mock_error_response):
+            with mock_stream(mock_error_response):
                 response1 = await client.generate("Test prompt")
                 assert response1.error is not None
                 assert "HTTP error 500" in response1.error
@@ -415,3 +427,661 @@ async def test_llm_cache_error_handling(test_llm_config, mock_benchmark):
                 assert response2.error is not None
                 assert "HTTP error 500" in response2.error
                 assert not response2.cached
+
+@pytest.mark.asyncio
+async def test_llm_shared_http_client(test_llm_config):
+    """Test that requests reuse one pooled HTTP client."""
+    client = LLMClient(test_llm_config)
+    
+    first = client.http_client
+    assert client.http_client is first
+    assert not first.is_closed
+    
+    await client.aclose()
+    assert first.is_closed
+    
+    # A new client is opened transparently after closing
+    second = client.http_client
+    assert second is not first
+    await client.aclose()
+
+@pytest.mark.asyncio
+async def test_llm_http_client_pool_limits(test_llm_config):
+    """Test that pool limits are taken from the configuration."""
+    config = test_llm_config.model_copy(update={
+        "max_connections": 7,
+        "max_keepalive_connections": 3,
+        "keepalive_expiry": 12.5
+    })
+    client = LLMClient(config)
+    
+    with patch('src.llm.httpx.AsyncClient') as mock_client_cls:
+        mock_client_cls.return_value.is_closed = False
+        client.http_client
+    
+    limits = mock_client_cls.call_args.kwargs["limits"]
+    assert limits.max_connections == 7
+    assert limits.max_keepalive_connections == 3
+    assert limits.keepalive_expiry == 12.5
+
+@pytest.mark.asyncio
+async def test_llm_http2_fallback_without_h2(test_llm_config):
+    """Test that HTTP/2 falls back to HTTP/1.1 when h2 is not installed."""
+    config = test_llm_config.model_copy(update={"http2": True})
+    client = LLMClient(config)
+    
+    with patch('src.llm.HTTP2_AVAILABLE', False), \
+         patch('src.llm.httpx.AsyncClient') as mock_client_cls:
+        mock_client_cls.return_value.is_closed = False
+        client.http_client
+    
+    assert mock_client_cls.call_args.kwargs["http2"] is False
+
+@pytest.mark.asyncio
+async def test_llm_generate_reuses_http_client(test_llm_config, mock_benchmark):
+    """Test that consecutive generations go through the same HTTP client."""
+    client = LLMClient(test_llm_config)
+    
+    async def mock_aiter_bytes():
+        yield b'{"response": "Paris"}\n'
+    
+    mock_response = httpx.Response(200, text="")
+    mock_response.aiter_bytes = mock_aiter_bytes
+    
+    seen_clients = []
+    @asynccontextmanager
+    async def record_stream(self, *args, **kwargs):
+        seen_clients.append(self)
+        yield mock_response
+    
+    with patch('src.cache.ResponseCache.get', return_value=None), \
+         patch('src.cache.ResponseCache.aset'), \
+         patch.object(httpx.AsyncClient, 'stream', record_stream):
+        await client.generate("First prompt")
+        await client.generate("Second prompt")
+    
+    assert len(seen_clients) == 2
+    assert seen_clients[0] is seen_clients[1]
+    await client.aclose()
+
+@pytest.mark.asyncio
+async def test_llm_stream_tokens_arrive_incrementally(make_llm_client, fake_ollama):
+    """Test that streamed tokens reach the caller before generation finishes."""
+    fake_ollama.tokens = ["One", " two", " three", " four", " five"]
+    fake_ollama.delay = 0.1
+    client = make_llm_client(base_url=fake_ollama.url)
+    
+    start_time = time.perf_counter()
+    arrival_times = []
+    chunks = []
+    async for chunk in client.generate_stream("Count to five"):
+        arrival_times.append(time.perf_counter() - start_time)
+        chunks.append(chunk)
+    await client.aclose()
+    
+    assert "".join(chunks) == "One two three four five"
+    # The first token must not wait for the remaining four delayed tokens
+    assert arrival_times[0] < 0.3
+    assert arrival_times[-1] >= 0.4
+
+@pytest.mark.asyncio
+async def test_llm_generate_records_stream_timings(make_llm_client, fake_ollama):
+    """Test that generate reports time to first token and inter-token latency."""
+    fake_ollama.tokens = ["Slow", " tokens", " here."]
+    fake_ollama.delay = 0.1
+    client = make_llm_client(base_url=fake_ollama.url)
+    
+    response = await client.generate("Speak slowly")
+    await client.aclose()
+    
+    assert response.error is None
+    assert response.text == "Slow tokens here."
+    assert response.metrics["token_count"] == 3
+    assert response.metrics["time_to_first_token"] < 0.1
+    assert 0.08 <= response.metrics["inter_token_latency_mean"] <= 0.3
+    assert response.metrics["inter_token_latency_max"] >= response.metrics["inter_token_latency_mean"]
+
+@pytest.mark.asyncio
+async def test_llm_stream_http_error(make_llm_client, fake_ollama):
+    """Test that a non-200 streaming response is reported as an error."""
+    fake_ollama.status_code = 500
+    client = make_llm_client(base_url=fake_ollama.url)
+    
+    response = await client.generate("Test prompt")
+    await client.aclose()
+    
+    assert response.error == "HTTP error 500: Internal Server Error"
+
+@pytest.mark.asyncio
+async def test_llm_generate_uses_async_cache(make_llm_client):
+    """Test that generate reads and writes the cache through the async API."""
+    client = make_llm_client()
+    
+    async def mock_aiter_bytes():
+        yield b'{"response": "Paris"}\n'
+    
+    mock_response = httpx.Response(200, text="")
+    mock_response.aiter_bytes = mock_aiter_bytes
+    
+    with patch.object(ResponseCache, 'get', side_effect=AssertionError("blocking get")), \
+         patch.object(ResponseCache, 'set', side_effect=AssertionError("blocking set")), \
+         patch.object(ResponseCache, 'aget', AsyncMock(return_value=None)) as mock_aget, \
+         patch.object(ResponseCache, 'aset', AsyncMock()) as mock_aset, \
+         mock_stream(mock_response):
+        response = await client.generate("What is the capital of France?")
+    
+    assert response.text == "Paris"
+    mock_aget.assert_awaited_once()
+    mock_aset.assert_awaited_once()
+    assert mock_aset.await_args.args[:3] == (client.model, "What is the capital of France?", "Paris")
+
+@pytest.mark.asyncio
+async def test_llm_generate_coalesces_identical_requests(make_llm_client, fake_ollama):
+    """Test that identical concurrent requests share one upstream generation."""
+    fake_ollama.tokens = ["Shared", " answer."]
+    fake_ollama.delay = 0.05
+    client = make_llm_client(base_url=fake_ollama.url)
+    
+    try:
+        responses = await asyncio.gather(*(client.generate("Same prompt") for _ in range(5)))
+    finally:
+        await client.aclose()
+    
+    assert len(fake_ollama.requests) == 1
+    assert {response.text for response in responses} == {"Shared answer."}
+    assert client.coalesced_requests == 4
+
+@pytest.mark.asyncio
+async def test_llm_stream_coalesces_identical_requests(make_llm_client, fake_ollama):
+    """Test that identical concurrent streams share one upstream request."""
+    fake_ollama.tokens = ["One", " two", " three"]
+    fake_ollama.delay = 0.05
+    client = make_llm_client(base_url=fake_ollama.url)
+    
+    async def collect():
+        return "".join([token async for token in client.generate_stream("Same prompt")])
+    
+    try:
+        results = await asyncio.gather(collect(), collect(), collect())
+    finally:
+        await client.aclose()
+    
+    assert len(fake_ollama.requests) == 1
+    assert results == ["One two three"] * 3
+
+@pytest.mark.asyncio
+async def test_llm_stream_closes_upstream_when_lagging_consumer_cancelled(make_llm_client, fake_ollama):
+    """Test that cancelling a consumer a full buffer behind closes the Ollama stream at once."""
+    fake_ollama.tokens = [f" token{i}" for i in range(200)]
+    fake_ollama.delay = 0.01
+    client = make_llm_client(base_url=fake_ollama.url, stream_buffer=2)
+    first_token = asyncio.Event()
+    
+    async def lagging_consumer():
+        async for _ in client.generate_stream("Tell me a long story"):
+            first_token.set()
+            await asyncio.sleep(10)
+    
+    task = asyncio.create_task(lagging_consumer())
+    try:
+        await asyncio.wait_for(first_token.wait(), timeout=5)
+        await asyncio.sleep(0.05)
+        assert fake_ollama.open_streams == 1
+        
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        # The server sees the closed connection on its next write
+        await asyncio.sleep(0.1)
+        
+        assert fake_ollama.open_streams == 0
+        assert fake_ollama.tokens_sent < len(fake_ollama.tokens)
+        assert fake_ollama.completed_streams == 0
+        assert client._singleflight.in_flight == 0
+    finally:
+        await client.aclose()
+
+def test_split_word_chunks():
+    """Test that word chunks join back into the original text."""
+    text = "Paris is  the capital\nof France. "
+    chunks = split_word_chunks(text)
+    assert chunks == ["Paris ", "is  ", "the ", "capital\n", "of ", "France. "]
+    assert "".join(chunks) == text
+    assert split_word_chunks("") == [""]
+
+@pytest.mark.asyncio
+async def test_llm_stream_replays_cached_response(test_llm_config, make_llm_client):
+    """Test that streaming serves cached responses without calling Ollama."""
+    client = make_llm_client()
+    cache = client.cache
+    cache.set(client.model, "Capital?", "Paris is the capital.", **client._cache_params())
+    
+    with patch.object(httpx.AsyncClient, 'stream', side_effect=AssertionError("upstream called")):
+        chunks = [chunk async for chunk in client.generate_stream("Capital?")]
+    assert chunks == ["Paris ", "is ", "the ", "capital."]
+    
+    client.config = test_llm_config.model_copy(update={"replay_word_chunks": False})
+    with patch.object(httpx.AsyncClient, 'stream', side_effect=AssertionError("upstream called")):
+        chunks = [chunk async for chunk in client.generate_stream("Capital?")]
+    assert chunks == ["Paris is the capital."]
+
+@pytest.mark.asyncio
+async def test_llm_stream_caches_completed_stream(make_llm_client, fake_ollama):
+    """Test that a completed stream is cached and replayed on the next request."""
+    fake_ollama.tokens = ["Cached", " stream."]
+    client = make_llm_client(base_url=fake_ollama.url)
+    cache = client.cache
+    
+    try:
+        first = [chunk async for chunk in client.generate_stream("Prompt")]
+        second = [chunk async for chunk in client.generate_stream("Prompt")]
+    finally:
+        await client.aclose()
+    
+    assert "".join(first) == "Cached stream."
+    assert "".join(second) == "Cached stream."
+    assert len(fake_ollama.requests) == 1
+    assert cache.get(client.model, "Prompt", **client._cache_params()) == "Cached stream."
+
+@pytest.mark.asyncio
+async def test_llm_stream_does_not_cache_errors(make_llm_client, fake_ollama):
+    """Test that errored streams are never cached."""
+    fake_ollama.status_code = 500
+    client = make_llm_client(base_url=fake_ollama.url)
+    cache = client.cache
+    
+    try:
+        chunks = [chunk async for chunk in client.generate_stream("Prompt")]
+    finally:
+        await client.aclose()
+    
+    assert chunks == ["Error: HTTP 500"]
+    assert cache.get(client.model, "Prompt", **client._cache_params()) is None
+
+@pytest.mark.asyncio
+async def test_llm_stream_does_not_cache_partial_stream(make_llm_client, fake_ollama):
+    """Test that a stream abandoned before completion is never cached."""
+    fake_ollama.tokens = ["One", " two", " three"]
+    fake_ollama.delay = 0.05
+    client = make_llm_client(base_url=fake_ollama.url)
+    cache = client.cache
+    
+    try:
+        stream = client.generate_stream("Prompt")
+        assert await stream.__anext__() == "One"
+        await stream.aclose()
+        await asyncio.sleep(0.2)
+    finally:
+        await client.aclose()
+    
+    assert cache.get(client.model, "Prompt", **client._cache_params()) is None
+
+@pytest.mark.asyncio
+async def test_llm_stream_does_not_cache_unfinished_stream(make_llm_client):
+    """Test that a stream which ends without Ollama's done marker is not cached."""
+    client = make_llm_client()
+    cache = client.cache
+    
+    async def mock_aiter_bytes():
+        yield b'{"response": "Truncated"}\n'
+    
+    mock_response = httpx.Response(200, text="")
+    mock_response.aiter_bytes = mock_aiter_bytes
+    
+    with mock_stream(mock_response):
+        chunks = [chunk async for chunk in client.generate_stream("Prompt")]
+    
+    assert chunks == ["Truncated"]
+    assert cache.get(client.model, "Prompt", **client._cache_params()) is None
+
+@pytest.mark.asyncio
+async def test_llm_session_reuses_context(make_llm_client, fake_ollama):
+    """Test that a session sends back the context returned by the previous turn."""
+    fake_ollama.final_chunk = {"context": [1, 2, 3], "prompt_eval_count": 3, "prompt_eval_duration": 5_000_000}
+    client = make_llm_client(base_url=fake_ollama.url)
+    
+    try:
+        with patch("src.llm.PerformanceMetrics") as mock_metrics:
+            first = await client.generate("Hi", session_id="s1")
+            second = await client.generate("And then?", session_id="s1")
+    finally:
+        await client.aclose()
+    
+    assert first.error is None and second.error is None
+    assert "context" not in fake_ollama.requests[0]
+    assert fake_ollama.requests[1]["context"] == [1, 2, 3]
+    assert fake_ollama.requests[1]["prompt"] == "And then?"
+    assert second.metrics["context_reused"] is True
+    
+    recorded = [
+        call.args for call in mock_metrics.return_value.record_metric.call_args_list
+        if call.args[0] == "llm_prompt_eval_time"
+    ]
+    assert recorded == [
+        ("llm_prompt_eval_time", 0.005, {"model": client.model, "context_reused": False, "prompt_eval_count": 3}),
+        ("llm_prompt_eval_time", 0.005, {"model": client.model, "context_reused": True, "prompt_eval_count": 3}),
+    ]
+
+@pytest.mark.asyncio
+async def test_llm_session_falls_back_to_full_prompt(make_llm_client, fake_ollama):
+    """Test that an evicted context is replaced by the conversation as a full prompt."""
+    fake_ollama.tokens = ["Hello."]
+    fake_ollama.final_chunk = {"context": [1, 2, 3]}
+    client = make_llm_client(base_url=fake_ollama.url, context_max_tokens=2)
+    
+    try:
+        await client.generate("Hi", session_id="s1")
+        tokens = [token async for token in client.generate_stream("Who are you?", session_id="s1")]
+    finally:
+        await client.aclose()
+    
+    assert "".join(tokens) == "Hello."
+    assert "context" not in fake_ollama.requests[1]
+    assert fake_ollama.requests[1]["prompt"] == "User: Hi\nAssistant: Hello.\nUser: Who are you?\nAssistant:"
+    assert client.sessions.history("s1") == [("Hi", "Hello."), ("Who are you?", "Hello.")]
+
+@pytest.mark.asyncio
+async def test_llm_session_context_not_sent_to_another_model(make_llm_client, fake_ollama):
+    """Test that after a model change the conversation is replayed instead of sending the old context."""
+    fake_ollama.tokens = ["Hello."]
+    fake_ollama.final_chunk = {"context": [1, 2, 3]}
+    client = make_llm_client(base_url=fake_ollama.url)
+    
+    try:
+        await client.generate("Hi", session_id="s1")
+        client.set_model("mistral")
+        await client.generate("Who are you?", session_id="s1")
+    finally:
+        await client.aclose()
+    
+    assert "context" not in fake_ollama.requests[1]
+    assert fake_ollama.requests[1]["prompt"] == "User: Hi\nAssistant: Hello.\nUser: Who are you?\nAssistant:"
+
+@pytest.mark.asyncio
+async def test_llm_session_bypasses_cache(make_llm_client):
+    """Test that conversation turns are neither read from nor written to the cache."""
+    client = make_llm_client()
+    
+    async def mock_aiter_bytes():
+        yield b'{"response": "Fresh"}\n'
+        yield b'{"done": true, "context": [7]}\n'
+    
+    mock_response = httpx.Response(200, text="")
+    mock_response.aiter_bytes = mock_aiter_bytes
+    
+    with patch.object(ResponseCache, 'aget', AsyncMock(return_value="Stale")) as mock_aget, \
+         patch.object(ResponseCache, 'aset', AsyncMock()) as mock_aset, \
+         mock_stream(mock_response):
+        response = await client.generate("Hi", session_id="s1")
+    
+    assert response.text == "Fresh"
+    mock_aget.assert_not_awaited()
+    mock_aset.assert_not_awaited()
+    assert client.sessions.get_context("s1") == [7]
+
+def test_ollama_timings():
+    """Test conversion of Ollama's final chunk timings."""
+    timings = ollama_timings({
+        "done": True,
+        "total_duration": 3_000_000_000,
+        "load_duration": 500_000_000,
+        "prompt_eval_count": 20,
+        "prompt_eval_duration": 250_000_000,
+        "eval_count": 100,
+        "eval_duration": 2_000_000_000,
+    })
+    
+    assert timings["total_duration"] == 3.0
+    assert timings["load_time"] == 0.5
+    assert timings["tokens_per_second"] == 50.0
+    assert timings["prompt_tokens_per_second"] == 80.0
+    assert timings["model_time_to_first_token"] == 0.75
+    assert ollama_timings({"done": True}) == {}
+    # A fully cached prompt reports no evaluated prompt tokens
+    assert "prompt_tokens_per_second" not in ollama_timings({"prompt_eval_count": 0, "prompt_eval_duration": 0})
+
+@pytest.mark.asyncio
+async def test_llm_generate_reports_model_timings(make_llm_client, fake_ollama):
+    """Test that Ollama's timings reach the response and the per-model metrics."""
+    fake_ollama.final_chunk = {
+        "total_duration": 1_000_000_000,
+        "load_duration": 100_000_000,
+        "prompt_eval_count": 10,
+        "prompt_eval_duration": 50_000_000,
+        "eval_count": 40,
+        "eval_duration": 800_000_000,
+    }
+    client = make_llm_client(base_url=fake_ollama.url)
+    
+    try:
+        with patch("src.llm.PerformanceMetrics") as mock_metrics:
+            response = await client.generate("Timed prompt")
+    finally:
+        await client.aclose()
+    
+    assert response.metrics["tokens_per_second"] == 50.0
+    assert response.metrics["prompt_tokens_per_second"] == 200.0
+    assert response.metrics["load_time"] == pytest.approx(0.1)
+    assert response.metrics["model_time_to_first_token"] == pytest.approx(0.15)
+    
+    recorded = {
+        call.args[0]: call.args[1:] for call in mock_metrics.return_value.record_metric.call_args_list
+    }
+    assert recorded["llm_tokens_per_second"] == (50.0, {"model": client.model})
+    assert recorded["llm_prompt_tokens_per_second"] == (200.0, {"model": client.model})
+    assert "llm_load_time" in recorded
+    assert "llm_model_time_to_first_token" in recorded
+
+@pytest.mark.asyncio
+async def test_llm_generate_many_limits_concurrency(make_llm_client):
+    """Test that generate_many keeps at most `concurrency` requests in flight."""
+    client = make_llm_client()
+    in_flight = 0
+    peak = 0
+    
+    async def fake_generate(prompt):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        # Later prompts finish first so completion order differs from prompt order
+        await asyncio.sleep(0.01 * (10 - int(prompt)))
+        in_flight -= 1
+        return LLMResponse(text=f"answer {prompt}")
+    
+    with patch.object(client, "generate", side_effect=fake_generate):
+        unordered = [index async for index, _ in client.generate_many((str(i) for i in range(10)), concurrency=3)]
+        ordered = [
+            (index, response.text)
+            async for index, response in client.generate_many([str(i) for i in range(10)], concurrency=3, ordered=True)
+        ]
+    
+    assert peak == 3
+    assert sorted(unordered) == list(range(10))
+    assert unordered != list(range(10))
+    assert ordered == [(i, f"answer {i}") for i in range(10)]
+
+@pytest.mark.asyncio
+async def test_llm_generate_many_cancels_on_close(make_llm_client):
+    """Test that closing the generator cancels the requests still in flight."""
+    client = make_llm_client()
+    cancelled = 0
+    
+    async def fake_generate(prompt):
+        nonlocal cancelled
+        try:
+            await asyncio.sleep(0 if prompt == "fast" else 10)
+        except asyncio.CancelledError:
+            cancelled += 1
+            raise
+        return LLMResponse(text=prompt)
+    
+    with patch.object(client, "generate", side_effect=fake_generate):
+        results = client.generate_many(["fast", "slow", "slow"], concurrency=3)
+        assert (await results.__anext__())[1].text == "fast"
+        await results.aclose()
+    
+    assert cancelled == 2
+
+@pytest.mark.asyncio
+async def test_llm_generate_many_against_server(make_llm_client, fake_ollama):
+    """Test that a batch overlaps requests on the shared connection pool."""
+    fake_ollama.delay = 0.05
+    client = make_llm_client(base_url=fake_ollama.url)
+    prompts = [f"Prompt {i}" for i in range(8)]
+    
+    start_time = time.perf_counter()
+    try:
+        results = [item async for item in client.generate_many(prompts, concurrency=8, ordered=True)]
+    finally:
+        await client.aclose()
+    elapsed = time.perf_counter() - start_time
+    
+    assert [index for index, _ in results] == list(range(8))
+    assert all(response.text == "Hello from fake Ollama." for _, response in results)
+    assert len(fake_ollama.requests) == 8
+    # Eight sequential requests would take at least 8 * 4 tokens * 50ms
+    assert elapsed < 1.0
+
+@pytest.mark.asyncio
+async def test_llm_retries_transient_errors(test_llm_config, make_llm_client, fake_ollama):
+    """Test that 503 responses are retried with backoff until one succeeds."""
+    fake_ollama.fail_requests = 2
+    retry = test_llm_config.retry.model_copy(update={"base_delay": 0.01})
+    client = make_llm_client(base_url=fake_ollama.url, retry=retry)
+    
+    try:
+        response = await client.generate("Retry me")
+    finally:
+        await client.aclose()
+    
+    assert response.error is None
+    assert response.text == "Hello from fake Ollama."
+    assert len(fake_ollama.requests) == 3
+
+@pytest.mark.asyncio
+async def test_llm_does_not_retry_permanent_errors(make_llm_client, fake_ollama):
+    """Test that errors outside the retryable statuses fail immediately."""
+    fake_ollama.status_code = 500
+    client = make_llm_client(base_url=fake_ollama.url)
+    
+    try:
+        response = await client.generate("Fail once")
+    finally:
+        await client.aclose()
+    
+    assert response.error.startswith("HTTP error 500")
+    assert len(fake_ollama.requests) == 1
+
+@pytest.mark.asyncio
+async def test_llm_retry_budget_exhausted(test_llm_config, make_llm_client, fake_ollama):
+    """Test that no retries are sent once the retry budget is spent."""
+    fake_ollama.fail_requests = 1
+    retry = test_llm_config.retry.model_copy(update={"budget_min_tokens": 0, "budget_ratio": 0})
+    client = make_llm_client(base_url=fake_ollama.url, retry=retry)
+    
+    try:
+        chunks = [chunk async for chunk in client.generate_stream("No budget")]
+    finally:
+        await client.aclose()
+    
+    assert chunks == ["Error: HTTP 503"]
+    assert len(fake_ollama.requests) == 1
+
+@pytest.mark.asyncio
+async def test_llm_hedges_slow_first_token(test_llm_config, make_llm_client, fake_ollama):
+    """Test that a slow request is hedged to another backend and the loser is cancelled."""
+    slow = FakeOllamaServer(tokens=["Slow."])
+    slow.first_token_delay = 2.0
+    await slow.start()
+    retry = test_llm_config.retry.model_copy(update={"hedge": True, "hedge_initial_delay": 0.05})
+    client = make_llm_client(base_urls=[slow.url, fake_ollama.url], retry=retry)
+    
+    start_time = time.perf_counter()
+    try:
+        response = await client.generate("Hedge me")
+        elapsed = time.perf_counter() - start_time
+        stats = client.backends.stats()
+    finally:
+        await client.aclose()
+        await slow.stop()
+    
+    assert response.text == "Hello from fake Ollama."
+    assert elapsed < 1.0
+    assert len(slow.requests) == 1
+    assert len(fake_ollama.requests) == 1
+    # The losing request to the slow backend is no longer outstanding
+    assert [backend["in_flight"] for backend in stats] == [0, 0]
+
+@pytest.mark.asyncio
+async def test_llm_start_preloads_models_with_keep_alive(test_llm_config, make_llm_client, fake_ollama):
+    """Test that startup warms each preload model and later requests keep it loaded."""
+    residency = test_llm_config.residency.model_copy(update={"preload_models": ["phi", "mistral"], "keep_alive": 600})
+    client = make_llm_client(base_url=fake_ollama.url, residency=residency)
+    
+    try:
+        await client.start()
+        warmups = list(fake_ollama.requests)
+        await client.generate("After warm-up")
+    finally:
+        await client.aclose()
+    
+    assert sorted(request["model"] for request in warmups) == ["mistral", "phi"]
+    assert all(request["keep_alive"] == 600 for request in warmups)
+    assert all(request["options"] == {"num_predict": 1} for request in warmups)
+    assert client.residency.hot_models() == {fake_ollama.url: ["phi", "mistral"]}
+    assert fake_ollama.requests[-1]["keep_alive"] == 600
+
+@pytest.mark.asyncio
+async def test_llm_switch_model_warms_only_cold_models(test_llm_config, make_llm_client, fake_ollama):
+    """Test that switching to a cold model warms it first and switching back does not."""
+    residency = test_llm_config.residency.model_copy(update={"preload_on_startup": False})
+    client = make_llm_client(base_url=fake_ollama.url, residency=residency)
+    
+    try:
+        await client.start()
+        assert fake_ollama.requests == []
+        await client.generate("Served by phi")
+        
+        assert await client.switch_model("mistral") is True
+        assert client.model == "mistral"
+        assert [request["model"] for request in fake_ollama.requests] == ["phi", "mistral"]
+        
+        await client.switch_model("phi")
+    finally:
+        await client.aclose()
+    
+    # phi was still hot from the user request, so no warm-up was sent for it
+    assert [request["model"] for request in fake_ollama.requests] == ["phi", "mistral"]
+
+@pytest.mark.asyncio
+async def test_llm_aclose_closes_cache(make_llm_client):
+    """Test that closing the client flushes the cache and stops its I/O pool."""
+    client = make_llm_client()
+    assert await client.cache.aget(client.model, "Not cached yet") is None
+    
+    await client.aclose()
+    
+    assert client.cache._executor._shutdown
+    assert client.cache.stats()["misses"] == 1
+
+@pytest.mark.asyncio
+async def test_llm_for_model_shares_state(make_llm_client):
+    """Test that a per-model client shares connections and sessions without switching the original."""
+    client = make_llm_client()
+    other = client.for_model("mistral")
+    
+    try:
+        assert client.for_model(client.model) is client
+        assert other.model == "mistral"
+        assert client.model == "phi"
+        assert other.http_client is client.http_client
+        assert other.for_model("llama2").http_client is client.http_client
+        assert other.sessions is client.sessions
+        assert other.backends is client.backends
+        
+        # The pool recreated after closing is still the one they share
+        await client.aclose()
+        assert not client.http_client.is_closed
+        assert other.http_client is client.http_client
+    finally:
+        await client.aclose()
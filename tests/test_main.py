@@ -1,10 +1,17 @@
+import asyncio
+import json
+import time
 import pytest
+from fastapi import Request
 from fastapi.testclient import TestClient
-from unittest.mock import AsyncMock, patch
-from src.main import app, Message, ChatResponse
-from src.llm import LLMResponse
+from unittest.mock import AsyncMock, create_autospec, patch
+from src.admission import AdmissionController
+from src.config import Config, ModerationConfig, TTSConfig
+from src.main import app, chat, run_chat, Message, ChatResponse
+from src.llm import LLMResponse, StreamError
 from src.moderation import ModerationResult
-from src.tts import TTSResponse
+from src.session_context import SessionContextStore
+from src.tts import TTSClient, TTSResponse, audio_name
 
 @pytest.fixture
 def test_client():
@@ -32,9 +39,10 @@ def mock_services():
             }
         ))
         
+        mock_llm.model = "phi"
         mock_llm.generate = AsyncMock(return_value=LLMResponse(text="Test response"))
         
-        mock_tts.generate_speech = AsyncMock(return_value=TTSResponse(audio_url="/audio/test.wav"))
+        mock_tts.generate = AsyncMock(return_value=TTSResponse(audio_url="/audio/test.wav"))
         
         yield {
             "moderator": mock_moderator,
@@ -62,8 +70,21 @@ def test_chat_endpoint_success(test_client, mock_services):
     
     # Verify service calls
     mock_services["moderator"].moderate.assert_called_once_with("Hello")
-    mock_services["llm"].generate.assert_called_once_with("Hello")
-    mock_services["tts"].generate_speech.assert_called_once_with("Test response")
+    mock_services["llm"].generate.assert_called_once_with("Hello", session_id=None)
+    mock_services["tts"].generate.assert_called_once_with("Test response")
+
+@pytest.mark.asyncio
+async def test_run_chat_matches_tts_client_interface(mock_services):
+    """Test that run_chat only calls methods the real TTS client has."""
+    tts = create_autospec(TTSClient, instance=True)
+    tts.generate.return_value = TTSResponse(audio_url="/audio/test.wav")
+    
+    with patch("src.main.tts_client", tts):
+        response = await run_chat(Message(content="Hello"), {"stage": "moderation"})
+    
+    assert response.error is None
+    assert response.audio_url == "/audio/test.wav"
+    tts.generate.assert_awaited_once_with("Test response")
 
 def test_chat_endpoint_moderation_failure(test_client, mock_services):
     """Test chat interaction with failed moderation."""
@@ -94,7 +115,7 @@ def test_chat_endpoint_moderation_failure(test_client, mock_services):
     # Verify service calls
     mock_services["moderator"].moderate.assert_called_once_with("Bad content")
     mock_services["llm"].generate.assert_not_called()
-    mock_services["tts"].generate_speech.assert_not_called()
+    mock_services["tts"].generate.assert_not_called()
 
 def test_chat_endpoint_llm_failure(test_client, mock_services):
     """Test chat interaction with LLM failure."""
@@ -113,13 +134,13 @@ def test_chat_endpoint_llm_failure(test_client, mock_services):
     
     # Verify service calls
     mock_services["moderator"].moderate.assert_called_once_with("Hello")
-    mock_services["llm"].generate.assert_called_once_with("Hello")
-    mock_services["tts"].generate_speech.assert_not_called()
+    mock_services["llm"].generate.assert_called_once_with("Hello", session_id=None)
+    mock_services["tts"].generate.assert_not_called()
 
 def test_chat_endpoint_tts_failure(test_client, mock_services):
     """Test chat interaction with TTS failure."""
     # Setup mock response
-    mock_services["tts"].generate_speech.return_value = TTSResponse(error="TTS error")
+    mock_services["tts"].generate.return_value = TTSResponse(error="TTS error")
     
     message = {"content": "Hello", "role": "user"}
     response = test_client.post("/chat", json=message)
@@ -133,8 +154,8 @@ def test_chat_endpoint_tts_failure(test_client, mock_services):
     
     # Verify service calls
     mock_services["moderator"].moderate.assert_called_once_with("Hello")
-    mock_services["llm"].generate.assert_called_once_with("Hello")
-    mock_services["tts"].generate_speech.assert_called_once_with("Test response")
+    mock_services["llm"].generate.assert_called_once_with("Hello", session_id=None)
+    mock_services["tts"].generate.assert_called_once_with("Test response")
 
 def test_chat_endpoint_invalid_input(test_client):
     """Test chat interaction with invalid input."""
@@ -155,4 +176,378 @@ def test_chat_endpoint_server_error(test_client, mock_services):
     response = test_client.post("/chat", json=message)
     
     assert response.status_code == 500
-    assert response.json() == {"detail": "Test error"} 
\ No newline at end of file
+    assert response.json() == {"detail": "Test error"}
+
+def test_lifespan_manages_llm_client():
+    """Test that the LLM client is opened on startup and closed on shutdown."""
+    with patch("src.main.llm_client") as mock_llm:
+        mock_llm.start = AsyncMock()
+        mock_llm.aclose = AsyncMock()
+        
+        with TestClient(app) as client:
+            mock_llm.start.assert_awaited_once()
+            mock_llm.aclose.assert_not_awaited()
+            assert client.get("/").status_code == 200
+        
+        mock_llm.aclose.assert_awaited_once()
+
+def test_chat_endpoint_rejects_when_queue_full(test_client, mock_services):
+    """Test that /chat fails fast with 429 when the admission queue is full."""
+    controller = AdmissionController(max_concurrency=1, max_queue=0)
+    controller._queue("phi").active = 1  # The only slot is taken
+    
+    with patch("src.main.admission", controller):
+        response = test_client.post("/chat", json={"content": "Hello", "role": "user"})
+    
+    assert response.status_code == 429
+    assert "Retry-After" in response.headers
+    mock_services["llm"].generate.assert_not_called()
+    mock_services["tts"].generate.assert_not_called()
+
+@pytest.mark.asyncio
+async def test_chat_cancels_llm_stream_on_disconnect(make_llm_client, mock_services, fake_ollama):
+    """Test that a client disconnect closes the Ollama stream early and skips TTS."""
+    fake_ollama.tokens = [f" token{i}" for i in range(50)]
+    fake_ollama.delay = 0.02
+    client = make_llm_client(base_url=fake_ollama.url)
+    
+    async def receive():
+        await asyncio.sleep(0.2)
+        return {"type": "http.disconnect"}
+    
+    request = Request({"type": "http", "method": "POST", "path": "/chat", "headers": []}, receive)
+    with patch("src.main.llm_client", client), \
+         patch("src.main.PerformanceMetrics") as mock_metrics:
+        response = await chat(Message(content="Tell me a long story"), request)
+    # Give the server a moment to notice the closed connection
+    await asyncio.sleep(0.1)
+    await client.aclose()
+    
+    assert response.status_code == 499
+    assert 0 < fake_ollama.tokens_sent < len(fake_ollama.tokens)
+    assert fake_ollama.completed_streams == 0
+    mock_services["tts"].generate.assert_not_called()
+    category, elapsed, metadata = mock_metrics.return_value.record_metric.call_args.args
+    assert category == "chat_cancelled_work"
+    assert elapsed >= 0.2
+    assert metadata == {"stage": "llm"}
+
+def test_chat_pipelined_synthesises_while_generating(test_client, mock_services):
+    """Test that the first segment is synthesised before the LLM has finished."""
+    events = []
+    
+    async def generate_stream(prompt, session_id=None):
+        for token in ["The first sentence is here.", " The second", " one follows", " later."]:
+            events.append("token")
+            yield token
+            await asyncio.sleep(0.05)
+        events.append("llm done")
+    
+    async def generate(text, output_path=None, voice=None):
+        events.append("tts")
+        return TTSResponse(audio_url=f"/audio/{len(text)}.wav")
+    
+    mock_services["llm"].generate_stream = generate_stream
+    mock_services["tts"].generate = AsyncMock(side_effect=generate)
+    with patch("src.chat_pipeline.PerformanceMetrics") as mock_metrics:
+        response = test_client.post("/chat/pipelined", json={"content": "Hello", "role": "user"})
+    
+    assert response.status_code == 200
+    body = response.json()
+    assert body["text"] == "The first sentence is here. The second one follows later."
+    assert body["audio_urls"] == ["/audio/27.wav", "/audio/29.wav"]
+    assert body["audio_url"] == "/audio/27.wav"
+    assert body["error"] is None
+    assert 0 < body["time_to_first_audio"] < 0.15
+    assert events.index("tts") < events.index("llm done")
+    assert [call.args[0] for call in mock_services["tts"].generate.call_args_list] == [
+        "The first sentence is here.",
+        "The second one follows later.",
+    ]
+    category, value, _ = mock_metrics.return_value.record_metric.call_args.args
+    assert category == "chat_time_to_first_audio"
+    assert value == body["time_to_first_audio"]
+
+def test_chat_pipelined_llm_error(test_client, mock_services):
+    """Test that an LLM error stops the pipeline without synthesising anything."""
+    async def generate_stream(prompt, session_id=None):
+        yield StreamError("Error: HTTP 500")
+    
+    mock_services["llm"].generate_stream = generate_stream
+    mock_services["tts"].generate = AsyncMock()
+    response = test_client.post("/chat/pipelined", json={"content": "Hello", "role": "user"})
+    
+    assert response.status_code == 200
+    assert response.json()["error"] == "HTTP 500"
+    assert response.json()["audio_urls"] == []
+    mock_services["tts"].generate.assert_not_called()
+
+def test_chat_stream_emits_server_sent_events(test_client, mock_services):
+    """Test that /chat/stream streams moderation, tokens, audio and a summary as SSE."""
+    async def generate_stream(prompt, session_id=None):
+        for token in ["Hello", " there."]:
+            yield token
+    
+    mock_services["llm"].generate_stream = generate_stream
+    mock_services["tts"].generate = AsyncMock(return_value=TTSResponse(audio_url="/audio/hello.wav"))
+    with test_client.stream("POST", "/chat/stream", json={"content": "Hello", "role": "user"}) as response:
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/event-stream")
+        body = "".join(response.iter_text())
+    
+    messages = [message for message in body.split("\n\n") if message]
+    events = [message.split("\n")[0].removeprefix("event: ") for message in messages]
+    assert events == ["moderation", "token", "token", "audio", "summary"]
+    summary = json.loads(messages[-1].split("data: ", 1)[1])
+    assert summary["text"] == "Hello there."
+    assert summary["audio_urls"] == ["/audio/hello.wav"]
+
+@pytest.fixture
+def voice_services(mock_services, tmp_path):
+    """Services for WebSocket voice sessions, writing audio to a temporary directory."""
+    mock_services["llm"].for_model.return_value = mock_services["llm"]
+    mock_services["llm"].sessions = SessionContextStore()
+    mock_services["llm"].preload = AsyncMock(return_value=True)
+    
+    async def generate(text, output_path=None, voice=None):
+        (tmp_path / "segment.wav").write_bytes(b"\x01" * 40000)
+        return TTSResponse(audio_url="/audio/segment.wav")
+    
+    mock_services["tts"].generate = AsyncMock(side_effect=generate)
+    test_config = Config(tts=TTSConfig(audio_dir=str(tmp_path)))
+    with patch("src.main.config", test_config):
+        yield mock_services
+
+def test_voice_session_streams_deltas_and_audio_frames(test_client, voice_services):
+    """Test that a voice turn streams text deltas and the audio as binary frames."""
+    async def generate_stream(prompt, session_id=None):
+        for token in ["Hello", " there."]:
+            yield token
+    
+    voice_services["llm"].generate_stream = generate_stream
+    with patch("src.voice_session.PerformanceMetrics") as mock_metrics:
+        with test_client.websocket_connect("/ws/voice") as websocket:
+            session = websocket.receive_json()
+            assert session["type"] == "session"
+            assert session["model"] == "phi"
+            websocket.send_json({"type": "message", "content": "Hi"})
+            
+            received = []
+            while True:
+                message = websocket.receive()
+                if "bytes" in message and message["bytes"] is not None:
+                    received.append(len(message["bytes"]))
+                    continue
+                received.append(json.loads(message["text"]))
+                if received[-1]["type"] == "done":
+                    break
+    
+    types = [item if isinstance(item, int) else item["type"] for item in received]
+    assert types == ["moderation", "delta", "delta", "audio_start", 16384, 16384, 7232, "audio_end", "done"]
+    assert received[3]["bytes"] == 40000
+    assert received[-1]["text"] == "Hello there."
+    voice_services["tts"].generate.assert_awaited_once_with("Hello there.", voice="alloy")
+    
+    metrics = {call.args[0]: call.args for call in mock_metrics.return_value.record_metric.call_args_list}
+    assert "ws_turn_latency" in metrics
+    assert metrics["ws_frames_per_second"][2]["frames"] == 3
+    assert 0 < metrics["ws_frames_per_second"][2]["active_seconds"] <= metrics["ws_frames_per_second"][2]["session_seconds"]
+
+def test_voice_session_barge_in_cancels_turn(test_client, voice_services):
+    """Test that interrupting a turn closes the LLM stream before any speech is produced."""
+    stream_closed = []
+    
+    async def generate_stream(prompt, session_id=None):
+        try:
+            for i in range(1000):
+                yield f" word{i}"
+                await asyncio.sleep(0.01)
+        finally:
+            stream_closed.append(True)
+    
+    voice_services["llm"].generate_stream = generate_stream
+    with test_client.websocket_connect("/ws/voice") as websocket:
+        websocket.receive_json()
+        websocket.send_json({"type": "message", "content": "Talk forever"})
+        assert websocket.receive_json()["type"] == "moderation"
+        assert websocket.receive_json()["type"] == "delta"
+        
+        websocket.send_json({"type": "interrupt"})
+        while (message := websocket.receive_json())["type"] == "delta":
+            pass
+        assert message == {"type": "interrupted", "turn": 1}
+        
+        websocket.send_json({"type": "config", "model": "mistral", "voice": "nova"})
+        assert websocket.receive_json() == {"type": "config", "model": "mistral", "voice": "nova"}
+    
+    assert stream_closed == [True]
+    voice_services["tts"].generate.assert_not_called()
+    voice_services["llm"].preload.assert_awaited_once_with(["mistral"])
+
+def test_voice_session_keeps_reading_while_model_warms(test_client, voice_services):
+    """Test that switching model warms it in the background instead of blocking the session."""
+    warmup_started = asyncio.Event()
+    
+    async def preload(models):
+        warmup_started.set()
+        await asyncio.sleep(60)
+    
+    async def generate_stream(prompt, session_id=None):
+        yield "Hi."
+    
+    voice_services["llm"].preload = AsyncMock(side_effect=preload)
+    voice_services["llm"].generate_stream = generate_stream
+    with test_client.websocket_connect("/ws/voice") as websocket:
+        websocket.receive_json()
+        websocket.send_json({"type": "config", "model": "mistral"})
+        assert websocket.receive_json()["model"] == "mistral"
+        websocket.send_json({"type": "message", "content": "Hello"})
+        assert websocket.receive_json()["type"] == "moderation"
+        assert websocket.receive_json() == {"type": "delta", "turn": 1, "text": "Hi."}
+    
+    voice_services["llm"].preload.assert_called_once_with(["mistral"])
+
+def test_voice_session_rejects_binary_frames(test_client, voice_services):
+    """Test that a binary frame is answered with an error and the session stays open."""
+    with test_client.websocket_connect("/ws/voice") as websocket:
+        websocket.receive_json()
+        websocket.send_bytes(b"\x00\x01")
+        assert websocket.receive_json() == {"type": "error", "error": "Messages must be JSON text, not binary"}
+        
+        websocket.send_json({"type": "config", "voice": "nova"})
+        assert websocket.receive_json()["voice"] == "nova"
+
+def test_voice_session_rejects_invalid_json(test_client, voice_services):
+    """Test that a frame that is not JSON is answered with an error and the session stays open."""
+    with test_client.websocket_connect("/ws/voice") as websocket:
+        websocket.receive_json()
+        websocket.send_text("not json")
+        assert websocket.receive_json() == {"type": "error", "error": "Messages must be JSON"}
+        
+        websocket.send_json({"type": "config", "voice": "nova"})
+        assert websocket.receive_json()["voice"] == "nova"
+
+@pytest.mark.parametrize("payload", ['"hi"', "[1]", "3"])
+def test_voice_session_rejects_non_object_json(test_client, voice_services, payload):
+    """Test that JSON other than an object is answered with an error and the session stays open."""
+    with test_client.websocket_connect("/ws/voice") as websocket:
+        websocket.receive_json()
+        websocket.send_text(payload)
+        assert websocket.receive_json() == {"type": "error", "error": "Messages must be JSON objects"}
+        
+        websocket.send_json({"type": "config", "voice": "nova"})
+        assert websocket.receive_json()["voice"] == "nova"
+
+class SlowModerator:
+    """Local stand-in for the moderation API that answers after a delay."""
+    
+    def __init__(self, is_safe, delay):
+        self.is_safe = is_safe
+        self.delay = delay
+    
+    async def moderate(self, text):
+        await asyncio.sleep(self.delay)
+        return ModerationResult(is_safe=self.is_safe, flagged_categories={})
+
+@pytest.fixture
+def speculative_llm(mock_services, make_llm_client, fake_ollama):
+    """LLM client talking to the fake Ollama server, with speculative moderation enabled."""
+    client = make_llm_client(base_url=fake_ollama.url)
+    test_config = Config(moderation=ModerationConfig(speculative=True))
+    with patch("src.main.config", test_config), patch("src.main.llm_client", client):
+        yield client
+
+@pytest.mark.asyncio
+async def test_speculative_moderation_overlaps_generation(speculative_llm, mock_services, fake_ollama):
+    """Test that generation runs while moderation is pending and the reply waits for it."""
+    fake_ollama.tokens = ["One", " two", " three", " four", " five."]
+    fake_ollama.delay = 0.05
+    
+    start_time = time.perf_counter()
+    with patch("src.main.moderator", SlowModerator(is_safe=True, delay=0.25)), \
+         patch("src.main.PerformanceMetrics") as mock_metrics:
+        response = await run_chat(Message(content="Count to five"), {"stage": "moderation"})
+    elapsed = time.perf_counter() - start_time
+    await speculative_llm.aclose()
+    
+    assert response.text == "One two three four five."
+    # Sequentially this would take the 0.25s moderation plus the 0.25s stream
+    assert 0.25 <= elapsed < 0.45
+    category, saved, _ = mock_metrics.return_value.record_metric.call_args.args
+    assert category == "chat_moderation_latency_saved"
+    assert saved >= 0.2
+    mock_services["tts"].generate.assert_called_once_with("One two three four five.")
+
+@pytest.mark.asyncio
+async def test_speculative_moderation_cancels_flagged_generation(speculative_llm, mock_services, fake_ollama):
+    """Test that flagged input cancels the running generation and nothing is released."""
+    fake_ollama.tokens = [f" token{i}" for i in range(50)]
+    fake_ollama.delay = 0.02
+    
+    with patch("src.main.moderator", SlowModerator(is_safe=False, delay=0.2)):
+        response = await run_chat(Message(content="Something flagged"), {"stage": "moderation"})
+    # Give the server a moment to notice the closed connection
+    await asyncio.sleep(0.1)
+    await speculative_llm.aclose()
+    
+    assert response.text == "I apologize, but I cannot process that content."
+    assert response.error == "Content moderation failed"
+    assert 0 < fake_ollama.tokens_sent < len(fake_ollama.tokens)
+    assert fake_ollama.completed_streams == 0
+    mock_services["tts"].generate.assert_not_called()
+
+@pytest.fixture
+def audio_dir(tmp_path):
+    """Serve audio from a temporary directory."""
+    with patch("src.main.config", Config(tts=TTSConfig(audio_dir=str(tmp_path)))):
+        yield tmp_path
+
+def test_audio_serves_hashed_file(test_client, audio_dir):
+    """Test that audio with hashed names is served with validators and long-lived caching."""
+    name = audio_name("Hello", "alloy", "csm-1b")
+    (audio_dir / name).write_bytes(bytes(range(256)) * 4)
+    
+    response = test_client.get(f"/audio/{name}")
+    
+    assert response.status_code == 200
+    assert response.content == bytes(range(256)) * 4
+    assert response.headers["accept-ranges"] == "bytes"
+    assert response.headers["cache-control"] == "public, max-age=31536000, immutable"
+    assert "etag" in response.headers
+    assert "last-modified" in response.headers
+
+def test_audio_supports_range_requests(test_client, audio_dir):
+    """Test that a byte range returns only that part of the file."""
+    (audio_dir / "segment.wav").write_bytes(bytes(range(256)))
+    
+    response = test_client.get("/audio/segment.wav", headers={"Range": "bytes=16-31"})
+    
+    assert response.status_code == 206
+    assert response.content == bytes(range(16, 32))
+    assert response.headers["content-range"] == "bytes 16-31/256"
+    # Names that are not hashed may be rewritten, so clients must revalidate
+    assert response.headers["cache-control"] == "no-cache"
+
+def test_audio_conditional_requests(test_client, audio_dir):
+    """Test that cached copies are revalidated with 304 Not Modified."""
+    name = audio_name("Hello", "alloy", "csm-1b")
+    (audio_dir / name).write_bytes(b"audio")
+    first = test_client.get(f"/audio/{name}")
+    
+    by_etag = test_client.get(f"/audio/{name}", headers={"If-None-Match": first.headers["etag"]})
+    by_date = test_client.get(f"/audio/{name}", headers={"If-Modified-Since": first.headers["last-modified"]})
+    changed = test_client.get(f"/audio/{name}", headers={"If-None-Match": '"stale"'})
+    
+    assert by_etag.status_code == 304
+    assert by_etag.content == b""
+    assert by_etag.headers["etag"] == first.headers["etag"]
+    assert by_date.status_code == 304
+    assert changed.status_code == 200
+
+def test_audio_rejects_missing_and_unsafe_names(test_client, audio_dir):
+    """Test that only existing audio files inside the audio directory are served."""
+    (audio_dir.parent / "secret.wav").write_bytes(b"secret")
+    
+    assert test_client.get("/audio/missing.wav").status_code == 404
+    assert test_client.get("/audio/..%2Fsecret.wav").status_code == 404
+    assert test_client.get("/audio/notes.txt").status_code == 404
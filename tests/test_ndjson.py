@@ -0,0 +1,56 @@
+"""Tests for the incremental NDJSON decoder."""
+
+import json
+from unittest.mock import patch
+import pytest
+from src import ndjson
+from src.ndjson import NDJSONDecoder, aiter_ndjson
+
+def test_decoder_handles_lines_split_across_chunks():
+    """Test that lines split at arbitrary byte boundaries are reassembled."""
+    payload = b'{"response": "Hel"}\n{"response": "lo"}\n{"done": true}\n'
+    for size in range(1, len(payload) + 1):
+        decoder = NDJSONDecoder()
+        values = []
+        for start in range(0, len(payload), size):
+            values.extend(decoder.feed(payload[start:start + size]))
+        values.extend(decoder.close())
+        assert values == [{"response": "Hel"}, {"response": "lo"}, {"done": True}]
+
+def test_decoder_splits_multibyte_characters():
+    """Test that UTF-8 sequences split between chunks decode correctly."""
+    payload = json.dumps({"response": "café ☕"}, ensure_ascii=False).encode() + b"\n"
+    decoder = NDJSONDecoder()
+    values = decoder.feed(payload[:16]) + decoder.feed(payload[16:])
+    assert values == [{"response": "café ☕"}]
+
+def test_decoder_skips_blank_and_invalid_lines():
+    """Test that malformed lines are skipped and counted."""
+    decoder = NDJSONDecoder()
+    values = decoder.feed(b'\n\r\nnot json\n{"a": 1}\r\n')
+    assert values == [{"a": 1}]
+    assert decoder.errors == 1
+
+def test_decoder_flushes_unterminated_line():
+    """Test that a final line without a newline is decoded on close."""
+    decoder = NDJSONDecoder()
+    assert decoder.feed(b'{"done": true}') == []
+    assert decoder.close() == [{"done": True}]
+    assert decoder.close() == []
+
+def test_decoder_without_orjson():
+    """Test the standard library fallback."""
+    with patch.object(ndjson, "ORJSON_AVAILABLE", False):
+        decoder = NDJSONDecoder()
+        assert decoder.feed(b'{"a": 1}\n{"b"') == [{"a": 1}]
+        assert decoder.feed(b': 2}\n') == [{"b": 2}]
+
+@pytest.mark.asyncio
+async def test_aiter_ndjson():
+    """Test decoding an async byte stream."""
+    async def chunks():
+        yield b'{"response": "a"}\n{"resp'
+        yield b'onse": "b"}\n{"done": true}'
+    
+    values = [value async for value in aiter_ndjson(chunks())]
+    assert values == [{"response": "a"}, {"response": "b"}, {"done": True}]
@@ -0,0 +1,69 @@
+import asyncio
+import pytest
+from unittest.mock import patch
+from src.config import LLMConfig, ResidencyConfig
+from src.residency import ModelResidency
+
+def test_residency_from_config_defaults_to_current_model():
+    """Test that the configured model is preloaded when no preload list is set."""
+    residency = ModelResidency.from_config(LLMConfig(model="phi"))
+    assert residency.preload_models == ["phi"]
+    
+    residency = ModelResidency.from_config(
+        LLMConfig(model="phi", residency=ResidencyConfig(preload_models=["phi", "mistral"], keep_alive=60))
+    )
+    assert residency.preload_models == ["phi", "mistral"]
+    assert residency.keep_alive == 60
+
+def test_residency_expires_after_keep_alive():
+    """Test that a model turns cold once its keep-alive has passed."""
+    residency = ModelResidency(keep_alive=10)
+    with patch("src.residency.time.monotonic", return_value=100.0):
+        residency.mark_used("http://a", "phi")
+    
+    with patch("src.residency.time.monotonic", return_value=105.0):
+        assert residency.is_hot("http://a", "phi")
+        assert not residency.is_hot("http://b", "phi")
+        assert residency.hot_models() == {"http://a": ["phi"]}
+    with patch("src.residency.time.monotonic", return_value=111.0):
+        assert not residency.is_hot("http://a", "phi")
+        assert residency.hot_models() == {}
+
+def test_residency_negative_keep_alive_never_expires():
+    """Test that a negative keep-alive keeps models hot indefinitely."""
+    residency = ModelResidency(keep_alive=-1)
+    with patch("src.residency.time.monotonic", return_value=0.0):
+        residency.mark_used("http://a", "phi")
+    with patch("src.residency.time.monotonic", return_value=1e9):
+        assert residency.is_hot("http://a", "phi")
+
+@pytest.mark.asyncio
+async def test_residency_ensure_warms_cold_hosts_once():
+    """Test that concurrent ensure calls share one warm-up per host and skip hot hosts."""
+    residency = ModelResidency()
+    residency.mark_used("http://a", "phi")
+    warmed = []
+    
+    async def warm(url, model):
+        warmed.append((url, model))
+        await asyncio.sleep(0.05)
+    
+    results = await asyncio.gather(
+        residency.ensure("phi", ["http://a", "http://b"], warm),
+        residency.ensure("phi", ["http://a", "http://b"], warm)
+    )
+    
+    assert results == [True, True]
+    assert warmed == [("http://b", "phi")]
+    assert residency.is_hot("http://b", "phi")
+
+@pytest.mark.asyncio
+async def test_residency_ensure_reports_failed_warmup():
+    """Test that a failed warm-up leaves the model cold without raising."""
+    residency = ModelResidency()
+    
+    async def warm(url, model):
+        raise ConnectionError("host down")
+    
+    assert await residency.ensure("phi", ["http://a"], warm) is False
+    assert not residency.is_hot("http://a", "phi")
@@ -0,0 +1,52 @@
+"""Tests for the retry and hedging policies."""
+
+import random
+import pytest
+from src.retry import HedgePolicy, RetryBudget, RetryPolicy
+
+def test_retry_budget_limits_retries():
+    """Test that retries are capped to a fraction of requests."""
+    budget = RetryBudget(ratio=0.5, min_tokens=1, max_tokens=10)
+    assert budget.withdraw()
+    assert not budget.withdraw()
+    
+    budget.deposit()
+    assert not budget.withdraw()
+    budget.deposit()
+    assert budget.withdraw()
+    
+    for _ in range(100):
+        budget.deposit()
+    assert budget.tokens == 10
+
+def test_backoff_is_exponential_with_full_jitter():
+    """Test that backoff grows exponentially up to the cap and is jittered."""
+    policy = RetryPolicy(base_delay=0.1, max_delay=1.0, rng=random.Random(0))
+    for attempt, cap in [(1, 0.1), (2, 0.2), (3, 0.4), (4, 0.8), (5, 1.0), (10, 1.0)]:
+        delays = [policy.backoff(attempt) for _ in range(50)]
+        assert all(0 <= delay <= cap for delay in delays)
+        assert len(set(delays)) > 1
+
+def test_allow_retry_respects_attempts_and_budget():
+    """Test that retries stop after max_attempts or when the budget runs out."""
+    policy = RetryPolicy(max_attempts=3, budget=RetryBudget(min_tokens=10))
+    assert policy.allow_retry(1)
+    assert policy.allow_retry(2)
+    assert not policy.allow_retry(3)
+    
+    policy = RetryPolicy(max_attempts=3, budget=RetryBudget(min_tokens=0))
+    assert not policy.allow_retry(1)
+
+def test_hedge_delay_uses_percentile():
+    """Test that the hedge delay follows the observed time to first token."""
+    policy = HedgePolicy(percentile=95, min_delay=0.05, initial_delay=1.0, min_samples=20)
+    assert policy.delay() == 1.0
+    
+    for i in range(1, 101):
+        policy.observe(i / 100)
+    assert policy.delay() == pytest.approx(0.95, abs=0.01)
+    
+    fast = HedgePolicy(min_delay=0.05, min_samples=1)
+    for _ in range(10):
+        fast.observe(0.001)
+    assert fast.delay() == 0.05
@@ -0,0 +1,142 @@
+import pytest
+from src.config import TTSConfig
+from src.llm import StreamError
+from src.segmenter import SentenceSegmenter, aiter_segments
+from src.tts import TTSClient, TTSResponse
+
+def segment(text, pieces=None, **kwargs):
+    """Feed text to a segmenter in pieces and collect every segment."""
+    segmenter = SentenceSegmenter(**kwargs)
+    segments = []
+    for piece in pieces or list(text):
+        segments.extend(segmenter.feed(piece))
+    return segments + segmenter.close()
+
+def test_segmenter_splits_sentences():
+    """Test that complete sentences become separate segments."""
+    text = "The weather is lovely today. Shall we go for a long walk? I would really enjoy that!"
+    assert segment(text, first_segment_fast=False) == [
+        "The weather is lovely today.",
+        "Shall we go for a long walk?",
+        "I would really enjoy that!",
+    ]
+
+def test_segmenter_waits_for_the_next_word():
+    """Test that a full stop is not a boundary until the following word arrives."""
+    segmenter = SentenceSegmenter(min_chars=0, first_segment_fast=False)
+    assert segmenter.feed("Pi is roughly 3.") == []
+    assert segmenter.feed("14 and e is about 2.") == []
+    assert segmenter.feed("72. ") == []
+    assert segmenter.feed("Both are irrational.") == ["Pi is roughly 3.14 and e is about 2.72."]
+    assert segmenter.close() == ["Both are irrational."]
+
+def test_segmenter_keeps_abbreviations_and_initials():
+    """Test that abbreviations, initials and lowercase continuations do not end a sentence."""
+    text = "Dr. Smith met J. R. Tolkien at 5 p.m. on Friday, e.g. at the pub. They talked for hours."
+    assert segment(text, min_chars=0, first_segment_fast=False) == [
+        "Dr. Smith met J. R. Tolkien at 5 p.m. on Friday, e.g. at the pub.",
+        "They talked for hours.",
+    ]
+
+def test_segmenter_keeps_closing_quotes():
+    """Test that closing quotes stay with the sentence they end."""
+    text = 'She said "Stop right there." Then she left. "Why?" he asked quietly.'
+    assert segment(text, min_chars=0, first_segment_fast=False) == [
+        'She said "Stop right there."',
+        "Then she left.",
+        '"Why?" he asked quietly.',
+    ]
+
+def test_segmenter_joins_short_sentences():
+    """Test that sentences below the minimum length are joined with the next one."""
+    text = "Hi! Yes. This sentence is long enough on its own. Ok."
+    assert segment(text, min_chars=20, first_segment_fast=False) == [
+        "Hi! Yes. This sentence is long enough on its own.",
+        "Ok.",
+    ]
+
+def test_segmenter_splits_long_text_at_clauses():
+    """Test that text without a sentence end within the maximum is split at a clause or word."""
+    text = "We packed apples, pears, plums and cherries; then we walked all the way home without stopping once"
+    segments = segment(text, min_chars=0, max_chars=40, first_segment_fast=False)
+    
+    assert all(len(part) <= 40 for part in segments)
+    assert segments[0] == "We packed apples, pears,"
+    assert " ".join(segments) == text
+
+def test_segmenter_first_segment_fast():
+    """Test that the first segment may end at a clause while later ones wait for sentences."""
+    text = "Well, that is a great question, and the answer is quite long. After that, we continue normally."
+    assert segment(text, min_chars=0, first_segment_min_chars=4) == [
+        "Well,",
+        "that is a great question, and the answer is quite long.",
+        "After that, we continue normally.",
+    ]
+
+def test_segmenter_from_config():
+    """Test that segment lengths come from the TTS configuration."""
+    segmenter = SentenceSegmenter.from_config(TTSConfig(segment_min_chars=5, segment_max_chars=50, first_segment_fast=False))
+    assert segmenter.min_chars == 5
+    assert segmenter.max_chars == 50
+    assert segmenter.first_segment_fast is False
+    
+    with pytest.raises(ValueError):
+        SentenceSegmenter(min_chars=100, max_chars=50)
+
+@pytest.mark.asyncio
+async def test_segments_feed_tts():
+    """Test that streamed tokens are segmented and synthesised one segment at a time."""
+    async def tokens():
+        for token in ["Hello", " there", ".", " How", " are", " you", " today", "?"]:
+            yield token
+    
+    class RecordingTTS(TTSClient):
+        def __init__(self):
+            self.texts = []
+        
+        async def generate(self, text, output_path=None):
+            self.texts.append(text)
+            return TTSResponse(audio_url=f"/audio/{len(self.texts)}.wav")
+    
+    tts = RecordingTTS()
+    segmenter = SentenceSegmenter(min_chars=0, first_segment_fast=False)
+    responses = [response async for response in tts.generate_segments(aiter_segments(tokens(), segmenter))]
+    
+    assert tts.texts == ["Hello there.", "How are you today?"]
+    assert [response.audio_url for response in responses] == ["/audio/1.wav", "/audio/2.wav"]
+
+@pytest.mark.asyncio
+async def test_segments_stop_on_stream_error():
+    """Test that a stream error ends the segments and reaches TTS as an error instead of speech."""
+    closed = []
+    
+    async def tokens():
+        try:
+            for token in ["Hello", " there", ".", " How", " are"]:
+                yield token
+            yield StreamError("Error: Request timed out")
+            yield " never read."
+        finally:
+            closed.append(True)
+    
+    segmenter = SentenceSegmenter(min_chars=0, first_segment_fast=False)
+    segments = [segment async for segment in aiter_segments(tokens(), segmenter)]
+    assert segments == ["Hello there.", "Error: Request timed out"]
+    assert isinstance(segments[-1], StreamError)
+    assert closed == [True]
+    
+    class RecordingTTS(TTSClient):
+        def __init__(self):
+            self.texts = []
+        
+        async def generate(self, text, output_path=None):
+            self.texts.append(text)
+            return TTSResponse(audio_url=f"/audio/{len(self.texts)}.wav")
+    
+    tts = RecordingTTS()
+    segmenter = SentenceSegmenter(min_chars=0, first_segment_fast=False)
+    responses = [response async for response in tts.generate_segments(aiter_segments(tokens(), segmenter))]
+    
+    # The unfinished "How are" is dropped rather than spoken
+    assert tts.texts == ["Hello there."]
+    assert [response.error for response in responses] == [None, "Request timed out"]
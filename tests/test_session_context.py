@@ -0,0 +1,90 @@
+"""Tests for per-session Ollama context storage."""
+
+from src.session_context import SessionContextStore
+
+def test_update_and_get_context():
+    """Test that the latest context of a session is returned."""
+    store = SessionContextStore()
+    assert store.get_context("a") is None
+    
+    store.update("a", "Hi", "Hello!", [1, 2, 3])
+    store.update("a", "How are you?", "Fine.", [1, 2, 3, 4, 5])
+    
+    assert store.get_context("a") == [1, 2, 3, 4, 5]
+    assert store.history("a") == [("Hi", "Hello!"), ("How are you?", "Fine.")]
+    assert store.token_count == 5
+
+def test_session_budget_evicts_least_recently_used():
+    """Test that the least recently used session is forgotten first."""
+    store = SessionContextStore(max_sessions=2)
+    store.update("a", "p", "r", [1])
+    store.update("b", "p", "r", [2])
+    store.get_context("a")  # Mark a as recently used
+    store.update("c", "p", "r", [3])
+    
+    assert len(store) == 2
+    assert store.get_context("b") is None
+    assert store.history("b") == []
+    assert store.get_context("a") == [1]
+    assert store.evictions == 1
+    assert store.token_count == 2
+
+def test_token_budget_drops_context_but_keeps_turns():
+    """Test that over the token budget only contexts are dropped."""
+    store = SessionContextStore(max_tokens=5)
+    store.update("a", "Hi", "Hello!", [1, 2, 3])
+    store.update("b", "Hey", "Hi there.", [4, 5, 6])
+    
+    assert store.get_context("a") is None
+    assert store.history("a") == [("Hi", "Hello!")]
+    assert store.get_context("b") == [4, 5, 6]
+    assert store.token_count == 3
+
+def test_build_prompt_falls_back_to_history():
+    """Test that the full prompt contains the recent turns."""
+    store = SessionContextStore(max_turns=2)
+    assert store.build_prompt("a", "Hi") == "Hi"
+    
+    store.update("a", "One", "1", None)
+    store.update("a", "Two", "2", None)
+    store.update("a", "Three", "3", None)
+    
+    assert store.build_prompt("a", "Four") == (
+        "User: Two\nAssistant: 2\nUser: Three\nAssistant: 3\nUser: Four\nAssistant:"
+    )
+
+def test_drop_and_clear():
+    """Test forgetting sessions."""
+    store = SessionContextStore()
+    store.update("a", "p", "r", [1, 2])
+    store.update("b", "p", "r", [3])
+    
+    store.drop("a")
+    assert store.get_context("a") is None
+    assert store.token_count == 1
+    
+    store.clear()
+    assert len(store) == 0
+    assert store.token_count == 0
+
+def test_drop_context_keeps_turns():
+    """Test that dropping a context keeps the session's history for prompt replay."""
+    store = SessionContextStore()
+    store.update("a", "Hi", "Hello!", [1, 2, 3])
+    
+    store.drop_context("a")
+    
+    assert store.get_context("a") is None
+    assert store.history("a") == [("Hi", "Hello!")]
+    assert store.token_count == 0
+
+def test_context_from_another_model_is_dropped():
+    """Test that a context is only returned to the model that produced it."""
+    store = SessionContextStore()
+    store.update("a", "Hi", "Hello!", [1, 2, 3], model="phi")
+    
+    assert store.get_context("a", "phi") == [1, 2, 3]
+    assert store.get_context("a", "mistral") is None
+    assert store.get_context("a", "phi") is None
+    assert store.history("a") == [("Hi", "Hello!")]
+    assert store.token_count == 0
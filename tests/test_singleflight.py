@@ -0,0 +1,192 @@
+"""Tests for request coalescing."""
+
+import asyncio
+import pytest
+from src.singleflight import SingleFlight
+
+@pytest.mark.asyncio
+async def test_concurrent_calls_run_once():
+    """Test that concurrent calls with the same key share one execution."""
+    calls = 0
+    
+    async def work():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        return "result"
+    
+    flight = SingleFlight()
+    results = await asyncio.gather(*(flight.do("key", work) for _ in range(5)))
+    
+    assert results == ["result"] * 5
+    assert calls == 1
+    assert flight.coalesced == 4
+    assert flight.in_flight == 0
+
+@pytest.mark.asyncio
+async def test_different_keys_run_separately():
+    """Test that calls with different keys are not coalesced."""
+    calls = []
+    
+    async def work(key):
+        calls.append(key)
+        await asyncio.sleep(0.01)
+        return key
+    
+    flight = SingleFlight()
+    results = await asyncio.gather(flight.do("a", lambda: work("a")), flight.do("b", lambda: work("b")))
+    
+    assert results == ["a", "b"]
+    assert sorted(calls) == ["a", "b"]
+    assert flight.coalesced == 0
+
+@pytest.mark.asyncio
+async def test_on_coalesced_callback():
+    """Test that the callback is told about every caller that joined."""
+    joined = []
+    flight = SingleFlight(on_coalesced=joined.append)
+    
+    async def work():
+        await asyncio.sleep(0.01)
+    
+    await asyncio.gather(flight.do("key", work), flight.do("key", work), flight.do("key", work))
+    assert joined == ["key", "key"]
+
+@pytest.mark.asyncio
+async def test_exceptions_reach_every_caller():
+    """Test that a failing call fails all of its waiters."""
+    async def work():
+        await asyncio.sleep(0.01)
+        raise ValueError("boom")
+    
+    flight = SingleFlight()
+    results = await asyncio.gather(flight.do("key", work), flight.do("key", work), return_exceptions=True)
+    
+    assert all(isinstance(result, ValueError) for result in results)
+
+@pytest.mark.asyncio
+async def test_cancelling_leader_keeps_followers_running():
+    """Test that cancelling the first caller does not cancel the shared work."""
+    async def work():
+        await asyncio.sleep(0.05)
+        return "done"
+    
+    flight = SingleFlight()
+    leader = asyncio.create_task(flight.do("key", work))
+    await asyncio.sleep(0)
+    follower = asyncio.create_task(flight.do("key", work))
+    await asyncio.sleep(0)
+    
+    leader.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await leader
+    assert await follower == "done"
+
+@pytest.mark.asyncio
+async def test_cancelling_all_waiters_cancels_work():
+    """Test that the shared work is cancelled once nobody is waiting for it."""
+    started = asyncio.Event()
+    cancelled = asyncio.Event()
+    
+    async def work():
+        started.set()
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+    
+    flight = SingleFlight()
+    callers = [asyncio.create_task(flight.do("key", work)) for _ in range(2)]
+    await started.wait()
+    for caller in callers:
+        caller.cancel()
+    await asyncio.gather(*callers, return_exceptions=True)
+    
+    await asyncio.wait_for(cancelled.wait(), timeout=1)
+    assert flight.in_flight == 0
+
+@pytest.mark.asyncio
+async def test_stream_followers_replay_buffered_items():
+    """Test that a late subscriber receives items produced before it joined."""
+    calls = 0
+    
+    async def produce():
+        nonlocal calls
+        calls += 1
+        for item in ["a", "b", "c"]:
+            await asyncio.sleep(0.02)
+            yield item
+    
+    async def collect():
+        return [item async for item in flight.stream("key", produce)]
+    
+    flight = SingleFlight()
+    leader = asyncio.create_task(collect())
+    await asyncio.sleep(0.03)
+    follower = asyncio.create_task(collect())
+    
+    assert await leader == ["a", "b", "c"]
+    assert await follower == ["a", "b", "c"]
+    assert calls == 1
+    assert flight.coalesced == 1
+
+@pytest.mark.asyncio
+async def test_stream_stops_producer_when_consumers_leave():
+    """Test that the shared stream is cancelled when every consumer stops early."""
+    closed = asyncio.Event()
+    
+    async def produce():
+        try:
+            while True:
+                await asyncio.sleep(0.01)
+                yield "token"
+        finally:
+            closed.set()
+    
+    flight = SingleFlight()
+    stream = flight.stream("key", produce)
+    assert await stream.__anext__() == "token"
+    await stream.aclose()
+    
+    await asyncio.wait_for(closed.wait(), timeout=1)
+    assert flight.in_flight == 0
+
+@pytest.mark.asyncio
+async def test_stream_errors_reach_subscribers():
+    """Test that an error raised by the producer is re-raised to consumers."""
+    async def produce():
+        yield "partial"
+        raise ValueError("boom")
+    
+    flight = SingleFlight()
+    items = []
+    with pytest.raises(ValueError):
+        async for item in flight.stream("key", produce):
+            items.append(item)
+    assert items == ["partial"]
+
+@pytest.mark.asyncio
+async def test_stream_pauses_upstream_for_slow_subscriber():
+    """Test that the shared stream stops reading once a subscriber is a full buffer behind."""
+    pulled = 0
+    
+    async def produce():
+        nonlocal pulled
+        for i in range(100):
+            pulled += 1
+            yield i
+    
+    flight = SingleFlight(stream_buffer=4)
+    stream = flight.stream("key", produce)
+    assert await stream.__anext__() == 0
+    await asyncio.sleep(0.05)
+    assert pulled == 4
+    
+    # Consuming one item lets the producer read exactly one more
+    assert await stream.__anext__() == 1
+    await asyncio.sleep(0.05)
+    assert pulled == 5
+    
+    items = [0, 1] + [item async for item in stream]
+    assert items == list(range(100))
@@ -2,7 +2,8 @@ import pytest
 import torch
 import os
 from pathlib import Path
-from src.tts import TTSClient, TTSResponse
+from unittest.mock import patch
+from src.tts import HASHED_AUDIO_NAME, TTSClient, TTSResponse, audio_name
 from src.config import TTSConfig
 
 @pytest.fixture
@@ -86,3 +87,37 @@ async def test_tts_mps_device(test_tts_client):
         assert Path(response.audio_path).exists()
     else:
         pytest.skip("MPS not available")
+
+def test_audio_name_is_hashed_from_inputs():
+    """Test that audio names depend only on the text, voice and model."""
+    name = audio_name("Hello", "alloy", "csm-1b")
+    
+    assert HASHED_AUDIO_NAME.fullmatch(name)
+    assert name == audio_name("Hello", "alloy", "csm-1b")
+    assert name != audio_name("Hello", "nova", "csm-1b")
+    assert name != audio_name("Hello!", "alloy", "csm-1b")
+
+@pytest.mark.asyncio
+async def test_tts_reuses_existing_hashed_audio(tmp_path):
+    """Test that speech already on disk is never synthesised or rewritten again."""
+    client = TTSClient(TTSConfig(audio_dir=str(tmp_path)))
+    path = tmp_path / audio_name("Hello", "alloy", "csm-1b")
+    path.write_bytes(b"audio")
+    
+    with patch("src.tts.torchaudio.save") as save:
+        response = await client.generate("Hello")
+    
+    save.assert_not_called()
+    assert response.audio_path == str(path)
+    assert path.read_bytes() == b"audio"
+
+@pytest.mark.asyncio
+async def test_tts_failed_write_leaves_no_file(tmp_path):
+    """Test that audio is written to a temporary file and only moved into place once complete."""
+    client = TTSClient(TTSConfig(audio_dir=str(tmp_path)))
+    
+    with patch("src.tts.torchaudio.save", side_effect=RuntimeError("disk full")):
+        response = await client.generate("Hello")
+    
+    assert "disk full" in response.error
+    assert list(tmp_path.iterdir()) == []